@@ -0,0 +1,77 @@
+"""
+Admission control on estimated queue wait.
+Every admission_refresh_seconds each API process reads lane depths and recent completion counts
+(one pipelined round-trip) and keeps wait = depth / service rate per lane in memory, so /run pays
+nothing extra. Service rate is jobs finished per second over the last minute, as counted by the
+workers (api.queue.record_served). Above admission_max_wait_seconds an interactive job is either
+rejected with 503 + Retry-After or moved to the batch lane (admission_overload_action).
+"""
+import asyncio
+import logging
+import math
+import time
+
+from fastapi import HTTPException, status
+
+from api.config import settings
+from api.queue import BATCH_LANE, DEFAULT_LANE, QUEUE_LANES, SERVED_BUCKET_SECONDS, served_key, shared_redis
+
+logger = logging.getLogger(__name__)
+
+RATE_WINDOW_BUCKETS = 6  # Service rate over the last 6 complete buckets (60s)
+
+_estimates: dict[str, float] = {lane: 0.0 for lane in QUEUE_LANES}
+
+
+def estimated_wait(lane: str) -> float:
+    return _estimates.get(lane, 0.0)
+
+
+async def refresh_wait_estimates() -> None:
+    redis = shared_redis()
+    current = int(time.time()) // SERVED_BUCKET_SECONDS
+    buckets = range(current - RATE_WINDOW_BUCKETS, current)
+    pipe = redis.pipeline(transaction=False)
+    for lane, queue in QUEUE_LANES.items():
+        pipe.zcard(queue)
+        pipe.mget([served_key(lane, b) for b in buckets])
+    replies = await pipe.execute()
+    window = RATE_WINDOW_BUCKETS * SERVED_BUCKET_SECONDS
+    for i, lane in enumerate(QUEUE_LANES):
+        depth, served = replies[2 * i], replies[2 * i + 1]
+        finished = sum(int(n) for n in served if n)
+        # No recent completions (cold start, idle workers): assume the configured rate
+        rate = finished / window if finished else settings.admission_default_jobs_per_second
+        _estimates[lane] = depth / rate if depth else 0.0
+
+
+async def run_wait_estimator() -> None:
+    while True:
+        try:
+            await refresh_wait_estimates()
+        except Exception as e:
+            logger.warning("Wait estimate refresh failed: %s", e)
+        await asyncio.sleep(settings.admission_refresh_seconds)
+
+
+def choose_lane() -> tuple[str, float]:
+    """
+    Lane for a new job and its estimated queue wait in seconds.
+    Raises 503 with Retry-After when the interactive lane is over the SLO and shedding is "reject".
+    """
+    wait = estimated_wait(DEFAULT_LANE)
+    slo = settings.admission_max_wait_seconds
+    if not slo or wait <= slo:
+        return DEFAULT_LANE, wait
+    if settings.admission_overload_action == "batch":
+        return BATCH_LANE, estimated_wait(DEFAULT_LANE) + estimated_wait(BATCH_LANE)
+    retry_after = max(1, math.ceil(wait - slo))
+    raise HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail={
+            "message": f"Inference queue is overloaded (estimated wait {wait:.0f}s). Retry after {retry_after}s",
+            "estimated_wait_seconds": round(wait, 1),
+            "retry_after_seconds": retry_after,
+        },
+        headers={"Retry-After": str(retry_after)},
+    )
@@ -1,5 +1,8 @@
 """API key and password authentication."""
 import hashlib
+import json
+import logging
+from dataclasses import dataclass
 from typing import Annotated
 
 import bcrypt
@@ -8,9 +11,14 @@ from fastapi.security import APIKeyHeader
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from api.config import settings
 from api.db import get_db
 from api.models import APIKey, User
+from api.queue import shared_redis
 
+logger = logging.getLogger(__name__)
+
+API_KEY_CACHE_PREFIX = "auth:key:"
 
 api_key_header = APIKeyHeader(name="X-API-Key", auto_error=False)
 
@@ -30,6 +38,15 @@ def hash_api_key(key: str) -> str:
     return hashlib.sha256(key.encode()).hexdigest()
 
 
+async def user_for_api_key(db: AsyncSession, api_key: str) -> User | None:
+    """User owning an API key, or None."""
+    key_hash = hash_api_key(api_key.strip())
+    result = await db.execute(
+        select(User).join(APIKey, APIKey.user_id == User.id).where(APIKey.key_hash == key_hash)
+    )
+    return result.scalar_one_or_none()
+
+
 async def get_user_from_api_key(
     api_key: Annotated[str | None, Depends(api_key_header)],
     db: Annotated[AsyncSession, Depends(get_db)],
@@ -40,18 +57,12 @@ async def get_user_from_api_key(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Missing API key. Provide X-API-Key header.",
         )
-    key_hash = hash_api_key(api_key.strip())
-    result = await db.execute(
-        select(APIKey).where(APIKey.key_hash == key_hash)
-    )
-    api_key_row = result.scalar_one_or_none()
-    if not api_key_row:
+    user = await user_for_api_key(db, api_key)
+    if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid API key.",
         )
-    result = await db.execute(select(User).where(User.id == api_key_row.user_id))
-    user = result.scalar_one()
     return user
 
 
@@ -76,6 +87,61 @@ async def get_current_api_key(
     return api_key_row
 
 
+@dataclass(frozen=True)
+class KeyOwner:
+    """The parts of a User that hot read paths need (id for ownership, plan for rate limits)."""
+
+    id: str
+    plan: str
+
+
+def _key_cache_key(key_hash: str) -> str:
+    return API_KEY_CACHE_PREFIX + key_hash
+
+
+async def get_key_owner(
+    api_key: Annotated[str | None, Depends(api_key_header)],
+    db: Annotated[AsyncSession, Depends(get_db)],
+) -> KeyOwner:
+    """
+    Like get_user_from_api_key, but served from Redis for api_key_cache_ttl_seconds so polling
+    endpoints skip Postgres. Revoke and rotate evict the entry (see forget_api_key).
+    """
+    if not api_key or not api_key.strip():
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Missing API key. Provide X-API-Key header.",
+        )
+    cache_key = _key_cache_key(hash_api_key(api_key.strip()))
+    try:
+        raw = await shared_redis().get(cache_key)
+    except Exception as e:
+        logger.warning("API key cache read failed: %s", e)
+        raw = None
+    if raw is not None:
+        return KeyOwner(**json.loads(raw))
+    user = await user_for_api_key(db, api_key)
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid API key.",
+        )
+    owner = KeyOwner(id=str(user.id), plan=user.plan)
+    try:
+        await shared_redis().set(
+            cache_key, json.dumps({"id": owner.id, "plan": owner.plan}), ex=settings.api_key_cache_ttl_seconds
+        )
+    except Exception as e:
+        logger.warning("API key cache write failed: %s", e)
+    return owner
+
+
+async def forget_api_key(key_hash: str) -> None:
+    """Evict a revoked key from the cache behind get_key_owner (call after commit)."""
+    await shared_redis().delete(_key_cache_key(key_hash))
+
+
 # Type aliases for route dependencies
 CurrentUser = Annotated[User, Depends(get_user_from_api_key)]
 CurrentAPIKey = Annotated[APIKey, Depends(get_current_api_key)]
+CurrentKeyOwner = Annotated[KeyOwner, Depends(get_key_owner)]
@@ -0,0 +1,140 @@
+"""
+Bulk batch jobs: one uploaded JSONL file, many inference requests, one batch id.
+Each input line is {"input": ..., "custom_id": optional string}. On upload the file is validated
+and stored in MinIO as parts of batch_chunk_size lines (batches/{id}/input/part-NNNNN.jsonl).
+A batch has at most one queue message at a time, on the low-priority batch lane: the worker runs
+the next chunk as one inference call (one K8s Job or HTTP request per chunk, never per line),
+writes its output part, bumps the progress counters, bills the chunk as one UsageRecord
+(batch_id) and stages the next chunk in the outbox (orchestrator.batches).
+Output lines, in input order: {"line", "custom_id", "output", "tokens_used"} or {"line", "custom_id", "error"},
+where line is the request's 0-based position in the file (blank lines skipped).
+"""
+import json
+import logging
+from collections.abc import AsyncIterator
+
+from fastapi import HTTPException, status
+
+from api.config import settings
+from api.models import Batch
+from api.storage import delete_prefix, get_bytes, put_bytes
+
+logger = logging.getLogger(__name__)
+
+JSONL_CONTENT_TYPE = "application/x-ndjson"
+
+
+def part_object_name(batch_id: str, kind: str, chunk: int) -> str:
+    """Object name of a batch part: input / output, or pending / raw (exchanged with K8s inference pods)."""
+    return f"batches/{batch_id}/{kind}/part-{chunk:05d}.jsonl"
+
+
+def part_ref(batch_id: str, kind: str, chunk: int) -> str:
+    return f"{settings.minio_payload_bucket}/{part_object_name(batch_id, kind, chunk)}"
+
+
+def _invalid_line(line_no: int, problem: str) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        detail=f"Line {line_no}: {problem}",
+    )
+
+
+def parse_batch_line(raw: bytes, line_no: int) -> dict:
+    """Validate one input line; returns {"custom_id", "input"} with input normalized like /run's."""
+    try:
+        item = json.loads(raw)
+    except ValueError:
+        raise _invalid_line(line_no, "not valid JSON") from None
+    if not isinstance(item, dict) or "input" not in item:
+        raise _invalid_line(line_no, 'expected an object with an "input" field')
+    custom_id = item.get("custom_id")
+    if custom_id is not None and not isinstance(custom_id, str):
+        raise _invalid_line(line_no, "custom_id must be a string")
+    data = item["input"]
+    return {"custom_id": custom_id, "input": data if isinstance(data, dict) else {"data": data}}
+
+
+async def store_batch_input(batch_id: str, body: AsyncIterator[bytes], chunk_size: int) -> int:
+    """
+    Validate a streamed JSONL upload and store it as input parts, one part in memory at a time.
+    Returns the number of lines. Raises 413 over batch_max_bytes / batch_max_lines and 422 on a
+    bad or empty file, after deleting the parts already written.
+    """
+    pending: list[str] = []
+    chunk = 0
+    total = 0
+    size = 0
+    line_no = 0
+    buffer = b""
+
+    async def flush() -> None:
+        nonlocal chunk
+        data = ("\n".join(pending) + "\n").encode()
+        await put_bytes(
+            settings.minio_payload_bucket, part_object_name(batch_id, "input", chunk), data, JSONL_CONTENT_TYPE
+        )
+        chunk += 1
+        pending.clear()
+
+    async def add(raw: bytes) -> None:
+        nonlocal total, line_no
+        line_no += 1
+        if not raw.strip():
+            return
+        total += 1
+        if total > settings.batch_max_lines:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"Batch exceeds {settings.batch_max_lines} lines",
+            )
+        pending.append(json.dumps(parse_batch_line(raw, line_no)))
+        if len(pending) == chunk_size:
+            await flush()
+
+    try:
+        async for data in body:
+            size += len(data)
+            if size > settings.batch_max_bytes:
+                raise HTTPException(
+                    status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                    detail=f"Batch file exceeds {settings.batch_max_bytes} bytes",
+                )
+            *lines, buffer = (buffer + data).split(b"\n")
+            for raw in lines:
+                await add(raw)
+        await add(buffer)
+        if not total:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail="Batch file has no lines",
+            )
+        if pending:
+            await flush()
+    except BaseException:
+        if chunk:
+            try:
+                await delete_prefix(settings.minio_payload_bucket, f"batches/{batch_id}/")
+            except Exception as e:
+                logger.warning("Could not delete parts of rejected batch %s: %s", batch_id, e)
+        raise
+    return total
+
+
+async def read_batch_part(batch_id: str, kind: str, chunk: int) -> list[dict]:
+    """Lines of one stored part."""
+    data = await get_bytes(part_ref(batch_id, kind, chunk))
+    return [json.loads(line) for line in data.decode().splitlines() if line]
+
+
+async def write_batch_part(batch_id: str, kind: str, chunk: int, lines: list[dict]) -> str:
+    data = "".join(json.dumps(line) + "\n" for line in lines).encode()
+    return await put_bytes(
+        settings.minio_payload_bucket, part_object_name(batch_id, kind, chunk), data, JSONL_CONTENT_TYPE
+    )
+
+
+async def iter_batch_output(batch: Batch) -> AsyncIterator[bytes]:
+    """Output JSONL written so far: every finished part, in order."""
+    for chunk in range(batch.next_chunk):
+        yield await get_bytes(part_ref(batch.id, "output", chunk))
@@ -0,0 +1,130 @@
+"""
+Request coalescing: identical deterministic jobs in flight at the same time run inference once.
+Applies to deployments with config "coalesce" (defaults to the "result_cache" setting).
+The first job for a request fingerprint (see api.result_cache.request_fingerprint) becomes the
+leader; jobs popped while it runs are recorded as its followers and left QUEUED. When the leader
+finishes, followers are completed with its result (billed like cache hits), failed with it if its
+output was blocked, or requeued through the outbox after an infrastructure failure. If the leader
+dies, its lease expires and the outbox sweeper requeues the waiting followers.
+"""
+import logging
+from datetime import datetime, timezone
+
+from sqlalchemy import select
+
+from api.config import settings
+from api.db import async_session_maker
+from api.events import publish_job_events
+from api.metrics import quantlix_coalesced_jobs_total
+from api.models import Deployment, Job, JobOutbox, JobStatus
+from api.outbox import job_dispatch_payload
+from api.queue import release_in_flight, shared_redis
+from api.result_cache import cache_entry, complete_from_cache, is_deterministic, request_fingerprint
+from api.status_cache import cache_job_statuses
+from api.webhooks import queue_webhooks
+
+logger = logging.getLogger(__name__)
+
+COALESCE_PREFIX = "coalesce"
+
+# KEYS[1] = leader key, KEYS[2] = followers list; ARGV = job id, lease seconds
+# Returns "" when the caller leads, else the leader's job id (the caller was added as a follower).
+_JOIN_SCRIPT = """
+local leader = redis.call('GET', KEYS[1])
+if not leader then
+  redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+  return ''
+end
+if leader == ARGV[1] then
+  return ''
+end
+redis.call('RPUSH', KEYS[2], ARGV[1])
+redis.call('EXPIRE', KEYS[2], ARGV[2])
+return leader
+"""
+
+# KEYS[1] = leader key, KEYS[2] = followers list; ARGV = leader job id
+# Ends the leader's turn and returns its followers; later arrivals start a new group.
+_FINISH_SCRIPT = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+  return {}
+end
+local followers = redis.call('LRANGE', KEYS[2], 0, -1)
+redis.call('DEL', KEYS[1], KEYS[2])
+return followers
+"""
+
+_scripts: dict[str, object] = {}
+
+
+def _script(source: str):
+    if source not in _scripts:
+        _scripts[source] = shared_redis().register_script(source)
+    return _scripts[source]
+
+
+def coalescing_enabled(deployment: Deployment) -> bool:
+    cfg = deployment.config or {}
+    return bool(cfg.get("coalesce", cfg.get("result_cache")))
+
+
+def coalescing_group(deployment: Deployment, input_payload: dict) -> str | None:
+    """Group key for a job, or None if it must run on its own."""
+    if not coalescing_enabled(deployment) or not is_deterministic(input_payload):
+        return None
+    return f"{COALESCE_PREFIX}:{request_fingerprint(deployment, input_payload)}"
+
+
+async def join_or_lead(group: str, job_id: str, deployment_id: str) -> str | None:
+    """None if job_id leads the group (run it), else the leader's job id (leave the job QUEUED)."""
+    leader = await _script(_JOIN_SCRIPT)(
+        keys=[group, f"{group}:followers"], args=[job_id, settings.in_flight_lease_seconds]
+    )
+    role = "follower" if leader else "leader"
+    quantlix_coalesced_jobs_total.labels(deployment_id=deployment_id, role=role).inc()
+    return leader or None
+
+
+async def settle_followers(group: str, leader: Job, deployment: Deployment) -> int:
+    """End the leader's group and resolve its followers from the leader's outcome. Returns the count."""
+    follower_ids = list(dict.fromkeys(
+        await _script(_FINISH_SCRIPT)(keys=[group, f"{group}:followers"], args=[str(leader.id)])
+    ))
+    if not follower_ids:
+        return 0
+
+    released: list[Job] = []
+    async with async_session_maker() as db:
+        result = await db.execute(
+            select(Job)
+            .where(Job.id.in_(follower_ids), Job.status == JobStatus.QUEUED.value)
+            .with_for_update()
+        )
+        followers = result.scalars().all()
+        for job in followers:
+            if leader.status == JobStatus.COMPLETED.value:
+                await complete_from_cache(db, job, deployment, cache_entry(leader))
+            elif leader.policy_action == "block":
+                # Same input, same model: the output would be blocked again
+                job.status = JobStatus.FAILED.value
+                job.error_message = leader.error_message
+                job.policy_action = leader.policy_action
+                job.guardrail_blocked = leader.guardrail_blocked
+                job.guardrail_flags = leader.guardrail_flags
+                job.completed_at = datetime.now(timezone.utc)
+            else:
+                db.add(JobOutbox(job_id=job.id, payload=job_dispatch_payload(job)))
+                job.enqueued_at = datetime.now(timezone.utc)
+                continue
+            released.append(job)
+        await db.commit()
+
+    for job in released:
+        await release_in_flight(str(job.user_id), str(job.id))
+    await cache_job_statuses(released)
+    await publish_job_events(released)
+    await queue_webhooks(released, deployment)
+    logger.info(
+        "Coalesced %d follower(s) of job %s (%s)", len(followers), leader.id, leader.status
+    )
+    return len(followers)
@@ -1,4 +1,6 @@
 """Application configuration."""
+from typing import Literal
+
 from pydantic import ConfigDict
 from pydantic_settings import BaseSettings
 
@@ -20,6 +22,10 @@ class Settings(BaseSettings):
     minio_access_key: str = "minioadmin"
     minio_secret_key: str = "minioadmin"
     minio_bucket: str = "models"
+    minio_secure: bool = False
+    minio_archive_bucket: str = "archive"  # Expired jobs/usage_records partitions (gzip JSONL)
+    minio_payload_bucket: str = "payloads"  # Job inputs/outputs too large to keep inline
+    payload_inline_max_bytes: int = 16_384  # Larger payloads go to MinIO (jobs.input_ref / output_ref)
     jwt_secret: str = "dev-secret-change-me"
 
     # Email (Sweego). Set to False to disable all email until domain is verified.
@@ -42,6 +48,62 @@ class Settings(BaseSettings):
     usage_limit_tokens_per_month: int = 0
     usage_limit_compute_seconds_per_month: float = 0.0
 
+    # API rate limits per plan live in api.models.PLAN_RATE_LIMITS
+    in_flight_lease_seconds: int = 900  # Drop a job's in-flight slot if the worker never released it
+
+    # Job dispatch outbox (api.outbox)
+    outbox_batch_size: int = 500  # Outbox rows pushed to Redis per relay round-trip
+    outbox_poll_seconds: float = 1.0  # Relay wakes at least this often (other replicas' inserts)
+    queued_job_requeue_seconds: int = 300  # Sweeper re-enqueues QUEUED jobs not pushed for this long
+    rollout_stale_seconds: int = 1200  # Sweeper restarts a rollout DEPLOYING this long (> orchestrator rollout_timeout_seconds)
+    queue_default_deadline_seconds: int = 300  # Scheduling only: jobs without a deadline are ordered as if due this long after enqueue
+
+    # Load shedding on estimated queue wait (api.admission)
+    admission_max_wait_seconds: float = 0.0  # 0 = never shed; else the interactive queue-wait SLO
+    admission_overload_action: Literal["reject", "batch"] = "reject"  # Over the SLO: 503 + Retry-After, or queue on the batch lane
+    admission_default_jobs_per_second: float = 1.0  # Assumed service rate until workers report completions
+    admission_refresh_seconds: float = 1.0  # How often each API process re-reads queue depth and rates
+
+    # Idempotency-Key on POST /run and /deploy (api.idempotency)
+    idempotency_ttl_seconds: int = 86_400  # How long a successful response is replayed
+    idempotency_lock_seconds: int = 60  # In-progress lock; a crashed request frees its key after this
+
+    # Result cache for deterministic requests (api.result_cache; opt-in via deployment config)
+    result_cache_ttl_seconds: int = 3600  # Default; deployment config "result_cache_ttl" overrides
+    result_cache_max_entries: int = 10_000  # Per deployment; oldest entries are evicted first
+    result_cache_billing: Literal["full", "tokens", "none"] = "tokens"  # Cache hits bill: "full" (tokens + original compute), "tokens", or "none"
+
+    # Completion webhooks (api.webhooks)
+    webhook_max_attempts: int = 8  # Then the delivery is dropped
+    webhook_backoff_base_seconds: float = 2.0  # Retry n waits base * 2^(n-1), capped, +-20% jitter
+    webhook_backoff_max_seconds: float = 600.0
+    webhook_timeout_seconds: float = 10.0  # Per POST, including waiting for a pooled connection
+    webhook_max_connections: int = 100  # Dispatcher's HTTP connection pool (per API replica)
+    webhook_claim_batch: int = 200  # Deliveries leased per dispatcher round
+    webhook_lease_seconds: int = 60  # A claimed delivery is retried if its dispatcher dies
+    webhook_poll_seconds: float = 0.5  # Also how long completions can accumulate into one batch
+    # Webhook hosts must resolve to public addresses only; add cluster CIDRs that are not private ranges
+    webhook_blocked_networks: str = ""  # Comma-separated, e.g. "100.64.0.0/10,203.0.113.0/24"
+    webhook_allow_private_networks: bool = False  # Local dev only: allow loopback / private targets
+
+    # Job event feed (api.events, /ws/jobs)
+    ws_ticket_ttl_seconds: int = 60  # One-time browser tickets for opening the socket
+    ws_client_buffer: int = 256  # Events queued per socket; a slow client loses the oldest
+    ws_max_connections_per_user: int = 20  # Per API replica
+
+    # Bulk batch jobs (api.batches, /batches)
+    batch_chunk_size: int = 256  # Lines per part: one queue message, one inference call, one usage record
+    batch_max_lines: int = 100_000
+    batch_max_bytes: int = 256 * 1024 * 1024  # Uploaded JSONL
+
+    # Hot /status reads (api.status_cache)
+    status_cache_ttl_seconds: int = 3600  # Finished jobs' status documents kept in Redis
+    api_key_cache_ttl_seconds: int = 60  # Key -> user (id, plan); revoke/rotate evict immediately, plan changes lag up to this
+
+    # Partitioning & retention (jobs, usage_records: monthly partitions on created_at)
+    partition_premake_months: int = 3  # Create partitions this many months ahead
+    data_retention_days: int = 0  # 0 = keep forever; older partitions are archived to MinIO then dropped
+
     # CORS (comma-separated extra origins, e.g. for Vercel: https://quantlix.vercel.app)
     cors_origins: str = ""
 
@@ -0,0 +1,123 @@
+"""
+Job state events for /ws/jobs.
+Every state change (queued, running, completed, failed, cancelled) is PUBLISHed on one Redis
+channel by whoever made it: the API for queued / cache hits / cancels, the worker for the rest.
+Each API process holds a single subscription (JobEventHub.run) and fans events out to its own
+WebSocket clients by user id, so Redis sees one subscriber per replica, not per client.
+Delivery is best effort: clients that reconnect should re-read /jobs to catch up.
+"""
+import asyncio
+import json
+import logging
+import secrets
+from collections import defaultdict
+from collections.abc import Iterator
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from api.config import settings
+from api.models import Job
+from api.queue import shared_redis
+
+logger = logging.getLogger(__name__)
+
+JOB_EVENTS_CHANNEL = "events:jobs"
+TICKET_PREFIX = "ws:ticket:"
+
+
+def job_event(job: Job) -> dict:
+    """Event body sent to clients (routed by user_id, which is removed before sending)."""
+    return {
+        "user_id": str(job.user_id),
+        "job_id": str(job.id),
+        "deployment_id": str(job.deployment_id),
+        "status": job.status,
+        "at": datetime.now(timezone.utc).isoformat(),
+        "error_message": job.error_message,
+        "tokens_used": job.tokens_used,
+        "compute_seconds": job.compute_seconds,
+        "guardrail_blocked": job.guardrail_blocked,
+        "guardrail_flags": job.guardrail_flags,
+        "policy_action": job.policy_action,
+    }
+
+
+async def publish_job_events(jobs: list[Job]) -> None:
+    """Publish state changes after commit. Best effort: a Redis error is logged, not raised."""
+    if not jobs:
+        return
+    try:
+        pipe = shared_redis().pipeline(transaction=False)
+        for job in jobs:
+            pipe.publish(JOB_EVENTS_CHANNEL, json.dumps(job_event(job)))
+        await pipe.execute()
+    except Exception as e:
+        logger.warning("Could not publish job events: %s", e)
+
+
+async def publish_job_event(job: Job) -> None:
+    await publish_job_events([job])
+
+
+async def issue_ticket(user_id: str) -> str:
+    """One-time token for browsers, which cannot set X-API-Key on a WebSocket."""
+    ticket = secrets.token_urlsafe(32)
+    await shared_redis().set(TICKET_PREFIX + ticket, user_id, ex=settings.ws_ticket_ttl_seconds)
+    return ticket
+
+
+async def redeem_ticket(ticket: str) -> str | None:
+    """User id for a ticket, consuming it."""
+    return await shared_redis().getdel(TICKET_PREFIX + ticket)
+
+
+class JobEventHub:
+    """One Redis subscription per process, fanned out to local subscribers by user id."""
+
+    def __init__(self) -> None:
+        self._subscribers: dict[str, set[asyncio.Queue]] = defaultdict(set)
+
+    @contextmanager
+    def subscribe(self, user_id: str) -> Iterator[asyncio.Queue]:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=settings.ws_client_buffer)
+        self._subscribers[user_id].add(queue)
+        try:
+            yield queue
+        finally:
+            subscribers = self._subscribers[user_id]
+            subscribers.discard(queue)
+            if not subscribers:
+                del self._subscribers[user_id]
+
+    def connections(self, user_id: str) -> int:
+        return len(self._subscribers.get(user_id, ()))
+
+    def dispatch(self, raw: str) -> None:
+        event = json.loads(raw)
+        queues = self._subscribers.get(event.pop("user_id", None))
+        if not queues:
+            return
+        for queue in queues:
+            if queue.full():
+                queue.get_nowait()  # Slow client: drop its oldest event rather than block the hub
+            queue.put_nowait(event)
+
+    async def run(self) -> None:
+        """Subscribe and fan out until cancelled; resubscribes after Redis errors."""
+        while True:
+            pubsub = shared_redis().pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(JOB_EVENTS_CHANNEL)
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        self.dispatch(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Job event subscription failed: %s", e)
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.aclose()
+
+
+hub = JobEventHub()
@@ -12,7 +12,7 @@ DEFAULT_MAX_BLOCKS = 5
 DEFAULT_RETRY_AFTER_SECONDS = 60
 
 
-def _block_key(user_id: str, deployment_id: str) -> str:
+def block_key(user_id: str, deployment_id: str) -> str:
     return f"{BLOCK_KEY_PREFIX}:{user_id}:{deployment_id}"
 
 
@@ -25,6 +25,22 @@ class BlockRateResult:
     max_blocks: int = 0
 
 
+def evaluate_block_rate(
+    count: str | int | None,
+    ttl_seconds: int,
+    max_blocks: int | None = None,
+) -> BlockRateResult:
+    """Decide from an already-read block counter (value and TTL of block_key)."""
+    max_blocks = max_blocks or DEFAULT_MAX_BLOCKS
+    if count is None:
+        return BlockRateResult(True, 0, 0, max_blocks)
+    n = int(count)
+    if n >= max_blocks:
+        retry = max(ttl_seconds, DEFAULT_RETRY_AFTER_SECONDS) if ttl_seconds > 0 else DEFAULT_RETRY_AFTER_SECONDS
+        return BlockRateResult(False, retry, n, max_blocks)
+    return BlockRateResult(True, 0, n, max_blocks)
+
+
 async def check_block_rate_limit(
     user_id: str,
     deployment_id: str,
@@ -40,16 +56,12 @@ async def check_block_rate_limit(
     try:
         redis = await get_redis()
         try:
-            key = _block_key(user_id, deployment_id)
-            count = await redis.get(key)
-            if count is None:
-                return BlockRateResult(True, 0, 0, max_blocks)
-            n = int(count)
-            if n >= max_blocks:
-                ttl = await redis.ttl(key)
-                retry = max(ttl, DEFAULT_RETRY_AFTER_SECONDS) if ttl > 0 else DEFAULT_RETRY_AFTER_SECONDS
-                return BlockRateResult(False, retry, n, max_blocks)
-            return BlockRateResult(True, 0, n, max_blocks)
+            key = block_key(user_id, deployment_id)
+            pipe = redis.pipeline()
+            pipe.get(key)
+            pipe.ttl(key)
+            count, ttl = await pipe.execute()
+            return evaluate_block_rate(count, ttl, max_blocks)
         finally:
             await redis.aclose()
     except Exception as e:
@@ -67,7 +79,7 @@ async def increment_block_count(
     try:
         redis = await get_redis()
         try:
-            key = _block_key(user_id, deployment_id)
+            key = block_key(user_id, deployment_id)
             pipe = redis.pipeline()
             pipe.incr(key)
             pipe.expire(key, window_seconds)
@@ -0,0 +1,125 @@
+"""
+Idempotency-Key support for POST /run and POST /deploy.
+The first request with a key takes a short Redis lock; its 2xx response is then stored for
+idempotency_ttl_seconds and replayed verbatim to retries (Idempotent-Replayed: true) before auth,
+Postgres, or the queue are touched. Keys are scoped to the API key and the path. Non-2xx results
+are not stored, so a retry after a 429 or 5xx is processed normally.
+"""
+import hashlib
+import json
+import logging
+
+from fastapi import Request, Response, status
+from fastapi.responses import JSONResponse
+from starlette.middleware.base import BaseHTTPMiddleware, RequestResponseEndpoint
+
+from api.config import settings
+from api.queue import shared_redis
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+IDEMPOTENT_PATHS = frozenset({"/run", "/deploy"})
+MAX_KEY_LENGTH = 255
+
+
+def _redis_key(api_key: str, path: str, idempotency_key: str) -> str:
+    owner = hashlib.sha256(api_key.strip().encode()).hexdigest()[:32]
+    return f"idempotency:{owner}:{path}:{idempotency_key}"
+
+
+def _error(status_code: int, detail: str) -> JSONResponse:
+    return JSONResponse(status_code=status_code, content={"detail": detail})
+
+
+async def _release(redis, key: str) -> None:
+    """Drop the pending lock so a retry is processed; on Redis errors it expires on its own."""
+    try:
+        await redis.delete(key)
+    except Exception as e:
+        logger.warning("Idempotency lock not released (Redis unavailable): %s", e)
+
+
+class IdempotencyMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next: RequestResponseEndpoint) -> Response:
+        idempotency_key = request.headers.get(IDEMPOTENCY_HEADER)
+        api_key = request.headers.get("X-API-Key")
+        if (
+            request.method != "POST"
+            or request.url.path not in IDEMPOTENT_PATHS
+            or idempotency_key is None
+            or not api_key
+        ):
+            return await call_next(request)
+        if not idempotency_key or len(idempotency_key) > MAX_KEY_LENGTH:
+            return _error(
+                status.HTTP_400_BAD_REQUEST,
+                f"{IDEMPOTENCY_HEADER} must be 1-{MAX_KEY_LENGTH} characters",
+            )
+
+        key = _redis_key(api_key, request.url.path, idempotency_key)
+        fingerprint = hashlib.sha256(await request.body()).hexdigest()
+        redis = shared_redis()
+        try:
+            locked = await redis.set(
+                key,
+                json.dumps({"state": "pending", "fingerprint": fingerprint}),
+                nx=True,
+                ex=settings.idempotency_lock_seconds,
+            )
+            stored = None if locked else await redis.get(key)
+        except Exception as e:
+            # Idempotency is best effort: without Redis, process the request as if no key was sent
+            logger.warning("Idempotency check skipped (Redis unavailable): %s", e)
+            return await call_next(request)
+
+        if not locked:
+            if stored is None:  # Lock expired or released between SET and GET; ask the client to retry
+                return _error(status.HTTP_409_CONFLICT, "A request with this Idempotency-Key is in progress")
+            entry = json.loads(stored)
+            if entry["fingerprint"] != fingerprint:
+                return _error(
+                    422,  # Unprocessable Content (the constant's name differs across Starlette versions)
+                    f"{IDEMPOTENCY_HEADER} was already used with a different request body",
+                )
+            if entry["state"] == "pending":
+                return _error(status.HTTP_409_CONFLICT, "A request with this Idempotency-Key is in progress")
+            return Response(
+                content=entry["body"],
+                status_code=entry["status_code"],
+                media_type=entry["media_type"],
+                headers={"Idempotent-Replayed": "true"},
+            )
+
+        try:
+            response = await call_next(request)
+        except BaseException:
+            await _release(redis, key)
+            raise
+        if not 200 <= response.status_code < 300:
+            await _release(redis, key)
+            return response
+
+        body = b"".join([chunk async for chunk in response.body_iterator])
+        try:
+            await redis.set(
+                key,
+                json.dumps(
+                    {
+                        "state": "done",
+                        "fingerprint": fingerprint,
+                        "status_code": response.status_code,
+                        "media_type": response.headers.get("content-type"),
+                        "body": body.decode(),
+                    }
+                ),
+                ex=settings.idempotency_ttl_seconds,
+            )
+        except Exception as e:
+            # The work is done: return its response; retries see the lock until it expires, then rerun
+            logger.warning("Idempotent response not stored (Redis unavailable): %s", e)
+        return Response(
+            content=body,
+            status_code=response.status_code,
+            headers=dict(response.headers),
+        )
@@ -18,10 +18,10 @@ from api.logging_config import setup_logging
 setup_logging(settings.log_level)
 logger = logging.getLogger(__name__)
 from prometheus_client import make_asgi_app
-from sqlalchemy import func, select, text
+from sqlalchemy import func, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from api.db import Base, engine, async_session_maker
+from api.db import engine, async_session_maker
 from api.metrics import (
     quantlix_usage_compute_seconds_total,
     quantlix_usage_gpu_seconds_total,
@@ -31,8 +31,17 @@ from api.metrics import (
     quantlix_users_total,
     quantlix_users_verified,
 )
-from api.models import UsageRecord, User
-from api.routes import auth, billing, deploy, deployments, demo, health, jobs, run, status, usage
+from api.idempotency import IdempotencyMiddleware
+from api.migrations import run_migrations
+from api.admission import run_wait_estimator
+from api.outbox import run_outbox_relay, run_outbox_sweeper
+from api.webhooks import run_webhook_dispatcher
+from api.events import hub as job_event_hub
+from api.models import User
+from api.partitions import ensure_partitions, run_partition_maintenance
+from api.queue import shared_redis
+from api.routes import auth, batches, billing, deploy, deployments, demo, health, jobs, run, status, usage, ws
+from api.usage_service import daily_rollup_totals
 
 # Register guardrail metrics with Prometheus
 import api.guardrails.metrics  # noqa: F401
@@ -64,14 +73,7 @@ async def _refresh_metrics(session: AsyncSession) -> None:
 
     # Usage this month
     start_of_month = datetime.now(timezone.utc).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    usage = await session.execute(
-        select(
-            func.coalesce(func.sum(UsageRecord.tokens_used), 0),
-            func.coalesce(func.sum(UsageRecord.compute_seconds), 0),
-            func.coalesce(func.sum(UsageRecord.gpu_seconds), 0),
-            func.count(UsageRecord.id),
-        ).where(UsageRecord.created_at >= start_of_month)
-    )
+    usage = await session.execute(daily_rollup_totals(start_of_month, datetime.now(timezone.utc)))
     row = usage.one()
     quantlix_usage_tokens_total.set(int(row[0]))
     quantlix_usage_compute_seconds_total.set(float(row[1]))
@@ -82,27 +84,8 @@ async def _refresh_metrics(session: AsyncSession) -> None:
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
-        # Add password_hash if missing (migration for existing DBs)
-        await conn.execute(text("ALTER TABLE users ADD COLUMN IF NOT EXISTS password_hash VARCHAR(255)"))
-        await conn.execute(text("ALTER TABLE users ADD COLUMN IF NOT EXISTS email_verified BOOLEAN DEFAULT FALSE"))
-        await conn.execute(text("ALTER TABLE users ADD COLUMN IF NOT EXISTS email_verification_token VARCHAR(64)"))
-        await conn.execute(text("ALTER TABLE users ADD COLUMN IF NOT EXISTS password_reset_token VARCHAR(64)"))
-        await conn.execute(text("ALTER TABLE users ADD COLUMN IF NOT EXISTS password_reset_expires_at TIMESTAMPTZ"))
-        await conn.execute(text("ALTER TABLE users ADD COLUMN IF NOT EXISTS plan VARCHAR(20) DEFAULT 'free'"))
-        await conn.execute(text("ALTER TABLE users ADD COLUMN IF NOT EXISTS stripe_customer_id VARCHAR(255)"))
-        await conn.execute(text("ALTER TABLE usage_records ADD COLUMN IF NOT EXISTS gpu_seconds DOUBLE PRECISION DEFAULT 0"))
-        await conn.execute(text("ALTER TABLE users ADD COLUMN IF NOT EXISTS first_deploy_email_sent BOOLEAN DEFAULT FALSE"))
-        await conn.execute(text("ALTER TABLE users ADD COLUMN IF NOT EXISTS near_limit_email_sent_at TIMESTAMPTZ"))
-        await conn.execute(text("ALTER TABLE users ADD COLUMN IF NOT EXISTS idle_email_sent_at TIMESTAMPTZ"))
-        await conn.run_sync(Base.metadata.create_all)  # Create deployment_revisions if missing
-        # Guardrails & scoring on jobs
-        await conn.execute(text("ALTER TABLE jobs ADD COLUMN IF NOT EXISTS score_input DOUBLE PRECISION"))
-        await conn.execute(text("ALTER TABLE jobs ADD COLUMN IF NOT EXISTS score_output DOUBLE PRECISION"))
-        await conn.execute(text("ALTER TABLE jobs ADD COLUMN IF NOT EXISTS score_final DOUBLE PRECISION"))
-        await conn.execute(text("ALTER TABLE jobs ADD COLUMN IF NOT EXISTS guardrail_blocked BOOLEAN DEFAULT FALSE"))
-        await conn.execute(text("ALTER TABLE jobs ADD COLUMN IF NOT EXISTS guardrail_flags JSONB"))
-        await conn.execute(text("ALTER TABLE jobs ADD COLUMN IF NOT EXISTS policy_action VARCHAR(20)"))
+        await run_migrations(conn)
+        await ensure_partitions(conn)
 
     async def update_metrics():
         """Periodically update Prometheus metrics for users, usage, tiers."""
@@ -114,18 +97,38 @@ async def lifespan(app: FastAPI):
                 logger.exception("Metrics refresh failed: %s", e)
             await asyncio.sleep(60)
 
-    # Initial refresh + background task
+    async def maintain_partitions():
+        """Hourly: premake upcoming partitions, archive and drop expired ones (one replica wins the lock)."""
+        while True:
+            await asyncio.sleep(3600)
+            try:
+                await run_partition_maintenance()
+            except Exception as e:
+                logger.exception("Partition maintenance failed: %s", e)
+
+    # Initial refresh + background tasks
     async with async_session_maker() as session:
         await _refresh_metrics(session)
-    task = asyncio.create_task(update_metrics())
+    tasks = [
+        asyncio.create_task(update_metrics()),
+        asyncio.create_task(maintain_partitions()),
+        asyncio.create_task(run_outbox_relay()),
+        asyncio.create_task(run_outbox_sweeper()),
+        asyncio.create_task(run_wait_estimator()),
+        asyncio.create_task(run_webhook_dispatcher()),
+        asyncio.create_task(job_event_hub.run()),
+    ]
     try:
         yield
     finally:
-        task.cancel()
-        try:
-            await task
-        except asyncio.CancelledError:
-            pass
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        await shared_redis().aclose()
         await engine.dispose()
 
 
@@ -150,6 +153,7 @@ async def http_exception_handler(request: Request, exc: HTTPException) -> JSONRe
     return JSONResponse(
         status_code=exc.status_code,
         content={"detail": str(exc.detail) if exc.detail else "Internal server error"},
+        headers=exc.headers,
     )
 
 
@@ -175,6 +179,7 @@ def _get_cors_origins() -> list[str]:
     return origins
 
 
+app.add_middleware(IdempotencyMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=_get_cors_origins(),
@@ -196,8 +201,10 @@ app.include_router(deployments.router, prefix="/deployments", tags=["deployments
 app.include_router(run.router, prefix="/run", tags=["run"])
 app.include_router(status.router, prefix="/status", tags=["status"])
 app.include_router(jobs.router, prefix="/jobs", tags=["jobs"])
+app.include_router(batches.router, prefix="/batches", tags=["batches"])
 app.include_router(usage.router, prefix="/usage", tags=["usage"])
 app.include_router(billing.router, prefix="/billing", tags=["billing"])
+app.include_router(ws.router, prefix="/ws", tags=["ws"])
 
 
 @app.get("/")
@@ -1,5 +1,5 @@
-"""Prometheus metrics for users, usage, and tiers."""
-from prometheus_client import Gauge
+"""Prometheus metrics for users, usage, tiers, and request admission."""
+from prometheus_client import Counter, Gauge, Histogram
 
 # Users
 quantlix_users_total = Gauge(
@@ -33,3 +33,42 @@ quantlix_usage_jobs_total = Gauge(
     "quantlix_usage_jobs_total",
     "Total inference jobs this month",
 )
+
+# /run admission: time per stage (redis_admission, db_read, guardrails, result_cache, payload_offload, db_write)
+quantlix_run_admission_seconds = Histogram(
+    "quantlix_run_admission_seconds",
+    "Time spent in each /run admission stage",
+    ["stage"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+
+# Job dispatch outbox (api.outbox)
+quantlix_outbox_relayed_total = Counter(
+    "quantlix_outbox_relayed_total",
+    "Jobs pushed from the outbox to the Redis queue",
+)
+quantlix_outbox_requeued_total = Counter(
+    "quantlix_outbox_requeued_total",
+    "Stale QUEUED jobs put back in the outbox by the sweeper",
+)
+
+# Inference result cache (api.result_cache)
+quantlix_result_cache_requests_total = Counter(
+    "quantlix_result_cache_requests_total",
+    "Result cache lookups for cache-enabled deployments",
+    ["deployment_id", "result"],  # result: hit, miss
+)
+
+# Request coalescing (api.coalescing): identical in-flight jobs share one inference run
+quantlix_coalesced_jobs_total = Counter(
+    "quantlix_coalesced_jobs_total",
+    "Coalescing-eligible jobs by role (leader runs inference, follower reuses its result)",
+    ["deployment_id", "role"],
+)
+
+# Completion webhooks (api.webhooks)
+quantlix_webhook_deliveries_total = Counter(
+    "quantlix_webhook_deliveries_total",
+    "Webhook delivery attempts by outcome",
+    ["result"],  # result: delivered, retried, dropped, rejected (URL not public)
+)
@@ -0,0 +1,265 @@
+"""
+Schema migrations — ordered steps applied once per database and recorded in schema_migrations.
+Run at API startup: create_all creates missing tables, migrations alter existing ones.
+"""
+import logging
+from collections.abc import Awaitable, Callable
+from datetime import datetime, timezone
+
+from sqlalchemy import Table, text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from api.db import Base
+from api.models import Job, UsageRecord
+from api.partitions import month_start, next_month
+from api.usage_service import backfill_usage_rollups
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_LOCK_KEY = 7_201_001  # pg_advisory_xact_lock key shared by all API replicas
+
+
+async def _add_missing_columns(conn: AsyncConnection) -> None:
+    """Columns added after the first release (create_all does not alter existing tables)."""
+    statements = [
+        "ALTER TABLE users ADD COLUMN IF NOT EXISTS password_hash VARCHAR(255)",
+        "ALTER TABLE users ADD COLUMN IF NOT EXISTS email_verified BOOLEAN DEFAULT FALSE",
+        "ALTER TABLE users ADD COLUMN IF NOT EXISTS email_verification_token VARCHAR(64)",
+        "ALTER TABLE users ADD COLUMN IF NOT EXISTS password_reset_token VARCHAR(64)",
+        "ALTER TABLE users ADD COLUMN IF NOT EXISTS password_reset_expires_at TIMESTAMPTZ",
+        "ALTER TABLE users ADD COLUMN IF NOT EXISTS plan VARCHAR(20) DEFAULT 'free'",
+        "ALTER TABLE users ADD COLUMN IF NOT EXISTS stripe_customer_id VARCHAR(255)",
+        "ALTER TABLE usage_records ADD COLUMN IF NOT EXISTS gpu_seconds DOUBLE PRECISION DEFAULT 0",
+        "ALTER TABLE users ADD COLUMN IF NOT EXISTS first_deploy_email_sent BOOLEAN DEFAULT FALSE",
+        "ALTER TABLE users ADD COLUMN IF NOT EXISTS near_limit_email_sent_at TIMESTAMPTZ",
+        "ALTER TABLE users ADD COLUMN IF NOT EXISTS idle_email_sent_at TIMESTAMPTZ",
+        # Guardrails & scoring on jobs
+        "ALTER TABLE jobs ADD COLUMN IF NOT EXISTS score_input DOUBLE PRECISION",
+        "ALTER TABLE jobs ADD COLUMN IF NOT EXISTS score_output DOUBLE PRECISION",
+        "ALTER TABLE jobs ADD COLUMN IF NOT EXISTS score_final DOUBLE PRECISION",
+        "ALTER TABLE jobs ADD COLUMN IF NOT EXISTS guardrail_blocked BOOLEAN DEFAULT FALSE",
+        "ALTER TABLE jobs ADD COLUMN IF NOT EXISTS guardrail_flags JSONB",
+        "ALTER TABLE jobs ADD COLUMN IF NOT EXISTS policy_action VARCHAR(20)",
+    ]
+    for stmt in statements:
+        await conn.execute(text(stmt))
+
+
+# Secondary indexes of the partitioned tables as they were at step 3. Steps must not read indexes
+# from the live models: later columns (and their indexes) only exist once their own step has run.
+_PARTITIONED_INDEXES = {
+    "jobs": [("ix_jobs_user_status", "user_id, status")],
+    "usage_records": [("ix_usage_user_created", "user_id, created_at")],
+}
+
+
+async def _convert_to_partitioned(conn: AsyncConnection, table: Table) -> None:
+    """
+    Turn an existing plain table into a monthly RANGE (created_at) partitioned table.
+    The old table is attached as-is as the first partition (no row copy); its range ends
+    at the start of next month, after which api.partitions creates monthly partitions.
+    """
+    name = table.name
+    is_partitioned = await conn.scalar(
+        text("SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:t))"),
+        {"t": name},
+    )
+    if is_partitioned:
+        return
+
+    legacy = f"{name}_legacy"
+    # Foreign keys *to* this table cannot survive (they would need created_at in the key)
+    fks_in = await conn.execute(
+        text(
+            "SELECT conrelid::regclass::text, conname FROM pg_constraint "
+            "WHERE contype = 'f' AND confrelid = to_regclass(:t)"
+        ),
+        {"t": name},
+    )
+    for ref_table, conname in fks_in.all():
+        await conn.execute(text(f'ALTER TABLE {ref_table} DROP CONSTRAINT "{conname}"'))
+
+    await conn.execute(text(f"ALTER TABLE {name} RENAME TO {legacy}"))
+    indexes = await conn.execute(
+        text("SELECT indexname FROM pg_indexes WHERE schemaname = current_schema() AND tablename = :t"),
+        {"t": legacy},
+    )
+    for (index_name,) in indexes.all():
+        await conn.execute(text(f'ALTER INDEX "{index_name}" RENAME TO "{index_name}_legacy"'))
+
+    # The parent's (id, created_at) primary key replaces the old one on attach
+    old_pk = await conn.scalar(
+        text("SELECT conname FROM pg_constraint WHERE contype = 'p' AND conrelid = to_regclass(:t)"),
+        {"t": legacy},
+    )
+    if old_pk:
+        await conn.execute(text(f'ALTER TABLE {legacy} DROP CONSTRAINT "{old_pk}"'))
+    await conn.execute(text(f"UPDATE {legacy} SET created_at = now() WHERE created_at IS NULL"))
+    await conn.execute(text(f"ALTER TABLE {legacy} ALTER COLUMN created_at SET NOT NULL"))
+    await conn.execute(
+        text(f"CREATE TABLE {name} (LIKE {legacy} INCLUDING DEFAULTS) PARTITION BY RANGE (created_at)")
+    )
+    pk_cols = ", ".join(c.name for c in table.primary_key.columns)
+    await conn.execute(text(f"ALTER TABLE {name} ADD PRIMARY KEY ({pk_cols})"))
+    for fk in table.foreign_keys:
+        await conn.execute(
+            text(
+                f"ALTER TABLE {name} ADD FOREIGN KEY ({fk.parent.name}) "
+                f"REFERENCES {fk.column.table.name} ({fk.column.name})"
+                + (f" ON DELETE {fk.ondelete}" if fk.ondelete else "")
+            )
+        )
+    for index_name, columns in _PARTITIONED_INDEXES[name]:
+        await conn.execute(text(f"CREATE INDEX {index_name} ON {name} ({columns})"))
+
+    upper = next_month(month_start(datetime.now(timezone.utc)))
+    await conn.execute(
+        text(
+            f"ALTER TABLE {name} ATTACH PARTITION {legacy} "
+            f"FOR VALUES FROM (MINVALUE) TO ('{upper.isoformat()}')"
+        )
+    )
+    logger.info("Partitioned %s (existing rows kept in %s until %s)", name, legacy, upper.date())
+
+
+async def _partition_jobs_and_usage(conn: AsyncConnection) -> None:
+    await _convert_to_partitioned(conn, Job.__table__)
+    await _convert_to_partitioned(conn, UsageRecord.__table__)
+
+
+async def _backfill_usage_rollups(conn: AsyncConnection) -> None:
+    """Build rollups from raw usage_records once (no-op when rollups already exist)."""
+    for granularity in ("hour", "day"):
+        await conn.execute(
+            text(
+                """
+                INSERT INTO usage_rollups
+                    (user_id, granularity, bucket_start, tokens_used, compute_seconds, gpu_seconds, job_count)
+                SELECT user_id, :granularity,
+                       date_trunc(:granularity, created_at AT TIME ZONE 'UTC') AT TIME ZONE 'UTC',
+                       COALESCE(SUM(tokens_used), 0), COALESCE(SUM(compute_seconds), 0),
+                       COALESCE(SUM(gpu_seconds), 0), COUNT(*)
+                FROM usage_records
+                WHERE NOT EXISTS (SELECT 1 FROM usage_rollups WHERE granularity = :granularity)
+                GROUP BY 1, 2, 3
+                ON CONFLICT DO NOTHING
+                """
+            ),
+            {"granularity": granularity},
+        )
+
+
+async def _add_job_output_ref(conn: AsyncConnection) -> None:
+    await conn.execute(text("ALTER TABLE jobs ADD COLUMN IF NOT EXISTS output_ref VARCHAR(512)"))
+
+
+async def _add_pagination_indexes(conn: AsyncConnection) -> None:
+    """(user_id, ts, id) indexes for keyset pagination; on jobs they cascade to every partition."""
+    for table, index_name, columns in (
+        ("jobs", "ix_jobs_user_created", "user_id, created_at, id"),
+        ("jobs", "ix_jobs_deployment_created", "deployment_id, created_at, id"),
+        ("deployments", "ix_deployments_user_updated", "user_id, updated_at, id"),
+    ):
+        await conn.execute(text(f"CREATE INDEX IF NOT EXISTS {index_name} ON {table} ({columns})"))
+
+
+async def _add_job_enqueued_at(conn: AsyncConnection) -> None:
+    """jobs.enqueued_at for the outbox sweeper; job_outbox itself is created by create_all."""
+    await conn.execute(text("ALTER TABLE jobs ADD COLUMN IF NOT EXISTS enqueued_at TIMESTAMPTZ"))
+    # Jobs already queued were pushed directly, before the outbox existed
+    await conn.execute(text("UPDATE jobs SET enqueued_at = created_at WHERE status = 'queued'"))
+    await conn.execute(text("CREATE INDEX IF NOT EXISTS ix_jobs_status_enqueued ON jobs (status, enqueued_at)"))
+
+
+async def _add_job_started_at(conn: AsyncConnection) -> None:
+    """jobs.started_at: when a worker claimed the job; cancelled jobs are billed from it."""
+    await conn.execute(text("ALTER TABLE jobs ADD COLUMN IF NOT EXISTS started_at TIMESTAMPTZ"))
+
+
+async def _add_job_deadline_at(conn: AsyncConnection) -> None:
+    """jobs.deadline_at (RunRequest.timeout_seconds), re-sent by the sweeper with requeued jobs."""
+    await conn.execute(text("ALTER TABLE jobs ADD COLUMN IF NOT EXISTS deadline_at TIMESTAMPTZ"))
+
+
+async def _add_job_webhook_url(conn: AsyncConnection) -> None:
+    """jobs.webhook_url: per-request completion webhook (api.webhooks)."""
+    await conn.execute(text("ALTER TABLE jobs ADD COLUMN IF NOT EXISTS webhook_url VARCHAR(2048)"))
+
+
+async def _add_usage_batch_id(conn: AsyncConnection) -> None:
+    """usage_records.batch_id: usage of batch chunks (api.batches); the batches table is created by create_all."""
+    await conn.execute(text("ALTER TABLE usage_records ADD COLUMN IF NOT EXISTS batch_id UUID"))
+
+
+async def _add_deployment_rollout(conn: AsyncConnection) -> None:
+    """Deployment rollout tracking (orchestrator.rollout). Existing deployments keep their status."""
+    for column, sql_type in (
+        ("rollout_id", "UUID"),
+        ("rollout_phase", "VARCHAR(32)"),
+        ("rollout_started_at", "TIMESTAMPTZ"),
+        ("rollout_completed_at", "TIMESTAMPTZ"),
+        ("rollout_timings", "JSONB"),
+    ):
+        await conn.execute(text(f"ALTER TABLE deployments ADD COLUMN IF NOT EXISTS {column} {sql_type}"))
+
+
+async def _add_job_lane(conn: AsyncConnection) -> None:
+    """jobs.lane: shed jobs stay in the batch lane when the sweeper re-sends them."""
+    await conn.execute(text("ALTER TABLE jobs ADD COLUMN IF NOT EXISTS lane VARCHAR(16)"))
+
+
+async def _drop_hourly_usage_rollups(conn: AsyncConnection) -> None:
+    """Hourly rollups were written but never read: every usage window is whole UTC days."""
+    await conn.execute(text("DELETE FROM usage_rollups WHERE granularity = 'hour'"))
+
+
+async def _recompute_usage_rollups(conn: AsyncConnection) -> None:
+    """
+    usage_records.job_count (requests per record: a batch chunk is one record for many lines),
+    then rebuild every daily rollup from the raw records; version 2 skipped the whole backfill
+    if any rollup existed.
+    """
+    await conn.execute(text("ALTER TABLE usage_records ADD COLUMN IF NOT EXISTS job_count INTEGER NOT NULL DEFAULT 1"))
+    await backfill_usage_rollups(conn)
+
+
+# (version, name, step). Append only; never renumber or edit an applied step.
+MIGRATIONS: list[tuple[int, str, Callable[[AsyncConnection], Awaitable[None]]]] = [
+    (1, "add_missing_columns", _add_missing_columns),
+    (2, "backfill_usage_rollups", _backfill_usage_rollups),
+    (3, "partition_jobs_and_usage_records", _partition_jobs_and_usage),
+    (4, "add_job_output_ref", _add_job_output_ref),
+    (5, "add_pagination_indexes", _add_pagination_indexes),
+    (6, "add_job_enqueued_at", _add_job_enqueued_at),
+    (7, "add_job_started_at", _add_job_started_at),
+    (8, "add_job_deadline_at", _add_job_deadline_at),
+    (9, "add_job_webhook_url", _add_job_webhook_url),
+    (10, "add_usage_batch_id", _add_usage_batch_id),
+    (11, "add_deployment_rollout", _add_deployment_rollout),
+    (12, "add_job_lane", _add_job_lane),
+    (13, "drop_hourly_usage_rollups", _drop_hourly_usage_rollups),
+    (14, "recompute_usage_rollups", _recompute_usage_rollups),
+]
+
+
+async def run_migrations(conn: AsyncConnection) -> None:
+    """Create missing tables and apply pending migrations. Caller holds the transaction (engine.begin())."""
+    await conn.execute(text(f"SELECT pg_advisory_xact_lock({MIGRATIONS_LOCK_KEY})"))
+    await conn.run_sync(Base.metadata.create_all)
+    await conn.execute(
+        text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations ("
+            "version INTEGER PRIMARY KEY, name VARCHAR(100) NOT NULL, "
+            "applied_at TIMESTAMPTZ NOT NULL DEFAULT now())"
+        )
+    )
+    applied = set((await conn.execute(text("SELECT version FROM schema_migrations"))).scalars())
+    for version, name, step in MIGRATIONS:
+        if version in applied:
+            continue
+        logger.info("Applying migration %d: %s", version, name)
+        await step(conn)
+        await conn.execute(
+            text("INSERT INTO schema_migrations (version, name) VALUES (:v, :n)"),
+            {"v": version, "n": name},
+        )
@@ -3,7 +3,7 @@ import uuid
 from datetime import datetime
 from enum import Enum
 
-from sqlalchemy import DateTime, Float, ForeignKey, Index, Integer, String, Text, func
+from sqlalchemy import BigInteger, DateTime, Float, ForeignKey, Index, Integer, String, Text, func
 from sqlalchemy.dialects.postgresql import JSONB, UUID
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
@@ -22,6 +22,24 @@ class DeploymentStatus(str, Enum):
     STOPPED = "stopped"
 
 
+# Jobs may be sent while a rollout runs; they wait for the model it is warming
+RUNNABLE_DEPLOYMENT_STATUSES = (
+    DeploymentStatus.READY.value,
+    DeploymentStatus.PENDING.value,
+    DeploymentStatus.DEPLOYING.value,
+)
+
+
+class RolloutPhase(str, Enum):
+    QUEUED = "queued"
+    PULLING = "pulling"
+    LOADING = "loading"
+    WARMING = "warming"
+    SMOKE_TEST = "smoke_test"
+    READY = "ready"
+    FAILED = "failed"
+
+
 class JobStatus(str, Enum):
     QUEUED = "queued"
     RUNNING = "running"
@@ -30,6 +48,10 @@ class JobStatus(str, Enum):
     CANCELLED = "cancelled"
 
 
+class UsageGranularity(str, Enum):
+    DAY = "day"
+
+
 class UserPlan(str, Enum):
     FREE = "free"
     STARTER = "starter"
@@ -45,6 +67,13 @@ PLAN_LIMITS: dict[UserPlan, tuple[int, float, float]] = {
     UserPlan.PRO: (1_000_000, 36_000, 7_200),  # 1M tokens, 10h CPU, 2h GPU
 }
 
+# API rate limits: (requests/minute per API key, requests/minute per user, max queued+running jobs)
+PLAN_RATE_LIMITS: dict[UserPlan, tuple[int, int, int]] = {
+    UserPlan.FREE: (60, 120, 2),
+    UserPlan.STARTER: (300, 600, 10),
+    UserPlan.PRO: (1_200, 2_400, 50),
+}
+
 
 class User(Base):
     __tablename__ = "users"
@@ -92,6 +121,12 @@ class Deployment(Base):
     config: Mapped[dict] = mapped_column(JSONB, default=dict)
     status: Mapped[str] = mapped_column(String(50), default=DeploymentStatus.PENDING.value)
     error_message: Mapped[str | None] = mapped_column(Text, nullable=True)
+    # Rollout (orchestrator.rollout): pull, load and warm the model, smoke-test it, then READY
+    rollout_id: Mapped[str | None] = mapped_column(UUID(as_uuid=False), nullable=True)  # Current attempt; a redeploy supersedes it
+    rollout_phase: Mapped[str | None] = mapped_column(String(32), nullable=True)
+    rollout_started_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    rollout_completed_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    rollout_timings: Mapped[dict | None] = mapped_column(JSONB, nullable=True)  # Seconds per phase
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
     updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
@@ -101,7 +136,10 @@ class Deployment(Base):
         back_populates="deployment", order_by="DeploymentRevision.revision_number"
     )
 
-    __table_args__ = (Index("ix_deployments_user_status", "user_id", "status"),)
+    __table_args__ = (
+        Index("ix_deployments_user_status", "user_id", "status"),
+        Index("ix_deployments_user_updated", "user_id", "updated_at", "id"),  # keyset pagination
+    )
 
 
 class DeploymentRevision(Base):
@@ -122,13 +160,16 @@ class DeploymentRevision(Base):
 
 
 class Job(Base):
+    """Inference job. Range-partitioned by month on created_at (see api.partitions)."""
     __tablename__ = "jobs"
 
     id: Mapped[str] = mapped_column(UUID(as_uuid=False), primary_key=True, default=gen_uuid)
     user_id: Mapped[str] = mapped_column(UUID(as_uuid=False), ForeignKey("users.id"), nullable=False)
     deployment_id: Mapped[str] = mapped_column(UUID(as_uuid=False), ForeignKey("deployments.id"), nullable=False)
-    input_ref: Mapped[str | None] = mapped_column(String(512), nullable=True)  # MinIO path or inline ref
+    # Payloads above payload_inline_max_bytes live in MinIO ("bucket/object"); *_data is then NULL
+    input_ref: Mapped[str | None] = mapped_column(String(512), nullable=True)
     input_data: Mapped[dict | None] = mapped_column(JSONB, nullable=True)
+    output_ref: Mapped[str | None] = mapped_column(String(512), nullable=True)
     output_data: Mapped[dict | None] = mapped_column(JSONB, nullable=True)
     status: Mapped[str] = mapped_column(String(50), default=JobStatus.QUEUED.value)
     error_message: Mapped[str | None] = mapped_column(Text, nullable=True)
@@ -141,29 +182,120 @@ class Job(Base):
     guardrail_blocked: Mapped[bool | None] = mapped_column(default=False, nullable=True)
     guardrail_flags: Mapped[dict | None] = mapped_column(JSONB, nullable=True)
     policy_action: Mapped[str | None] = mapped_column(String(20), nullable=True)  # allow, block, log
-    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    # Part of the primary key: partitioned tables need the partition column in every unique key
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), primary_key=True, server_default=func.now())
+    started_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)  # Claimed by a worker
+    deadline_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)  # From timeout_seconds
+    webhook_url: Mapped[str | None] = mapped_column(String(2048), nullable=True)  # Overrides the deployment's
+    lane: Mapped[str | None] = mapped_column(String(16), nullable=True)  # Queue lane when not interactive (shed)
     completed_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    # Last time the outbox relay pushed this job to Redis; the sweeper re-enqueues stale QUEUED jobs
+    enqueued_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
 
     user: Mapped["User"] = relationship(back_populates="jobs")
     deployment: Mapped["Deployment"] = relationship(back_populates="jobs")
-    usage_records: Mapped[list["UsageRecord"]] = relationship(back_populates="job")
+    usage_records: Mapped[list["UsageRecord"]] = relationship(
+        back_populates="job", primaryjoin="Job.id == foreign(UsageRecord.job_id)"
+    )
+
+    __table_args__ = (
+        Index("ix_jobs_user_status", "user_id", "status"),
+        # Keyset pagination: /jobs newest first, optionally per deployment
+        Index("ix_jobs_user_created", "user_id", "created_at", "id"),
+        Index("ix_jobs_deployment_created", "deployment_id", "created_at", "id"),
+        # Outbox sweeper: QUEUED jobs not pushed to Redis recently
+        Index("ix_jobs_status_enqueued", "status", "enqueued_at"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
 
-    __table_args__ = (Index("ix_jobs_user_status", "user_id", "status"),)
+
+class JobOutbox(Base):
+    """
+    Dispatch intent for a job, inserted in the same transaction as the job row.
+    The relay (api.outbox) pushes rows to the Redis queue in batches and deletes them.
+    """
+    __tablename__ = "job_outbox"
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=True)
+    job_id: Mapped[str] = mapped_column(UUID(as_uuid=False), nullable=False)
+    payload: Mapped[dict] = mapped_column(JSONB, nullable=False)  # Queue message (without job_id)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+
+
+class Batch(Base):
+    """
+    Bulk inference over an uploaded JSONL file (api.batches). Input and output live in MinIO as
+    parts of chunk_size lines; the worker runs one part per queue message on the batch lane.
+    """
+    __tablename__ = "batches"
+
+    id: Mapped[str] = mapped_column(UUID(as_uuid=False), primary_key=True, default=gen_uuid)
+    user_id: Mapped[str] = mapped_column(UUID(as_uuid=False), ForeignKey("users.id"), nullable=False)
+    deployment_id: Mapped[str] = mapped_column(UUID(as_uuid=False), ForeignKey("deployments.id"), nullable=False)
+    status: Mapped[str] = mapped_column(String(50), default=JobStatus.QUEUED.value)
+    error_message: Mapped[str | None] = mapped_column(Text, nullable=True)
+    chunk_size: Mapped[int] = mapped_column(Integer, nullable=False)
+    total_lines: Mapped[int] = mapped_column(Integer, nullable=False)
+    total_chunks: Mapped[int] = mapped_column(Integer, nullable=False)
+    next_chunk: Mapped[int] = mapped_column(Integer, default=0)  # Parts before it have output
+    chunk_attempts: Mapped[int] = mapped_column(Integer, default=0)  # Claims of next_chunk so far
+    lease_until: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)  # Worker holding next_chunk
+    # Progress counters, bumped once per chunk
+    processed_lines: Mapped[int] = mapped_column(Integer, default=0)
+    succeeded_lines: Mapped[int] = mapped_column(Integer, default=0)
+    failed_lines: Mapped[int] = mapped_column(Integer, default=0)
+    tokens_used: Mapped[int] = mapped_column(BigInteger, default=0)
+    compute_seconds: Mapped[float] = mapped_column(Float, default=0.0)
+    gpu_seconds: Mapped[float] = mapped_column(Float, default=0.0)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    started_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    completed_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        Index("ix_batches_user_created", "user_id", "created_at", "id"),
+        # Sweeper: unfinished batches whose worker went away
+        Index("ix_batches_status_updated", "status", "updated_at"),
+    )
 
 
 class UsageRecord(Base):
-    """Aggregated usage for billing: user_id, tokens_used, compute_seconds (CPU), gpu_seconds."""
+    """Aggregated usage for billing: user_id, tokens_used, compute_seconds (CPU), gpu_seconds.
+    Range-partitioned by month on created_at, like jobs."""
     __tablename__ = "usage_records"
 
     id: Mapped[str] = mapped_column(UUID(as_uuid=False), primary_key=True, default=gen_uuid)
     user_id: Mapped[str] = mapped_column(UUID(as_uuid=False), ForeignKey("users.id"), nullable=False)
-    job_id: Mapped[str | None] = mapped_column(UUID(as_uuid=False), ForeignKey("jobs.id"), nullable=True)
+    # No FK: jobs' unique key is (id, created_at), and job partitions are dropped independently
+    job_id: Mapped[str | None] = mapped_column(UUID(as_uuid=False), nullable=True)
+    batch_id: Mapped[str | None] = mapped_column(UUID(as_uuid=False), nullable=True)  # One record per batch chunk
+    job_count: Mapped[int] = mapped_column(Integer, default=1, server_default="1")  # Requests (lines of a chunk)
     tokens_used: Mapped[int] = mapped_column(Integer, default=0)
     compute_seconds: Mapped[float] = mapped_column(Float, default=0.0)
     gpu_seconds: Mapped[float] = mapped_column(Float, default=0.0)
-    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), primary_key=True, server_default=func.now())
 
     user: Mapped["User"] = relationship(back_populates="usage_records")
-    job: Mapped["Job | None"] = relationship(back_populates="usage_records")
+    job: Mapped["Job | None"] = relationship(
+        back_populates="usage_records", primaryjoin="foreign(UsageRecord.job_id) == Job.id"
+    )
+
+    __table_args__ = (
+        Index("ix_usage_user_created", "user_id", "created_at"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+
+
+class UsageRollup(Base):
+    """Usage pre-aggregated per user and UTC day. Upserted alongside each UsageRecord."""
+    __tablename__ = "usage_rollups"
+
+    user_id: Mapped[str] = mapped_column(UUID(as_uuid=False), ForeignKey("users.id"), primary_key=True)
+    granularity: Mapped[str] = mapped_column(String(8), primary_key=True)  # day
+    bucket_start: Mapped[datetime] = mapped_column(DateTime(timezone=True), primary_key=True)
+    tokens_used: Mapped[int] = mapped_column(BigInteger, default=0)
+    compute_seconds: Mapped[float] = mapped_column(Float, default=0.0)
+    gpu_seconds: Mapped[float] = mapped_column(Float, default=0.0)
+    job_count: Mapped[int] = mapped_column(Integer, default=0)
 
-    __table_args__ = (Index("ix_usage_user_created", "user_id", "created_at"),)
+    __table_args__ = (Index("ix_usage_rollups_granularity_bucket", "granularity", "bucket_start"),)
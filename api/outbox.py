@@ -0,0 +1,268 @@
+"""
+Transactional job dispatch.
+/run inserts the job and its job_outbox row in one transaction, so a committed job always has a
+dispatch intent. The relay moves outbox rows to the Redis queue in batches (one RPUSH per batch)
+and deletes them in the same transaction; the sweeper puts QUEUED jobs that were never picked up
+back into the outbox. Delivery is at-least-once: the worker claims a job with a conditional
+QUEUED -> RUNNING update, so duplicates are dropped there.
+Bulk batches (api.batches) ride the same path: one outbox row per part, keyed by batch id.
+So do deployment rollouts (orchestrator.rollout): one row per /deploy, keyed by deployment id.
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import and_, delete, exists, func, or_, select, text, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.config import settings
+from api.db import async_session_maker
+from api.metrics import quantlix_outbox_relayed_total, quantlix_outbox_requeued_total
+from api.models import Batch, Deployment, DeploymentStatus, Job, JobOutbox, JobStatus, RolloutPhase, gen_uuid
+from api.queue import BATCH_LANE, DEFAULT_LANE, enqueue_jobs, still_queued
+
+logger = logging.getLogger(__name__)
+
+SWEEPER_LOCK_KEY = 7_201_003  # pg_try_advisory_xact_lock: one replica sweeps at a time
+SWEEP_INTERVAL_SECONDS = 60
+
+_wake = asyncio.Event()
+
+
+def job_dispatch_payload(job: Job) -> dict:
+    """Queue message for a job (job_id is added by enqueue_jobs)."""
+    payload = {"deployment_id": str(job.deployment_id), "user_id": str(job.user_id)}
+    if job.lane:
+        payload["lane"] = job.lane
+    if job.input_ref:
+        payload["input_ref"] = job.input_ref
+    else:
+        payload["input"] = job.input_data or {}
+    if job.deadline_at:
+        payload["deadline"] = job.deadline_at.timestamp()  # Epoch seconds; scores the job in its lane
+    if job.created_at:
+        payload["created_at"] = job.created_at.timestamp()  # Default score and wait-time origin
+    return payload
+
+
+def add_to_outbox(db: AsyncSession, job: Job, *, lane: str | None = None) -> None:
+    """Stage a job and its dispatch intent; both are written by the caller's commit."""
+    if lane and lane != DEFAULT_LANE:
+        job.lane = lane  # Kept on the job so requeues by the sweeper stay in this lane
+    if job.created_at is None:
+        job.created_at = datetime.now(timezone.utc)  # Set here, not by the server default: the payload needs it
+    db.add(job)
+    db.add(JobOutbox(job_id=job.id, payload=job_dispatch_payload(job)))
+
+
+def batch_dispatch_payload(batch: Batch) -> dict:
+    """Queue message for a batch's next part (job_id is the batch id); always the batch lane."""
+    return {
+        "kind": "batch",
+        "deployment_id": str(batch.deployment_id),
+        "user_id": str(batch.user_id),
+        "lane": BATCH_LANE,
+    }
+
+
+def add_batch_to_outbox(db: AsyncSession, batch: Batch) -> None:
+    """Stage a batch and the dispatch of its next part; both are written by the caller's commit."""
+    db.add(batch)
+    db.add(JobOutbox(job_id=batch.id, payload=batch_dispatch_payload(batch)))
+
+
+def rollout_dispatch_payload(deployment: Deployment) -> dict:
+    """Queue message for a deployment's rollout (job_id is the deployment id)."""
+    return {
+        "kind": "rollout",
+        "deployment_id": str(deployment.id),
+        "user_id": str(deployment.user_id),
+        "rollout_id": deployment.rollout_id,
+    }
+
+
+def add_rollout_to_outbox(db: AsyncSession, deployment: Deployment) -> None:
+    """
+    Start a new rollout of the deployment as it now stands (PENDING until a worker picks it up);
+    any rollout still running is superseded. Written by the caller's commit.
+    """
+    deployment.status = DeploymentStatus.PENDING.value
+    deployment.error_message = None
+    deployment.rollout_id = gen_uuid()
+    deployment.rollout_phase = RolloutPhase.QUEUED.value
+    deployment.rollout_started_at = None
+    deployment.rollout_completed_at = None
+    deployment.rollout_timings = None
+    db.add(deployment)
+    db.add(JobOutbox(job_id=deployment.id, payload=rollout_dispatch_payload(deployment)))
+
+
+def notify_outbox() -> None:
+    """Wake this process's relay after a commit instead of waiting for the next poll."""
+    _wake.set()
+
+
+async def relay_outbox_batch(limit: int) -> int:
+    """
+    Push up to limit outbox rows to Redis and delete them. Returns the number pushed.
+    SKIP LOCKED lets several API replicas relay concurrently without double-pushing; if Redis
+    fails the transaction rolls back and the rows stay for the next round.
+    """
+    async with async_session_maker() as db:
+        batch = (
+            select(JobOutbox.id)
+            .order_by(JobOutbox.id)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        result = await db.execute(
+            delete(JobOutbox)
+            .where(JobOutbox.id.in_(batch))
+            .returning(JobOutbox.id, JobOutbox.job_id, JobOutbox.payload)
+        )
+        rows = sorted(result.all(), key=lambda r: r.id)
+        if not rows:
+            return 0
+        await enqueue_jobs([(str(r.job_id), r.payload) for r in rows])
+        await db.execute(
+            update(Job)
+            .where(Job.id.in_([r.job_id for r in rows]), Job.status == JobStatus.QUEUED.value)
+            .values(enqueued_at=func.now())
+        )
+        await db.commit()
+    quantlix_outbox_relayed_total.inc(len(rows))
+    return len(rows)
+
+
+async def run_outbox_relay() -> None:
+    """Relay loop: drain on wake-up (local commit) or every outbox_poll_seconds (other replicas)."""
+    while True:
+        try:
+            await asyncio.wait_for(_wake.wait(), settings.outbox_poll_seconds)
+        except asyncio.TimeoutError:
+            pass
+        _wake.clear()
+        try:
+            while await relay_outbox_batch(settings.outbox_batch_size) == settings.outbox_batch_size:
+                pass
+        except Exception as e:
+            logger.exception("Outbox relay failed: %s", e)
+            await asyncio.sleep(settings.outbox_poll_seconds)
+
+
+async def sweep_stale_jobs(limit: int = 1000) -> int:
+    """
+    Put QUEUED jobs back in the outbox when they were not pushed within queued_job_requeue_seconds
+    (queue message lost, or a job committed before the outbox existed). Returns the number requeued.
+    Jobs still waiting in their lane are only re-stamped, so a long wait is not re-pushed each sweep.
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=settings.queued_job_requeue_seconds)
+    async with async_session_maker() as db:
+        locked = await db.scalar(text(f"SELECT pg_try_advisory_xact_lock({SWEEPER_LOCK_KEY})"))
+        if not locked:
+            return 0
+        result = await db.execute(
+            select(Job)
+            .where(
+                Job.status == JobStatus.QUEUED.value,
+                or_(
+                    Job.enqueued_at < cutoff,
+                    and_(Job.enqueued_at.is_(None), Job.created_at < cutoff),
+                ),
+                ~exists().where(JobOutbox.job_id == Job.id),
+            )
+            .limit(limit)
+        )
+        stale = result.scalars().all()
+        queued = await still_queued([(str(job.id), job.lane) for job in stale])
+        jobs = [job for job in stale if str(job.id) not in queued]
+        for job in stale:
+            job.enqueued_at = func.now()  # Not swept again until the threshold passes anew
+        for job in jobs:
+            db.add(JobOutbox(job_id=job.id, payload=job_dispatch_payload(job)))
+        await db.commit()
+    if jobs:
+        logger.warning("Requeued %d stale QUEUED job(s)", len(jobs))
+        quantlix_outbox_requeued_total.inc(len(jobs))
+        notify_outbox()
+    return len(jobs)
+
+
+async def sweep_stale_batches(limit: int = 100) -> int:
+    """
+    Re-dispatch unfinished batches that made no progress for queued_job_requeue_seconds and whose
+    part is not leased (message lost, or the worker died and its lease ran out). Returns the count.
+    """
+    now = datetime.now(timezone.utc)
+    cutoff = now - timedelta(seconds=settings.queued_job_requeue_seconds)
+    async with async_session_maker() as db:
+        locked = await db.scalar(text(f"SELECT pg_try_advisory_xact_lock({SWEEPER_LOCK_KEY})"))
+        if not locked:
+            return 0
+        result = await db.execute(
+            select(Batch)
+            .where(
+                Batch.status.in_([JobStatus.QUEUED.value, JobStatus.RUNNING.value]),
+                Batch.updated_at < cutoff,
+                or_(Batch.lease_until.is_(None), Batch.lease_until < now),
+                ~exists().where(JobOutbox.job_id == Batch.id),
+            )
+            .limit(limit)
+        )
+        batches = result.scalars().all()
+        for batch in batches:
+            add_batch_to_outbox(db, batch)
+            batch.updated_at = func.now()  # Not swept again until the threshold passes anew
+        await db.commit()
+    if batches:
+        logger.warning("Re-dispatched %d stalled batch(es)", len(batches))
+        quantlix_outbox_requeued_total.inc(len(batches))
+        notify_outbox()
+    return len(batches)
+
+
+async def sweep_stale_rollouts(limit: int = 100) -> int:
+    """
+    Re-dispatch rollouts never picked up within queued_job_requeue_seconds, and restart those
+    DEPLOYING for rollout_stale_seconds (their worker died). Returns the count.
+    """
+    now = datetime.now(timezone.utc)
+    queued_cutoff = now - timedelta(seconds=settings.queued_job_requeue_seconds)
+    deploying_cutoff = now - timedelta(seconds=settings.rollout_stale_seconds)
+    async with async_session_maker() as db:
+        locked = await db.scalar(text(f"SELECT pg_try_advisory_xact_lock({SWEEPER_LOCK_KEY})"))
+        if not locked:
+            return 0
+        result = await db.execute(
+            select(Deployment)
+            .where(
+                Deployment.rollout_id.is_not(None),
+                or_(
+                    and_(Deployment.status == DeploymentStatus.PENDING.value, Deployment.updated_at < queued_cutoff),
+                    and_(Deployment.status == DeploymentStatus.DEPLOYING.value, Deployment.updated_at < deploying_cutoff),
+                ),
+                ~exists().where(JobOutbox.job_id == Deployment.id),
+            )
+            .limit(limit)
+        )
+        deployments = result.scalars().all()
+        for deployment in deployments:
+            add_rollout_to_outbox(db, deployment)
+            deployment.updated_at = func.now()  # Not swept again until the threshold passes anew
+        await db.commit()
+    if deployments:
+        logger.warning("Re-dispatched %d stalled rollout(s)", len(deployments))
+        quantlix_outbox_requeued_total.inc(len(deployments))
+        notify_outbox()
+    return len(deployments)
+
+
+async def run_outbox_sweeper() -> None:
+    while True:
+        await asyncio.sleep(SWEEP_INTERVAL_SECONDS)
+        try:
+            await sweep_stale_jobs()
+            await sweep_stale_batches()
+            await sweep_stale_rollouts()
+        except Exception as e:
+            logger.exception("Outbox sweep failed: %s", e)
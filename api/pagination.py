@@ -0,0 +1,47 @@
+"""
+Keyset (cursor) pagination for newest-first listings.
+A cursor encodes the (timestamp, id) of the last row on a page; the next page is every row
+strictly before it in (timestamp DESC, id DESC) order. With a matching (user_id, ts, id) index
+each page is an index range scan, so page 1000 costs the same as page 1.
+"""
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from fastapi import HTTPException, status
+from sqlalchemy import ColumnElement, literal, tuple_
+from sqlalchemy.orm import InstrumentedAttribute
+
+
+def encode_cursor(ts: datetime, row_id: str) -> str:
+    raw = json.dumps([ts.isoformat(), row_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        ts, row_id = json.loads(raw)
+        return datetime.fromisoformat(ts), str(row_id)
+    except (binascii.Error, ValueError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor",
+        )
+
+
+def before_cursor(
+    ts_col: InstrumentedAttribute, id_col: InstrumentedAttribute, cursor: str
+) -> ColumnElement[bool]:
+    """Row-value comparison (ts, id) < cursor — usable as an index condition by Postgres."""
+    ts, row_id = decode_cursor(cursor)
+    return tuple_(ts_col, id_col) < tuple_(literal(ts, ts_col.type), literal(row_id, id_col.type))
+
+
+def next_cursor(rows: list, limit: int, ts_attr: str) -> str | None:
+    """Cursor for the page after rows (fetched with limit + 1), or None on the last page."""
+    if len(rows) <= limit:
+        return None
+    last = rows[limit - 1]
+    return encode_cursor(getattr(last, ts_attr), str(last.id))
@@ -0,0 +1,182 @@
+"""
+Monthly range partitions for jobs and usage_records.
+- ensure_partitions: create upcoming months ahead of time (inserts fail without a partition)
+- archive_expired_partitions: export partitions past retention to gzip JSONL in MinIO, delete the
+  offloaded payloads of their jobs, then drop
+Dropping a partition is O(1) regardless of row count; usage totals survive in usage_rollups.
+The export runs in its own read transaction, and DETACH ... CONCURRENTLY never takes an ACCESS
+EXCLUSIVE lock on the parent, so inserts and queries keep running throughout.
+"""
+import asyncio
+import gzip
+import logging
+import re
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from api.config import settings
+from api.db import engine
+from api.storage import delete_objects, upload_file
+
+logger = logging.getLogger(__name__)
+
+PARTITIONED_TABLES = ("jobs", "usage_records")
+MAINTENANCE_LOCK_KEY = 7_201_002
+_UPPER_BOUND_RE = re.compile(r"TO \('([^']+)'\)")
+
+
+def month_start(dt: datetime) -> datetime:
+    return datetime(dt.year, dt.month, 1, tzinfo=timezone.utc)
+
+
+def next_month(dt: datetime) -> datetime:
+    return datetime(dt.year + dt.month // 12, dt.month % 12 + 1, 1, tzinfo=timezone.utc)
+
+
+def partition_name(table: str, start: datetime) -> str:
+    return f"{table}_p{start:%Y_%m}"
+
+
+async def _partition_upper_bounds(conn: AsyncConnection, table: str) -> dict[str, datetime | None]:
+    """Map partition name -> exclusive upper bound (None for MAXVALUE)."""
+    result = await conn.execute(
+        text(
+            "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) "
+            "FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = to_regclass(:t)"
+        ),
+        {"t": table},
+    )
+    bounds: dict[str, datetime | None] = {}
+    for name, expr in result.all():
+        match = _UPPER_BOUND_RE.search(expr or "")
+        bounds[name] = datetime.fromisoformat(match.group(1)) if match else None
+    return bounds
+
+
+async def ensure_partitions(conn: AsyncConnection, months_ahead: int | None = None) -> None:
+    """Create monthly partitions from the current month through months_ahead."""
+    months_ahead = settings.partition_premake_months if months_ahead is None else months_ahead
+    for table in PARTITIONED_TABLES:
+        bounds = await _partition_upper_bounds(conn, table)
+        covered_until = max((b for b in bounds.values() if b is not None), default=None)
+        start = month_start(datetime.now(timezone.utc))
+        for _ in range(months_ahead + 1):
+            end = next_month(start)
+            if covered_until is None or start >= covered_until:
+                await conn.execute(
+                    text(
+                        f"CREATE TABLE IF NOT EXISTS {partition_name(table, start)} PARTITION OF {table} "
+                        f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+                    )
+                )
+            start = end
+
+
+async def _archive_partition(conn: AsyncConnection, table: str, partition: str) -> str:
+    """
+    Stream a partition's rows as gzip JSONL into the archive bucket. Returns the object ref.
+    Runs in the caller's transaction; commit it before detaching.
+    """
+    with tempfile.NamedTemporaryFile(suffix=".jsonl.gz") as tmp:
+        with gzip.open(tmp.name, "wt", encoding="utf-8") as gz:
+            # Explicit cursor: a driver-level stream stays open until commit and blocks the DROP
+            await conn.execute(
+                text(f"DECLARE archive_cur NO SCROLL CURSOR FOR SELECT row_to_json(p)::text FROM {partition} p")
+            )
+            while rows := (await conn.execute(text("FETCH 1000 FROM archive_cur"))).all():
+                await asyncio.to_thread(gz.writelines, [row[0] + "\n" for row in rows])
+            await conn.execute(text("CLOSE archive_cur"))
+        return await upload_file(
+            settings.minio_archive_bucket,
+            f"{table}/{partition}.jsonl.gz",
+            tmp.name,
+            content_type="application/gzip",
+        )
+
+
+async def _delete_job_payloads(conn: AsyncConnection, partition: str, upper: datetime) -> int:
+    """
+    Delete the input/output objects offloaded for a jobs partition's rows. Returns the count.
+    Output objects a newer job still points at (result cache hits, coalesced followers) are kept.
+    Runs in the caller's transaction; a failed delete raises, so the partition is kept for next run.
+    """
+    deleted = 0
+    await conn.execute(
+        text(
+            f"DECLARE payload_cur NO SCROLL CURSOR FOR "
+            f"SELECT input_ref FROM {partition} WHERE input_ref IS NOT NULL "
+            f"UNION SELECT output_ref FROM {partition} WHERE output_ref IS NOT NULL "
+            f"EXCEPT SELECT output_ref FROM jobs WHERE created_at >= '{upper.isoformat()}' AND output_ref IS NOT NULL"
+        )
+    )
+    while rows := (await conn.execute(text("FETCH 1000 FROM payload_cur"))).all():
+        await delete_objects([row[0] for row in rows])
+        deleted += len(rows)
+    await conn.execute(text("CLOSE payload_cur"))
+    return deleted
+
+
+async def _detach_and_drop(table: str, partition: str) -> None:
+    """
+    DETACH ... CONCURRENTLY (own connection: it cannot run inside a transaction block), then drop.
+    A detach interrupted on an earlier run left the partition pending; FINALIZE completes it.
+    """
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        pending = await conn.scalar(
+            text("SELECT inhdetachpending FROM pg_inherits WHERE inhrelid = to_regclass(:p)"),
+            {"p": partition},
+        )
+        mode = "FINALIZE" if pending else "CONCURRENTLY"
+        await conn.execute(text(f"ALTER TABLE {table} DETACH PARTITION {partition} {mode}"))
+        await conn.execute(text(f"DROP TABLE {partition}"))
+
+
+async def archive_expired_partitions(conn: AsyncConnection) -> list[str]:
+    """
+    Archive, delete job payloads, then drop partitions entirely older than data_retention_days.
+    Returns dropped names.
+    conn must not be in a transaction: each archive commits before its partition is detached.
+    """
+    if settings.data_retention_days <= 0:
+        return []
+    cutoff = datetime.now(timezone.utc) - timedelta(days=settings.data_retention_days)
+    dropped: list[str] = []
+    for table in PARTITIONED_TABLES:
+        bounds = await _partition_upper_bounds(conn, table)
+        await conn.commit()
+        for partition, upper in sorted(bounds.items(), key=lambda kv: kv[1] or datetime.max.replace(tzinfo=timezone.utc)):
+            if upper is None or upper > cutoff:
+                continue
+            ref = await _archive_partition(conn, table, partition)
+            await conn.commit()
+            if table == "jobs":
+                payloads = await _delete_job_payloads(conn, partition, upper)
+                await conn.commit()
+                logger.info("Deleted %d offloaded payload(s) of partition %s", payloads, partition)
+            await _detach_and_drop(table, partition)
+            logger.info("Dropped partition %s (archived to %s)", partition, ref)
+            dropped.append(partition)
+    return dropped
+
+
+async def run_partition_maintenance() -> None:
+    """Premake upcoming partitions and retire expired ones. Safe to run from several processes."""
+    async with engine.connect() as conn:
+        # Session-level lock: held across the separate transactions below
+        locked = await conn.scalar(text(f"SELECT pg_try_advisory_lock({MAINTENANCE_LOCK_KEY})"))
+        await conn.commit()
+        if not locked:
+            return
+        try:
+            await ensure_partitions(conn)
+            await conn.commit()
+            await archive_expired_partitions(conn)
+        finally:
+            await conn.rollback()
+            await conn.execute(text(f"SELECT pg_advisory_unlock({MAINTENANCE_LOCK_KEY})"))
+            await conn.commit()
@@ -1,12 +1,29 @@
-"""Redis queue for inference jobs."""
+"""
+Redis queue for inference jobs.
+Each lane is a ZSET of job ids scored by deadline (epoch seconds), so workers pop the earliest
+deadline first; jobs without one are scored queue_default_deadline_seconds after they were
+created. The messages live in one hash keyed by job id, so a queued job can be removed (cancel)
+by id. A second ZSET per lane scores the same ids by creation time, for the oldest-wait metric.
+"""
 import json
+import time
+from functools import lru_cache
 from typing import Any
 
 from redis.asyncio import Redis
 
 from api.config import settings
 
-INFERENCE_QUEUE = "inference:queue"
+INFERENCE_QUEUE = "inference:jobs:interactive"
+BATCH_QUEUE = "inference:jobs:batch"
+QUEUE_PAYLOADS = "inference:payloads"  # job id -> queue message
+DEFAULT_LANE = "interactive"
+BATCH_LANE = "batch"  # Shed /run load and bulk batches (api.batches)
+# Lane name -> Redis ZSET. Workers BZPOPMIN them in this order, so batch only runs when interactive is empty.
+QUEUE_LANES: dict[str, str] = {DEFAULT_LANE: INFERENCE_QUEUE, BATCH_LANE: BATCH_QUEUE}
+# Lane name -> ZSET of the same ids scored by created_at (EDF order says nothing about wait time)
+QUEUE_AGES: dict[str, str] = {lane: f"inference:queued_since:{lane}" for lane in QUEUE_LANES}
+SERVED_BUCKET_SECONDS = 10  # Granularity of the per-lane completion counters behind wait estimates
 
 
 async def get_redis() -> Redis:
@@ -14,10 +31,123 @@ async def get_redis() -> Redis:
     return Redis.from_url(settings.redis_url, decode_responses=True)
 
 
-async def enqueue_job(job_id: str, payload: dict[str, Any]) -> None:
-    """Push inference job to Redis queue."""
-    redis = await get_redis()
-    try:
-        await redis.rpush(INFERENCE_QUEUE, json.dumps({"job_id": job_id, **payload}))
-    finally:
-        await redis.aclose()
+@lru_cache
+def shared_redis() -> Redis:
+    """Process-wide client over one connection pool, for hot paths. Do not close per request."""
+    return Redis.from_url(settings.redis_url, decode_responses=True)
+
+
+def in_flight_key(user_id: str) -> str:
+    """ZSET of a user's queued/running job ids, scored by lease expiry (see api.rate_limit)."""
+    return f"inflight:{user_id}"
+
+
+async def release_in_flight(user_id: str, job_id: str) -> None:
+    """Free a job's in-flight slot once it reaches a terminal state."""
+    await shared_redis().zrem(in_flight_key(user_id), job_id)
+
+
+def cancel_key(job_id: str) -> str:
+    """List the worker running a job BLPOPs on; a push means the job was cancelled."""
+    return f"inference:cancel:{job_id}"
+
+
+async def signal_cancel(job_id: str) -> None:
+    """Tell the worker running job_id to stop it (see orchestrator.worker)."""
+    key = cancel_key(job_id)
+    pipe = shared_redis().pipeline(transaction=False)
+    pipe.lpush(key, "1")
+    pipe.expire(key, settings.in_flight_lease_seconds)  # No worker left to read it after the lease
+    await pipe.execute()
+
+
+def served_key(lane: str, bucket: int) -> str:
+    """Jobs finished from a lane during one SERVED_BUCKET_SECONDS bucket (see api.admission)."""
+    return f"queue:served:{lane}:{bucket}"
+
+
+async def record_served(lane: str) -> None:
+    """Count a finished job towards its lane's recent service rate."""
+    key = served_key(lane, int(time.time()) // SERVED_BUCKET_SECONDS)
+    pipe = shared_redis().pipeline(transaction=False)
+    pipe.incr(key)
+    pipe.expire(key, SERVED_BUCKET_SECONDS * 12)
+    await pipe.execute()
+
+
+async def enqueue_jobs(jobs: list[tuple[str, dict[str, Any]]]) -> None:
+    """
+    Queue (job_id, payload) pairs in one MULTI: messages into QUEUE_PAYLOADS, ids into their lane
+    (payload "lane", default interactive) scored by payload "deadline", else by payload
+    "created_at" (epoch seconds; push time if absent) plus queue_default_deadline_seconds.
+    Called by the outbox relay only. Re-pushing a job still in the queue (sweeper) refreshes its
+    message but never its position (ZADD NX), so requeues cannot push old jobs back.
+    """
+    if not jobs:
+        return
+    now = time.time()
+    messages: dict[str, str] = {}
+    by_lane: dict[str, dict[str, float]] = {}
+    since_by_lane: dict[str, dict[str, float]] = {}
+    for job_id, payload in jobs:
+        messages[job_id] = json.dumps({"job_id": job_id, **payload})
+        since = payload.get("created_at") or now
+        lane = payload.get("lane", DEFAULT_LANE)
+        lane = lane if lane in QUEUE_LANES else DEFAULT_LANE
+        by_lane.setdefault(lane, {})[job_id] = payload.get("deadline") or since + settings.queue_default_deadline_seconds
+        since_by_lane.setdefault(lane, {})[job_id] = since
+    pipe = shared_redis().pipeline(transaction=True)
+    pipe.hset(QUEUE_PAYLOADS, mapping=messages)
+    for lane, scores in by_lane.items():
+        pipe.zadd(QUEUE_LANES[lane], scores, nx=True)
+        pipe.zadd(QUEUE_AGES[lane], since_by_lane[lane], nx=True)
+    await pipe.execute()
+
+
+async def pop_job(redis: Redis, timeout: int) -> tuple[str, dict[str, Any]] | None:
+    """
+    Block until a job is queued; returns (lane, message) for the earliest deadline in the first
+    non-empty lane. None on timeout, or if the message is gone (job removed from the queue).
+    """
+    popped = await redis.bzpopmin(list(QUEUE_LANES.values()), timeout=timeout)
+    if not popped:
+        return None
+    queue, job_id, _ = popped
+    lane = next(name for name, key in QUEUE_LANES.items() if key == queue)
+    pipe = redis.pipeline(transaction=True)
+    pipe.hget(QUEUE_PAYLOADS, job_id)
+    pipe.hdel(QUEUE_PAYLOADS, job_id)
+    pipe.zrem(QUEUE_AGES[lane], job_id)
+    raw, _, _ = await pipe.execute()
+    if raw is None:
+        return None
+    return lane, json.loads(raw)
+
+
+async def remove_queued(job_id: str) -> None:
+    """Take a job out of every lane before a worker pops it."""
+    pipe = shared_redis().pipeline(transaction=True)
+    for queue in (*QUEUE_LANES.values(), *QUEUE_AGES.values()):
+        pipe.zrem(queue, job_id)
+    pipe.hdel(QUEUE_PAYLOADS, job_id)
+    await pipe.execute()
+
+
+async def still_queued(jobs: list[tuple[str, str | None]]) -> set[str]:
+    """
+    Of (job_id, lane) pairs, the ids still waiting in their lane with their message in place
+    (ZMSCORE per lane, one HMGET), so the sweeper leaves them alone.
+    """
+    if not jobs:
+        return set()
+    by_lane: dict[str, list[str]] = {}
+    for job_id, lane in jobs:
+        by_lane.setdefault(lane if lane in QUEUE_LANES else DEFAULT_LANE, []).append(job_id)
+    pipe = shared_redis().pipeline(transaction=False)
+    for lane, ids in by_lane.items():
+        pipe.zmscore(QUEUE_LANES[lane], ids)
+    ids = [job_id for lane_ids in by_lane.values() for job_id in lane_ids]
+    pipe.hmget(QUEUE_PAYLOADS, ids)
+    *scores, messages = await pipe.execute()
+    in_lane = [score is not None for lane_scores in scores for score in lane_scores]
+    return {job_id for job_id, queued, raw in zip(ids, in_lane, messages) if queued and raw is not None}
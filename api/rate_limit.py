@@ -1,28 +1,282 @@
-"""Redis-based rate limiting for auth endpoints."""
+"""
+Redis-based rate limiting (sliding-window log).
+- Auth and demo endpoints: per IP (and per email), fixed limits in RATE_LIMITS
+- Authenticated API: per API key and per user, sized by plan (PLAN_RATE_LIMITS), plus a cap
+  on in-flight jobs for /run. Responses carry RateLimit-* headers.
+
+Every auth/demo limit is a row in RATE_LIMITS. A check is one EVALSHA of a Lua script that evaluates
+all keys of a request together (all-or-nothing) against Redis' clock, so there is no
+INCR/EXPIRE race. Each key is a ZSET of admitted requests scored by time: a request is admitted
+while fewer than `limit` fall within the last `window` seconds, so every span of `window` seconds
+admits exactly up to `limit` (no 2x burst across fixed-window boundaries, no tighter than that).
+
+A per-process mirror of the same log rejects floods locally. It only ever lags Redis (it sees a
+subset of admitted requests), so a local rejection is always one Redis would also make.
+"""
 from __future__ import annotations
 
-from fastapi import Request
-from redis.asyncio import Redis
+import time
+from collections import OrderedDict, deque
+from collections.abc import Awaitable, Callable, Sequence
+from dataclasses import dataclass, field
+from typing import Annotated
+
+from fastapi import Depends, HTTPException, Request, Response, status
 
-from api.queue import get_redis
+from api.auth import CurrentUser, KeyOwner, api_key_header, hash_api_key
+from api.config import settings
+from api.models import PLAN_RATE_LIMITS, User, UserPlan
+from api.queue import in_flight_key, shared_redis
 from api.schemas import ResendVerificationRequest
 
-RATE_LIMIT_SIGNUP = 5
-RATE_LIMIT_SIGNUP_WINDOW = 3600  # 1 hour
-RATE_LIMIT_LOGIN = 10
-RATE_LIMIT_LOGIN_WINDOW = 900  # 15 minutes
-RATE_LIMIT_VERIFY = 20
-RATE_LIMIT_VERIFY_WINDOW = 900  # 15 minutes
-RATE_LIMIT_RESEND = 3
-RATE_LIMIT_RESEND_WINDOW = 3600  # 1 hour
-RATE_LIMIT_PASSWORD_CHECK = 30
-RATE_LIMIT_PASSWORD_CHECK_WINDOW = 900  # 15 minutes
-RATE_LIMIT_FORGOT_PASSWORD = 3
-RATE_LIMIT_FORGOT_PASSWORD_WINDOW = 3600  # 1 hour
-RATE_LIMIT_RESET_PASSWORD = 10
-RATE_LIMIT_RESET_PASSWORD_WINDOW = 900  # 15 minutes
-RATE_LIMIT_DEMO = 20
-RATE_LIMIT_DEMO_WINDOW = 3600  # 1 hour per IP
+KEY_PREFIX = "ratelimit"
+LOCAL_MAX_KEYS = 10_000
+IN_FLIGHT_RETRY_AFTER_SECONDS = 2
+
+
+@dataclass(frozen=True)
+class RateLimit:
+    """At most `limit` requests per `window` seconds, per identity (IP, email, ...)."""
+
+    name: str
+    limit: int
+    window: int
+
+    @property
+    def window_ms(self) -> int:
+        return self.window * 1000
+
+    def key(self, identity: str) -> str:
+        return f"{KEY_PREFIX}:{self.name}:{identity}"
+
+
+RATE_LIMITS: dict[str, RateLimit] = {
+    limit.name: limit
+    for limit in (
+        RateLimit("signup", limit=5, window=3600),
+        RateLimit("login", limit=10, window=900),
+        RateLimit("verify", limit=20, window=900),
+        RateLimit("resend", limit=3, window=3600),  # per IP and per email
+        RateLimit("password_check", limit=30, window=900),
+        RateLimit("forgot_password", limit=3, window=3600),
+        RateLimit("reset_password", limit=10, window=900),
+        RateLimit("demo", limit=20, window=3600),
+    )
+}
+
+
+@dataclass
+class RateLimitResult:
+    allowed: bool
+    retry_after_seconds: int = 0
+    remaining: int = 0
+    limited_by: str | None = None  # RateLimit.name or "in_flight" when rejected
+    in_flight: int = 0
+    reset_seconds: int = 0  # Until every checked window is empty again
+    peeked: list[tuple[str | None, int]] = field(default_factory=list)  # (value, pttl) per peek key
+
+
+# KEYS: window-log keys, then optionally one in-flight ZSET, then keys to read back ("peek").
+# ARGV: cost, number of log keys, 1 if a ZSET follows, limit/window_ms per log key,
+#       then for the ZSET: max in flight, member (job id), lease_ms.
+# Nothing is written unless every check passes.
+# Returns {allowed, retry_after_ms, remaining, rejected key index (1-based, 0 if allowed), in flight,
+#          ms until every log key is empty again, then value and PTTL of each peeked key}.
+_ADMISSION_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local cost = tonumber(ARGV[1])
+local n = tonumber(ARGV[2])
+local has_zset = tonumber(ARGV[3])
+local counts = {}
+local remaining = -1
+local reset = 0
+for i = 1, n do
+  local limit = tonumber(ARGV[2 + 2 * i])
+  local window = tonumber(ARGV[3 + 2 * i])
+  redis.call('ZREMRANGEBYSCORE', KEYS[i], '-inf', now - window)
+  local count = redis.call('ZCARD', KEYS[i])
+  local newest = redis.call('ZRANGE', KEYS[i], -1, -1, 'WITHSCORES')
+  local until_empty = newest[2] and (tonumber(newest[2]) + window - now) or 0
+  if count + cost > limit then
+    local wait = window
+    if cost <= limit then
+      -- Room opens when the (count + cost - limit)th oldest request leaves the window
+      local oldest = redis.call('ZRANGE', KEYS[i], count + cost - limit - 1, count + cost - limit - 1, 'WITHSCORES')
+      wait = tonumber(oldest[2]) + window - now
+    end
+    return {0, wait, 0, i, 0, until_empty}
+  end
+  counts[i] = count
+  if remaining < 0 or limit - count - cost < remaining then remaining = limit - count - cost end
+  if window > reset then reset = window end
+end
+local in_flight = 0
+if has_zset == 1 then
+  local zset = KEYS[n + 1]
+  local max_in_flight = tonumber(ARGV[4 + 2 * n])
+  local lease = tonumber(ARGV[6 + 2 * n])
+  redis.call('ZREMRANGEBYSCORE', zset, '-inf', now)  -- leases of jobs that never reported back
+  in_flight = redis.call('ZCARD', zset)
+  if in_flight >= max_in_flight then
+    return {0, 0, remaining + cost, n + 1, in_flight, reset}  -- rate not consumed
+  end
+  redis.call('ZADD', zset, now + lease, ARGV[5 + 2 * n])
+  redis.call('PEXPIRE', zset, lease)
+  in_flight = in_flight + 1
+end
+for i = 1, n do
+  -- Members only need to be unique: within one ms the count only grows
+  for j = 1, cost do
+    redis.call('ZADD', KEYS[i], now, now .. '-' .. (counts[i] + j))
+  end
+  redis.call('PEXPIRE', KEYS[i], tonumber(ARGV[3 + 2 * i]))
+end
+local result = {1, 0, remaining, 0, in_flight, reset}
+for i = n + has_zset + 1, #KEYS do
+  table.insert(result, redis.call('GET', KEYS[i]) or false)
+  table.insert(result, redis.call('PTTL', KEYS[i]))
+end
+return result
+"""
+
+
+class _LocalWindow:
+    """In-process copy of the window logs for keys this process has seen (bounded LRU)."""
+
+    def __init__(self, max_keys: int = LOCAL_MAX_KEYS) -> None:
+        self._logs: OrderedDict[str, deque[float]] = OrderedDict()
+        self._blocked_until: dict[str, float] = {}
+        self._max_keys = max_keys
+
+    def retry_after_ms(self, limit: RateLimit, key: str, now: float, cost: int) -> float:
+        wait = self._blocked_until.get(key, 0) - now
+        log = self._logs.get(key)
+        if log is not None:
+            while log and log[0] <= now - limit.window_ms:
+                log.popleft()
+            if len(log) + cost > limit.limit and cost <= limit.limit:
+                wait = max(wait, log[len(log) + cost - limit.limit - 1] + limit.window_ms - now)
+        return wait
+
+    def admitted(self, limit: RateLimit, key: str, now: float, cost: int) -> None:
+        self._touch(limit, key).extend([now] * cost)
+
+    def rejected(self, limit: RateLimit, key: str, now: float, retry_after_ms: int, cost: int) -> None:
+        # Redis' log only loses entries with time, so it refuses this key until then
+        self._touch(limit, key)
+        self._blocked_until[key] = now + retry_after_ms
+
+    def _touch(self, limit: RateLimit, key: str) -> deque[float]:
+        log = self._logs.get(key)
+        if log is None:
+            log = self._logs[key] = deque(maxlen=limit.limit)
+        self._logs.move_to_end(key)
+        while len(self._logs) > self._max_keys:
+            evicted, _ = self._logs.popitem(last=False)
+            self._blocked_until.pop(evicted, None)
+        return log
+
+
+@dataclass(frozen=True)
+class InFlightLimit:
+    """Reserve one of `limit` concurrent job slots for `member` until released or lease expiry."""
+
+    key: str
+    limit: int
+    member: str
+    lease_seconds: int
+
+
+_local = _LocalWindow()
+_script = None
+
+
+def _admission_script():
+    global _script
+    if _script is None:
+        _script = shared_redis().register_script(_ADMISSION_SCRIPT)  # EVALSHA, EVAL on NOSCRIPT
+    return _script
+
+
+async def check_rate_limits(
+    checks: Sequence[tuple[RateLimit, str]],
+    cost: int = 1,
+    in_flight: InFlightLimit | None = None,
+    peek: Sequence[str] = (),
+) -> RateLimitResult:
+    """
+    Consume `cost` from every (limit, identity) pair and reserve the in-flight slot, or do
+    none of it if any check fails. When admitted, also returns the value and PTTL of each
+    `peek` key (other per-request state read in the same round-trip).
+    """
+    keyed = [(limit, limit.key(identity)) for limit, identity in checks]
+    now = time.time() * 1000
+
+    for limit, key in keyed:
+        wait_ms = _local.retry_after_ms(limit, key, now, cost)
+        if wait_ms > 0:
+            return RateLimitResult(
+                allowed=False,
+                retry_after_seconds=_ceil_seconds(wait_ms),
+                limited_by=limit.name,
+                reset_seconds=_ceil_seconds(wait_ms),
+            )
+
+    keys = [key for _, key in keyed]
+    args: list[int | str] = [cost, len(keyed), 1 if in_flight else 0]
+    for limit, _ in keyed:
+        args += [limit.limit, limit.window_ms]
+    if in_flight:
+        keys.append(in_flight.key)
+        args += [in_flight.limit, in_flight.member, in_flight.lease_seconds * 1000]
+    keys += peek
+    reply = await _admission_script()(keys=keys, args=args)
+    allowed, retry_after_ms, remaining, rejected_index, in_flight_count, reset_ms = reply[:6]
+
+    if not allowed:
+        if int(rejected_index) > len(keyed):
+            # Slots free up as jobs finish; leases only bound jobs that never report back
+            return RateLimitResult(
+                allowed=False,
+                retry_after_seconds=IN_FLIGHT_RETRY_AFTER_SECONDS,
+                remaining=int(remaining),
+                limited_by="in_flight",
+                in_flight=int(in_flight_count),
+                reset_seconds=_ceil_seconds(int(reset_ms)),
+            )
+        limit, key = keyed[int(rejected_index) - 1]
+        _local.rejected(limit, key, now, int(retry_after_ms), cost)
+        return RateLimitResult(
+            allowed=False,
+            retry_after_seconds=_ceil_seconds(int(retry_after_ms)),
+            limited_by=limit.name,
+            reset_seconds=_ceil_seconds(int(reset_ms)),
+        )
+    for limit, key in keyed:
+        _local.admitted(limit, key, now, cost)
+    return RateLimitResult(
+        allowed=True,
+        remaining=int(remaining),
+        in_flight=int(in_flight_count),
+        reset_seconds=_ceil_seconds(int(reset_ms)),
+        peeked=[(value, int(pttl)) for value, pttl in zip(reply[6::2], reply[7::2])],
+    )
+
+
+async def enforce_rate_limits(checks: Sequence[tuple[RateLimit, str]]) -> None:
+    """Raise 429 with Retry-After when any limit is exhausted."""
+    result = await check_rate_limits(checks)
+    if not result.allowed:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many requests. Please try again later.",
+            headers={"Retry-After": str(result.retry_after_seconds)},
+        )
+
+
+def _ceil_seconds(ms: float) -> int:
+    return max(0, -(-int(ms) // 1000))
 
 
 def _client_ip(request: Request) -> str:
@@ -38,159 +292,113 @@ def _client_ip(request: Request) -> str:
     return "unknown"
 
 
-async def _check_rate_limit(
-    redis: Redis,
-    key: str,
-    limit: int,
-    window: int,
-) -> None:
-    """Increment counter and raise 429 if over limit."""
-    count = await redis.incr(key)
-    if count == 1:
-        await redis.expire(key, window)
-    if count > limit:
-        from fastapi import HTTPException
-
-        raise HTTPException(
-            status_code=429,
-            detail="Too many requests. Please try again later.",
-        )
+def _email_key_safe(email: str) -> str:
+    """Make email safe for Redis key (no colons etc)."""
+    return email.strip().lower().replace("@", "_at_")
 
 
-async def rate_limit_signup(request: Request) -> None:
-    """Rate limit signup: 5 attempts per hour per IP."""
-    ip = _client_ip(request)
-    key = f"rate_limit:auth:signup:{ip}"
-    redis = await get_redis()
-    try:
-        await _check_rate_limit(
-            redis,
-            key,
-            limit=RATE_LIMIT_SIGNUP,
-            window=RATE_LIMIT_SIGNUP_WINDOW,
-        )
-    finally:
-        await redis.aclose()
+def limit_by_ip(name: str) -> Callable[[Request], Awaitable[None]]:
+    """FastAPI dependency enforcing RATE_LIMITS[name] per client IP."""
+    limit = RATE_LIMITS[name]
 
+    async def dependency(request: Request) -> None:
+        await enforce_rate_limits([(limit, f"ip:{_client_ip(request)}")])
 
-async def rate_limit_login(request: Request) -> None:
-    """Rate limit login: 10 attempts per 15 minutes per IP."""
-    ip = _client_ip(request)
-    key = f"rate_limit:auth:login:{ip}"
-    redis = await get_redis()
-    try:
-        await _check_rate_limit(
-            redis,
-            key,
-            limit=RATE_LIMIT_LOGIN,
-            window=RATE_LIMIT_LOGIN_WINDOW,
-        )
-    finally:
-        await redis.aclose()
+    dependency.__name__ = f"rate_limit_{name}"
+    return dependency
 
 
-async def rate_limit_verify(request: Request) -> None:
-    """Rate limit verify: 20 attempts per 15 minutes per IP."""
-    ip = _client_ip(request)
-    key = f"rate_limit:auth:verify:{ip}"
-    redis = await get_redis()
-    try:
-        await _check_rate_limit(
-            redis,
-            key,
-            limit=RATE_LIMIT_VERIFY,
-            window=RATE_LIMIT_VERIFY_WINDOW,
-        )
-    finally:
-        await redis.aclose()
+rate_limit_signup = limit_by_ip("signup")
+rate_limit_login = limit_by_ip("login")
+rate_limit_verify = limit_by_ip("verify")
+rate_limit_password_check = limit_by_ip("password_check")
+rate_limit_forgot_password = limit_by_ip("forgot_password")
+rate_limit_reset_password = limit_by_ip("reset_password")
+rate_limit_demo = limit_by_ip("demo")
 
 
-async def rate_limit_demo(request: Request) -> None:
-    """Rate limit demo: 20 attempts per hour per IP."""
-    ip = _client_ip(request)
-    key = f"rate_limit:demo:{ip}"
-    redis = await get_redis()
-    try:
-        await _check_rate_limit(
-            redis,
-            key,
-            limit=RATE_LIMIT_DEMO,
-            window=RATE_LIMIT_DEMO_WINDOW,
-        )
-    finally:
-        await redis.aclose()
+async def rate_limit_resend(request: Request, body: ResendVerificationRequest) -> None:
+    """Rate limit resend per IP and per email, in one atomic check."""
+    limit = RATE_LIMITS["resend"]
+    await enforce_rate_limits([
+        (limit, f"ip:{_client_ip(request)}"),
+        (limit, f"email:{_email_key_safe(body.email)}"),
+    ])
 
 
-def _email_key_safe(email: str) -> str:
-    """Make email safe for Redis key (no colons etc)."""
-    return email.strip().lower().replace("@", "_at_")
+# --- Authenticated API: per API key and per user, sized by plan ---
 
 
-async def rate_limit_resend(request: Request, body: ResendVerificationRequest) -> None:
-    """Rate limit resend: 3 attempts per hour per IP and per email."""
-    ip = _client_ip(request)
-    email_safe = _email_key_safe(body.email)
-    redis = await get_redis()
+def plan_rate_limits(plan: str | None) -> tuple[RateLimit, RateLimit, int]:
+    """(per-API-key limit, per-user limit, max in-flight jobs) for a plan."""
     try:
-        await _check_rate_limit(
-            redis,
-            f"rate_limit:auth:resend:ip:{ip}",
-            limit=RATE_LIMIT_RESEND,
-            window=RATE_LIMIT_RESEND_WINDOW,
-        )
-        await _check_rate_limit(
-            redis,
-            f"rate_limit:auth:resend:email:{email_safe}",
-            limit=RATE_LIMIT_RESEND,
-            window=RATE_LIMIT_RESEND_WINDOW,
-        )
-    finally:
-        await redis.aclose()
+        per_key, per_user, max_in_flight = PLAN_RATE_LIMITS[UserPlan(plan or UserPlan.FREE.value)]
+    except (ValueError, KeyError):
+        per_key, per_user, max_in_flight = PLAN_RATE_LIMITS[UserPlan.FREE]
+    return (
+        RateLimit("api_key", limit=per_key, window=60),
+        RateLimit("user", limit=per_user, window=60),
+        max_in_flight,
+    )
 
 
-async def rate_limit_password_check(request: Request) -> None:
-    """Rate limit password strength check: 30 per 15 min per IP."""
-    ip = _client_ip(request)
-    key = f"rate_limit:auth:password_check:{ip}"
-    redis = await get_redis()
-    try:
-        await _check_rate_limit(
-            redis,
-            key,
-            limit=RATE_LIMIT_PASSWORD_CHECK,
-            window=RATE_LIMIT_PASSWORD_CHECK_WINDOW,
-        )
-    finally:
-        await redis.aclose()
+def rate_limit_headers(result: RateLimitResult, limit: RateLimit) -> dict[str, str]:
+    """RateLimit-* response headers (IETF draft) for the per-key limit, plus Retry-After on 429."""
+    headers = {
+        "RateLimit-Limit": str(limit.limit),
+        "RateLimit-Remaining": str(result.remaining),
+        "RateLimit-Reset": str(result.reset_seconds),
+        "RateLimit-Policy": f"{limit.limit};w={limit.window}",
+    }
+    if not result.allowed:
+        headers["Retry-After"] = str(result.retry_after_seconds)
+    return headers
 
 
-async def rate_limit_forgot_password(request: Request) -> None:
-    """Rate limit forgot password: 3 per hour per IP."""
-    ip = _client_ip(request)
-    key = f"rate_limit:auth:forgot_password:{ip}"
-    redis = await get_redis()
-    try:
-        await _check_rate_limit(
-            redis,
-            key,
-            limit=RATE_LIMIT_FORGOT_PASSWORD,
-            window=RATE_LIMIT_FORGOT_PASSWORD_WINDOW,
+async def admit_request(
+    response: Response,
+    user: User | KeyOwner,
+    api_key: str | None,
+    *,
+    job_id: str | None = None,
+    peek: Sequence[str] = (),
+) -> RateLimitResult:
+    """
+    Per-key and per-user rate check; with job_id also reserves an in-flight slot for it.
+    Raises 429, or sets RateLimit-* headers and returns the result (with `peek` values).
+    """
+    per_key, per_user, max_in_flight = plan_rate_limits(user.plan)
+    checks = [(per_key, hash_api_key((api_key or "").strip())[:32]), (per_user, str(user.id))]
+    in_flight = None
+    if job_id:
+        in_flight = InFlightLimit(
+            key=in_flight_key(str(user.id)),
+            limit=max_in_flight,
+            member=job_id,
+            lease_seconds=settings.in_flight_lease_seconds,
+        )
+    result = await check_rate_limits(checks, in_flight=in_flight, peek=peek)
+    headers = rate_limit_headers(result, per_key)
+    if not result.allowed:
+        detail = (
+            f"Too many jobs in flight ({result.in_flight}/{max_in_flight}). Wait for one to finish."
+            if result.limited_by == "in_flight"
+            else "Too many requests. Please slow down."
+        )
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=detail,
+            headers=headers,
         )
-    finally:
-        await redis.aclose()
+    response.headers.update(headers)
+    return result
 
 
-async def rate_limit_reset_password(request: Request) -> None:
-    """Rate limit reset password: 10 per 15 min per IP."""
-    ip = _client_ip(request)
-    key = f"rate_limit:auth:reset_password:{ip}"
-    redis = await get_redis()
-    try:
-        await _check_rate_limit(
-            redis,
-            key,
-            limit=RATE_LIMIT_RESET_PASSWORD,
-            window=RATE_LIMIT_RESET_PASSWORD_WINDOW,
-        )
-    finally:
-        await redis.aclose()
+async def rate_limit_api(
+    response: Response,
+    user: CurrentUser,
+    api_key: Annotated[str | None, Depends(api_key_header)],
+) -> None:
+    """Per-key and per-user request rate for authenticated endpoints."""
+    await admit_request(response, user, api_key)
+
@@ -0,0 +1,166 @@
+"""
+Inference result cache for deterministic requests (opt-in per deployment).
+Enable with deployment config {"result_cache": true}; "result_cache_ttl" overrides the TTL.
+Entries are keyed by deployment id, a fingerprint of the deployment's model and config (so a new
+revision never serves old results) and a hash of the canonical JSON input, which includes the
+generation params. Sampled requests (temperature > 0 or do_sample without a seed) are never cached.
+Each deployment keeps at most result_cache_max_entries entries; the oldest are evicted first.
+A hit completes the job at /run without dispatching it; result_cache_billing decides what it costs.
+"""
+import hashlib
+import json
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Any
+
+from sqlalchemy import null
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.config import settings
+from api.metrics import quantlix_result_cache_requests_total
+from api.models import Deployment, Job, JobStatus
+from api.queue import shared_redis
+from api.usage_service import record_usage
+
+logger = logging.getLogger(__name__)
+
+RESULT_CACHE_PREFIX = "result_cache"
+# Job columns copied into a cache entry and back onto the job that hits it
+CACHED_JOB_FIELDS = (
+    "output_data", "output_ref", "tokens_used", "compute_seconds",
+    "score_input", "score_output", "score_final", "guardrail_flags", "policy_action",
+)
+
+# Writes the entry and its index slot, forgets index slots whose entry has expired, then trims the
+# index to ARGV[4] newest entries.
+# KEYS[1] = entry, KEYS[2] = per-deployment index ZSET (member = entry key, score = write time)
+# ARGV = entry JSON, ttl seconds, now (ms), max entries
+_STORE_SCRIPT = """
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', tonumber(ARGV[3]) - tonumber(ARGV[2]) * 1000)
+redis.call('ZADD', KEYS[2], ARGV[3], KEYS[1])
+redis.call('EXPIRE', KEYS[2], ARGV[2])
+local overflow = redis.call('ZCARD', KEYS[2]) - tonumber(ARGV[4])
+if overflow > 0 then
+  local evicted = redis.call('ZPOPMIN', KEYS[2], overflow)
+  for i = 1, #evicted, 2 do
+    redis.call('DEL', evicted[i])
+  end
+end
+return overflow
+"""
+
+_script = None
+
+
+def _store_script():
+    global _script
+    if _script is None:
+        _script = shared_redis().register_script(_STORE_SCRIPT)
+    return _script
+
+
+def cache_ttl(deployment: Deployment) -> int | None:
+    """TTL in seconds if the deployment opted in to result caching, else None."""
+    cfg = deployment.config or {}
+    if not cfg.get("result_cache"):
+        return None
+    return int(cfg.get("result_cache_ttl", settings.result_cache_ttl_seconds))
+
+
+def is_deterministic(input_payload: dict[str, Any]) -> bool:
+    """Sampling without a fixed seed gives a different answer per call; do not cache or share it."""
+    if input_payload.get("seed") is not None:
+        return True
+    temperature = input_payload.get("temperature")
+    if isinstance(temperature, (int, float)) and temperature > 0:
+        return False
+    return not input_payload.get("do_sample")
+
+
+def _digest(value: Any) -> str:
+    canonical = json.dumps(value, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def deployment_fingerprint(deployment: Deployment) -> str:
+    """Changes whenever the model or its config does (i.e. on every new revision)."""
+    cfg = {k: v for k, v in (deployment.config or {}).items() if not k.startswith("result_cache")}
+    return _digest([deployment.model_id, deployment.model_path, cfg])[:16]
+
+
+def request_fingerprint(deployment: Deployment, input_payload: dict[str, Any]) -> str:
+    """Identity of a (deployment revision, input + generation params) pair."""
+    return f"{deployment.id}:{deployment_fingerprint(deployment)}:{_digest(input_payload)}"
+
+
+def _index_key(deployment_id: str) -> str:
+    return f"{RESULT_CACHE_PREFIX}:index:{deployment_id}"
+
+
+def cacheable(deployment: Deployment, input_payload: dict[str, Any]) -> bool:
+    return cache_ttl(deployment) is not None and is_deterministic(input_payload)
+
+
+async def get_cached_result(deployment: Deployment, input_payload: dict[str, Any]) -> dict | None:
+    """Stored result fields for this request, or None (miss, not cacheable, or Redis error)."""
+    if not cacheable(deployment, input_payload):
+        return None
+    key = f"{RESULT_CACHE_PREFIX}:{request_fingerprint(deployment, input_payload)}"
+    try:
+        raw = await shared_redis().get(key)
+    except Exception as e:
+        logger.warning("Result cache lookup failed: %s", e)
+        return None
+    quantlix_result_cache_requests_total.labels(
+        deployment_id=str(deployment.id), result="hit" if raw else "miss"
+    ).inc()
+    return json.loads(raw) if raw else None
+
+
+async def store_result(deployment: Deployment, input_payload: dict[str, Any], result: dict[str, Any]) -> None:
+    """Cache a completed job's result fields. Failures are logged, never raised."""
+    ttl = cache_ttl(deployment)
+    if ttl is None or not is_deterministic(input_payload):
+        return
+    key = f"{RESULT_CACHE_PREFIX}:{request_fingerprint(deployment, input_payload)}"
+    try:
+        await _store_script()(
+            keys=[key, _index_key(str(deployment.id))],
+            args=[json.dumps(result), ttl, int(time.time() * 1000), settings.result_cache_max_entries],
+        )
+    except Exception as e:
+        logger.warning("Result cache store failed: %s", e)
+
+
+def cache_entry(job: Job) -> dict[str, Any]:
+    """Result fields of a COMPLETED job, as stored in the cache."""
+    return {field: getattr(job, field) for field in CACHED_JOB_FIELDS}
+
+
+async def complete_from_cache(db: AsyncSession, job: Job, deployment: Deployment, entry: dict[str, Any]) -> None:
+    """Fill a new job from a cache entry as COMPLETED and record usage per result_cache_billing."""
+    for field in CACHED_JOB_FIELDS:
+        setattr(job, field, entry.get(field))
+    if job.output_ref:
+        job.output_data = null()  # SQL NULL, not JSON null
+    job.status = JobStatus.COMPLETED.value
+    job.completed_at = datetime.now(timezone.utc)
+    job.guardrail_blocked = False
+    job.compute_seconds = 0.0  # Nothing ran; the original run time only matters for "full" billing
+
+    policy = settings.result_cache_billing
+    if policy == "none":
+        return
+    tokens = job.tokens_used or 0
+    secs = (entry.get("compute_seconds") or 0.0) if policy == "full" else 0.0
+    is_gpu = bool(deployment.config and deployment.config.get("gpu"))
+    await record_usage(
+        db,
+        user_id=str(job.user_id),
+        job_id=str(job.id),
+        tokens_used=tokens,
+        compute_seconds=0.0 if is_gpu else secs,
+        gpu_seconds=secs if is_gpu else 0.0,
+    )
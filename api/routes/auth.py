@@ -8,7 +8,7 @@ from fastapi.responses import HTMLResponse
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from api.auth import CurrentAPIKey, CurrentUser, hash_api_key, hash_password, verify_password
+from api.auth import CurrentAPIKey, CurrentUser, forget_api_key, hash_api_key, hash_password, verify_password
 from api.db import get_db
 from api.email import send_password_reset_email, send_verification_email
 from api.models import APIKey, User, UserPlan
@@ -454,6 +454,7 @@ async def revoke_api_key(
         )
     await db.delete(key)
     await db.commit()
+    await forget_api_key(key.key_hash)
     return {"message": "API key revoked."}
 
 
@@ -473,6 +474,7 @@ async def rotate_api_key(
     db.add(new_key)
     await db.delete(current_key)
     await db.commit()
+    await forget_api_key(current_key.key_hash)
     return RotateAPIKeyResponse(
         api_key=plain_key,
         id=new_key.id,
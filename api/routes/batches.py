@@ -0,0 +1,188 @@
+"""Batch endpoints - bulk inference over an uploaded JSONL file."""
+from datetime import datetime, timezone
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import delete, select, true
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.auth import CurrentUser
+from api.batches import JSONL_CONTENT_TYPE, iter_batch_output, store_batch_input
+from api.config import settings
+from api.db import get_db
+from api.models import RUNNABLE_DEPLOYMENT_STATUSES, Batch, Deployment, JobOutbox, JobStatus, gen_uuid
+from api.outbox import add_batch_to_outbox, notify_outbox
+from api.pagination import before_cursor, next_cursor
+from api.queue import remove_queued
+from api.rate_limit import rate_limit_api
+from api.schemas import BatchListResponse, BatchResponse
+from api.usage_service import evaluate_usage_limits, get_limits_for_plan, period_usage_subquery
+
+router = APIRouter()
+
+
+def _batch_response(batch: Batch) -> BatchResponse:
+    return BatchResponse(
+        id=batch.id,
+        deployment_id=batch.deployment_id,
+        status=batch.status,
+        total_lines=batch.total_lines,
+        processed_lines=batch.processed_lines,
+        succeeded_lines=batch.succeeded_lines,
+        failed_lines=batch.failed_lines,
+        tokens_used=batch.tokens_used,
+        compute_seconds=batch.compute_seconds,
+        gpu_seconds=batch.gpu_seconds,
+        error_message=batch.error_message,
+        created_at=batch.created_at,
+        started_at=batch.started_at,
+        completed_at=batch.completed_at,
+    )
+
+
+async def _get_batch(db: AsyncSession, batch_id: str, user_id: str, *, for_update: bool = False) -> Batch:
+    query = select(Batch).where(Batch.id == batch_id, Batch.user_id == user_id)
+    if for_update:
+        query = query.with_for_update()
+    batch = (await db.execute(query)).scalar_one_or_none()
+    if not batch:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Batch not found",
+        )
+    return batch
+
+
+@router.post("", response_model=BatchResponse, status_code=status.HTTP_202_ACCEPTED)
+async def create_batch(
+    request: Request,
+    user: CurrentUser,
+    db: Annotated[AsyncSession, Depends(get_db)],
+    _: Annotated[None, Depends(rate_limit_api)],
+    deployment_id: str = Query(..., description="Deployment that runs every line"),
+):
+    """
+    Submit a batch: the request body is JSONL, one {"input": ..., "custom_id": "..."} per line.
+    Lines run in large chunks on the low-priority lane; poll GET /batches/{id} for progress and
+    read results from GET /batches/{id}/output as they are written.
+    """
+    usage = period_usage_subquery(str(user.id))
+    row = (
+        await db.execute(
+            select(Deployment, usage.c.tokens, usage.c.cpu, usage.c.gpu)
+            .join(usage, true())
+            .where(Deployment.id == deployment_id, Deployment.user_id == user.id)
+        )
+    ).one_or_none()
+    if not row:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Deployment not found",
+        )
+    deployment = row.Deployment
+    if deployment.status not in RUNNABLE_DEPLOYMENT_STATUSES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Deployment not runnable (status: {deployment.status})",
+        )
+    ok, err = evaluate_usage_limits(
+        get_limits_for_plan(user.plan or "free"),
+        (int(row.tokens), float(row.cpu), float(row.gpu)),
+        is_gpu_job=bool(deployment.config and deployment.config.get("gpu")),
+    )
+    if not ok:
+        raise HTTPException(
+            status_code=status.HTTP_402_PAYMENT_REQUIRED,
+            detail=err,
+        )
+
+    # End the read transaction so the pooled connection is not held while the body streams in
+    await db.commit()
+
+    batch_id = gen_uuid()
+    chunk_size = settings.batch_chunk_size
+    total = await store_batch_input(batch_id, request.stream(), chunk_size)
+    batch = Batch(
+        id=batch_id,
+        user_id=user.id,
+        deployment_id=deployment.id,
+        status=JobStatus.QUEUED.value,
+        chunk_size=chunk_size,
+        total_lines=total,
+        total_chunks=-(-total // chunk_size),
+    )
+    add_batch_to_outbox(db, batch)
+    await db.commit()
+    await db.refresh(batch)
+    notify_outbox()
+    return _batch_response(batch)
+
+
+@router.get("", response_model=BatchListResponse)
+async def list_batches(
+    user: CurrentUser,
+    db: Annotated[AsyncSession, Depends(get_db)],
+    limit: int = Query(20, ge=1, le=100),
+    cursor: str | None = Query(None, description="next_cursor from the previous page"),
+):
+    """List batches for the current user, newest first. Keyset-paginated on (created_at, id)."""
+    query = select(Batch).where(Batch.user_id == user.id)
+    if cursor:
+        query = query.where(before_cursor(Batch.created_at, Batch.id, cursor))
+    result = await db.execute(query.order_by(Batch.created_at.desc(), Batch.id.desc()).limit(limit + 1))
+    batches = result.scalars().all()
+    return BatchListResponse(
+        batches=[_batch_response(b) for b in batches[:limit]],
+        next_cursor=next_cursor(batches, limit, "created_at"),
+    )
+
+
+@router.get("/{batch_id}", response_model=BatchResponse)
+async def get_batch(
+    batch_id: str,
+    user: CurrentUser,
+    db: Annotated[AsyncSession, Depends(get_db)],
+    _: Annotated[None, Depends(rate_limit_api)],
+):
+    """Batch status and progress counters."""
+    return _batch_response(await _get_batch(db, batch_id, user.id))
+
+
+@router.get("/{batch_id}/output")
+async def get_batch_output(
+    batch_id: str,
+    user: CurrentUser,
+    db: Annotated[AsyncSession, Depends(get_db)],
+    _: Annotated[None, Depends(rate_limit_api)],
+):
+    """Results written so far as JSONL, in input order (complete once the batch has completed)."""
+    batch = await _get_batch(db, batch_id, user.id)
+    return StreamingResponse(iter_batch_output(batch), media_type=JSONL_CONTENT_TYPE)
+
+
+@router.post("/{batch_id}/cancel", response_model=BatchResponse)
+async def cancel_batch(
+    batch_id: str,
+    user: CurrentUser,
+    db: Annotated[AsyncSession, Depends(get_db)],
+    _: Annotated[None, Depends(rate_limit_api)] = None,
+):
+    """
+    Cancel a queued or running batch. No further chunks start; a chunk already running finishes,
+    is billed and its output kept.
+    """
+    batch = await _get_batch(db, batch_id, user.id, for_update=True)
+    if batch.status not in (JobStatus.QUEUED.value, JobStatus.RUNNING.value):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Batch already {batch.status}",
+        )
+    batch.status = JobStatus.CANCELLED.value
+    batch.completed_at = datetime.now(timezone.utc)
+    # Outbox rows the relay is pushing right now are skipped; remove_queued catches those
+    pending = select(JobOutbox.id).where(JobOutbox.job_id == batch.id).with_for_update(skip_locked=True)
+    await db.execute(delete(JobOutbox).where(JobOutbox.id.in_(pending.scalar_subquery())))
+    await db.commit()
+    await remove_queued(batch.id)
+    return _batch_response(batch)
@@ -5,7 +5,8 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from api.auth import CurrentUser
 from api.db import get_db
-from api.models import Deployment, DeploymentRevision, DeploymentStatus
+from api.models import Deployment, DeploymentRevision
+from api.outbox import add_rollout_to_outbox, notify_outbox
 from api.schemas import DeployRequest, DeployResponse
 
 router = APIRouter()
@@ -17,7 +18,11 @@ async def deploy(
     user: CurrentUser,
     db: AsyncSession = Depends(get_db),
 ):
-    """Deploy a model to the inference platform. Pass deployment_id to update existing (creates new revision)."""
+    """
+    Deploy a model to the inference platform. Pass deployment_id to update existing (creates new revision).
+    Starts a rollout: the model is pulled, loaded, warmed and smoke-tested before the deployment
+    becomes ready; GET /status/{deployment_id} reports its phase and timings. Jobs sent meanwhile wait for it.
+    """
     if body.deployment_id:
         # Update existing deployment: snapshot current to revision, then update
         result = await db.execute(
@@ -50,9 +55,10 @@ async def deploy(
         deployment.model_id = body.model_id
         deployment.model_path = body.model_path
         deployment.config = body.config
-        deployment.status = DeploymentStatus.PENDING.value
-        await db.flush()
+        add_rollout_to_outbox(db, deployment)
+        await db.commit()
         await db.refresh(deployment)
+        notify_outbox()
         return DeployResponse(
             deployment_id=deployment.id,
             status=deployment.status,
@@ -66,11 +72,13 @@ async def deploy(
         model_id=body.model_id,
         model_path=body.model_path,
         config=body.config,
-        status=DeploymentStatus.PENDING.value,
     )
     db.add(deployment)
-    await db.flush()
+    await db.flush()  # Assigns the id the outbox row is keyed by
+    add_rollout_to_outbox(db, deployment)
+    await db.commit()
     await db.refresh(deployment)
+    notify_outbox()
     return DeployResponse(
         deployment_id=deployment.id,
         status=deployment.status,
@@ -1,4 +1,5 @@
 """Deployments list, revisions, and rollback."""
+from datetime import datetime
 from typing import Annotated
 
 from fastapi import APIRouter, Depends, HTTPException, Query, status
@@ -8,6 +9,8 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from api.auth import CurrentUser
 from api.db import get_db
 from api.models import Deployment, DeploymentRevision
+from api.outbox import add_rollout_to_outbox, notify_outbox
+from api.pagination import before_cursor, next_cursor
 from api.schemas import (
     DeploymentListItem,
     DeploymentListResponse,
@@ -24,34 +27,49 @@ async def list_deployments(
     user: CurrentUser,
     db: Annotated[AsyncSession, Depends(get_db)],
     limit: int = Query(10, ge=1, le=100),
-    offset: int = Query(0, ge=0),
+    cursor: str | None = Query(None, description="next_cursor from the previous page"),
+    status_filter: str | None = Query(None, alias="status", description="Filter by deployment status"),
+    updated_after: datetime | None = Query(None, description="Only deployments updated at or after this time"),
+    updated_before: datetime | None = Query(None, description="Only deployments updated before this time"),
+    include_total: bool = Query(False, description="Also count all matching deployments (extra query)"),
+    offset: int | None = Query(None, ge=0, deprecated=True, description="Use cursor instead"),
 ):
-    """List user's deployments with revision counts. Supports pagination."""
-    # Total count
-    count_result = await db.scalar(
-        select(func.count(func.distinct(Deployment.id))).where(
-            Deployment.user_id == user.id
-        )
-    )
-    total = count_result or 0
+    """List user's deployments with revision counts, most recently updated first.
+    Keyset-paginated on (updated_at, id); offset is still accepted for old clients."""
+    filters = [Deployment.user_id == user.id]
+    if status_filter:
+        filters.append(Deployment.status == status_filter)
+    if updated_after:
+        filters.append(Deployment.updated_at >= updated_after)
+    if updated_before:
+        filters.append(Deployment.updated_at < updated_before)
 
+    # Counted per returned row only (index on deployment_id), not joined across all revisions
+    revision_count = (
+        select(func.count(DeploymentRevision.id))
+        .where(DeploymentRevision.deployment_id == Deployment.id)
+        .scalar_subquery()
+    )
+    query = select(
+        Deployment.id,
+        Deployment.model_id,
+        Deployment.status,
+        Deployment.created_at,
+        Deployment.updated_at,
+        revision_count.label("revision_count"),
+    ).where(*filters)
+    if cursor:
+        query = query.where(before_cursor(Deployment.updated_at, Deployment.id, cursor))
+    elif offset:
+        query = query.offset(offset)
     result = await db.execute(
-        select(
-            Deployment.id,
-            Deployment.model_id,
-            Deployment.status,
-            Deployment.created_at,
-            Deployment.updated_at,
-            func.count(DeploymentRevision.id).label("revision_count"),
-        )
-        .outerjoin(DeploymentRevision, Deployment.id == DeploymentRevision.deployment_id)
-        .where(Deployment.user_id == user.id)
-        .group_by(Deployment.id)
-        .order_by(Deployment.updated_at.desc())
-        .limit(limit)
-        .offset(offset)
+        query.order_by(Deployment.updated_at.desc(), Deployment.id.desc()).limit(limit + 1)
     )
     rows = result.all()
+
+    total = None
+    if include_total or offset is not None:
+        total = await db.scalar(select(func.count()).select_from(Deployment).where(*filters))
     return DeploymentListResponse(
         deployments=[
             DeploymentListItem(
@@ -62,8 +80,9 @@ async def list_deployments(
                 updated_at=r.updated_at,
                 revision_count=r.revision_count or 0,
             )
-            for r in rows
+            for r in rows[:limit]
         ],
+        next_cursor=next_cursor(rows, limit, "updated_at"),
         total=total,
     )
 
@@ -113,7 +132,7 @@ async def rollback(
     db: Annotated[AsyncSession, Depends(get_db)],
     revision: int = Query(..., ge=1, description="Revision number to rollback to"),
 ):
-    """Rollback deployment to a previous revision."""
+    """Rollback deployment to a previous revision (rolled out again, like a deploy)."""
     result = await db.execute(
         select(Deployment).where(
             Deployment.id == deployment_id,
@@ -137,4 +156,7 @@ async def rollback(
     deployment.model_id = rev.model_id
     deployment.model_path = rev.model_path
     deployment.config = rev.config
+    add_rollout_to_outbox(db, deployment)  # The restored model is warmed like a new deploy
+    await db.commit()
+    notify_outbox()
     return RollbackResponse(deployment_id=deployment_id, revision=revision)
@@ -1,14 +1,22 @@
-"""Jobs endpoints - list recent inference jobs."""
+"""Jobs endpoints - list recent inference jobs, cancel a job."""
+from datetime import datetime, timezone
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, Query
-from sqlalchemy import desc, select
+from fastapi import APIRouter, Depends, HTTPException, Query, status as http_status
+from sqlalchemy import delete, func, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from api.auth import CurrentUser
 from api.db import get_db
-from api.models import Job, JobStatus
-from api.schemas import JobListItem, JobListResponse
+from api.events import publish_job_event
+from api.models import Deployment, Job, JobOutbox, JobStatus
+from api.pagination import before_cursor, next_cursor
+from api.queue import release_in_flight, remove_queued, signal_cancel
+from api.rate_limit import rate_limit_api
+from api.schemas import CancelJobResponse, JobListItem, JobListResponse
+from api.status_cache import cache_job_status
+from api.usage_service import record_usage
+from api.webhooks import queue_webhook
 
 router = APIRouter()
 
@@ -18,15 +26,33 @@ async def list_jobs(
     user: CurrentUser,
     db: Annotated[AsyncSession, Depends(get_db)],
     limit: int = Query(20, ge=1, le=100),
+    cursor: str | None = Query(None, description="next_cursor from the previous page"),
+    status: str | None = Query(None, description="Filter by job status"),
+    deployment_id: str | None = Query(None, description="Filter by deployment"),
+    created_after: datetime | None = Query(None, description="Only jobs created at or after this time"),
+    created_before: datetime | None = Query(None, description="Only jobs created before this time"),
+    include_total: bool = Query(False, description="Also count all matching jobs (extra query)"),
 ):
-    """List recent inference jobs for the current user."""
+    """List inference jobs for the current user, newest first. Keyset-paginated on (created_at, id)."""
+    filters = [Job.user_id == user.id]
+    if status:
+        filters.append(Job.status == status)
+    if deployment_id:
+        filters.append(Job.deployment_id == deployment_id)
+    # Date bounds also prune monthly partitions
+    if created_after:
+        filters.append(Job.created_at >= created_after)
+    if created_before:
+        filters.append(Job.created_at < created_before)
+
+    query = select(Job).where(*filters)
+    if cursor:
+        query = query.where(before_cursor(Job.created_at, Job.id, cursor))
     result = await db.execute(
-        select(Job)
-        .where(Job.user_id == user.id)
-        .order_by(desc(Job.created_at))
-        .limit(limit)
+        query.order_by(Job.created_at.desc(), Job.id.desc()).limit(limit + 1)
     )
     jobs = result.scalars().all()
+    total = await db.scalar(select(func.count()).select_from(Job).where(*filters)) if include_total else None
     def _retry_after(j) -> int | None:
         if j.status != JobStatus.FAILED.value:
             return None
@@ -49,6 +75,78 @@ async def list_jobs(
                 policy_action=j.policy_action,
                 retry_after_seconds=_retry_after(j),
             )
-            for j in jobs
-        ]
+            for j in jobs[:limit]
+        ],
+        next_cursor=next_cursor(jobs, limit, "created_at"),
+        total=total,
+    )
+
+
+@router.post("/{job_id}/cancel", response_model=CancelJobResponse)
+async def cancel_job(
+    job_id: str,
+    user: CurrentUser,
+    db: Annotated[AsyncSession, Depends(get_db)],
+    _: Annotated[None, Depends(rate_limit_api)] = None,
+):
+    """
+    Cancel a queued or running job.
+    A queued job is removed from the queue (workers also skip it by status). A running job is billed
+    for the compute used since a worker claimed it, and that worker deletes its K8s Job or aborts
+    generation on the inference server. Finished jobs return 409.
+    """
+    # Row lock: serializes with the worker's claim and its final write
+    result = await db.execute(
+        select(Job, Deployment)
+        .join(Deployment, Job.deployment_id == Deployment.id)
+        .where(Job.id == job_id, Job.user_id == user.id)
+        .with_for_update(of=Job)
+    )
+    row = result.one_or_none()
+    if not row:
+        raise HTTPException(status_code=http_status.HTTP_404_NOT_FOUND, detail="Job not found")
+    job, deployment = row
+    was_running = job.status == JobStatus.RUNNING.value
+    if job.status != JobStatus.QUEUED.value and not was_running:
+        raise HTTPException(
+            status_code=http_status.HTTP_409_CONFLICT,
+            detail=f"Job already {job.status}",
+        )
+
+    now = datetime.now(timezone.utc)
+    job.status = JobStatus.CANCELLED.value
+    job.error_message = "Cancelled by user"
+    job.completed_at = now
+    if was_running:
+        secs = round((now - job.started_at).total_seconds(), 2) if job.started_at else 0.0
+        is_gpu = bool(deployment.config and deployment.config.get("gpu"))
+        job.tokens_used = 0
+        job.compute_seconds = secs
+        await record_usage(
+            db,
+            user_id=str(user.id),
+            job_id=str(job.id),
+            compute_seconds=0.0 if is_gpu else secs,
+            gpu_seconds=secs if is_gpu else 0.0,
+        )
+    else:
+        # Rows a relay is pushing right now are skipped (waiting on them could deadlock with the
+        # relay's jobs update); remove_queued below takes that copy back out of Redis
+        pending = select(JobOutbox.id).where(JobOutbox.job_id == job.id).with_for_update(skip_locked=True)
+        await db.execute(delete(JobOutbox).where(JobOutbox.id.in_(pending.scalar_subquery())))
+    await db.commit()
+
+    if was_running:
+        await signal_cancel(str(job.id))
+    else:
+        await remove_queued(str(job.id))
+    await release_in_flight(str(user.id), str(job.id))
+    await cache_job_status(job)
+    await publish_job_event(job)
+    await queue_webhook(job, deployment)
+    return CancelJobResponse(
+        job_id=job.id,
+        status=job.status,
+        message="Job cancelled",
+        compute_seconds=job.compute_seconds if was_running else None,
     )
@@ -1,25 +1,41 @@
 """Run inference endpoints."""
+import logging
+from datetime import datetime, timedelta, timezone
 from typing import Annotated
 
 from fastapi import APIRouter, Depends, HTTPException, Response, status
-from sqlalchemy import select
+from sqlalchemy import null, select, true
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from api.auth import CurrentUser
+from api.admission import choose_lane
+from api.auth import CurrentUser, api_key_header
 from api.config import settings
 from api.db import get_db
+from api.events import publish_job_event
 from api.guardrails.base import GuardrailAction
-from api.guardrails.block_rate import check_block_rate_limit
+from api.guardrails.block_rate import block_key, evaluate_block_rate
 from api.guardrails.config import get_guardrail_config
 from api.guardrails.runner import run_guardrails
-from api.models import Deployment, DeploymentStatus, Job, JobStatus
-from api.queue import enqueue_job
+from api.metrics import quantlix_run_admission_seconds
+from api.models import RUNNABLE_DEPLOYMENT_STATUSES, Deployment, Job, JobStatus, User, gen_uuid
+from api.outbox import add_to_outbox, notify_outbox
+from api.queue import release_in_flight
+from api.rate_limit import admit_request
+from api.result_cache import complete_from_cache, get_cached_result
 from api.schemas import RunRequest, RunResponse
-from api.usage_service import check_usage_limits
+from api.status_cache import cache_job_status
+from api.storage import offload_payload
+from api.usage_service import evaluate_usage_limits, get_limits_for_plan, period_usage_subquery
+from api.webhooks import queue_webhook
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
 
+def _stage(name: str):
+    """Time one admission stage into quantlix_run_admission_seconds."""
+    return quantlix_run_admission_seconds.labels(stage=name).time()
 
 
 @router.post("", response_model=RunResponse)
@@ -28,30 +44,69 @@ async def run_inference(
     user: CurrentUser,
     db: Annotated[AsyncSession, Depends(get_db)],
     response: Response,
+    api_key: Annotated[str | None, Depends(api_key_header)],
 ):
-    """Run inference on a deployed model."""
-    result = await db.execute(
-        select(Deployment).where(
-            Deployment.id == body.deployment_id,
-            Deployment.user_id == user.id,
+    """
+    Run inference on a deployed model.
+    Admission is one Redis script (rate, in-flight slot, block counter) and one DB read
+    (deployment + period usage); the job and its outbox row are then committed together.
+    """
+    job_id = gen_uuid()
+    now = datetime.now(timezone.utc)  # Deadlines count from submission, not from the DB commit
+    with _stage("redis_admission"):
+        admission = await admit_request(
+            response, user, api_key, job_id=job_id, peek=[block_key(str(user.id), body.deployment_id)]
         )
-    )
-    deployment = result.scalar_one_or_none()
-    if not deployment:
+    try:
+        return await _admit_and_insert(body, user, db, job_id, admission.peeked[0], now)
+    except Exception:
+        # Cancellation is left to the slot's lease; a failed release must not mask the error
+        try:
+            await release_in_flight(str(user.id), job_id)
+        except Exception as e:
+            logger.warning("Could not release in-flight slot of job %s: %s", job_id, e)
+        raise
+
+
+async def _admit_and_insert(
+    body: RunRequest,
+    user: User,
+    db: AsyncSession,
+    job_id: str,
+    block_counter: tuple[str | None, int],
+    now: datetime,
+) -> RunResponse:
+    with _stage("db_read"):
+        usage = period_usage_subquery(str(user.id))
+        result = await db.execute(
+            select(Deployment, usage.c.tokens, usage.c.cpu, usage.c.gpu)
+            .join(usage, true())
+            .where(
+                Deployment.id == body.deployment_id,
+                Deployment.user_id == user.id,
+            )
+        )
+        row = result.one_or_none()
+    if not row:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Deployment not found",
         )
+    deployment = row.Deployment
 
     is_gpu = bool(deployment.config and deployment.config.get("gpu"))
-    ok, err = await check_usage_limits(db, user.id, is_gpu_job=is_gpu)
+    ok, err = evaluate_usage_limits(
+        get_limits_for_plan(user.plan or "free"),
+        (int(row.tokens), float(row.cpu), float(row.gpu)),
+        is_gpu_job=is_gpu,
+    )
     if not ok:
         raise HTTPException(
             status_code=status.HTTP_402_PAYMENT_REQUIRED,
             detail=err,
         )
 
-    if deployment.status not in (DeploymentStatus.READY.value, DeploymentStatus.PENDING.value):
+    if deployment.status not in RUNNABLE_DEPLOYMENT_STATUSES:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"Deployment not runnable (status: {deployment.status})",
@@ -59,15 +114,13 @@ async def run_inference(
 
     input_payload = body.input if isinstance(body.input, dict) else {"data": body.input}
 
-    # Block rate limit — prevent repeated blocked outputs from multiplying cost
+    # Block rate limit — prevent repeated blocked outputs from multiplying cost.
+    # The counter was read in the admission script; the threshold is per deployment.
     cfg = deployment.config or {}
     max_blocks = cfg.get("guardrail_block_max", settings.guardrail_block_max_per_window)
-    window_secs = cfg.get("guardrail_block_window", settings.guardrail_block_window_seconds)
-    rate_result = await check_block_rate_limit(
-        str(user.id), str(deployment.id), max_blocks, window_secs
-    )
+    count, pttl = block_counter
+    rate_result = evaluate_block_rate(count, -(-pttl // 1000) if pttl > 0 else pttl, max_blocks)
     if not rate_result.within_limit:
-        response.headers["Retry-After"] = str(rate_result.retry_after_seconds)
         raise HTTPException(
             status_code=status.HTTP_429_TOO_MANY_REQUESTS,
             detail={
@@ -76,44 +129,80 @@ async def run_inference(
                 "max_blocks": rate_result.max_blocks,
                 "retry_after_seconds": rate_result.retry_after_seconds,
             },
+            headers={"Retry-After": str(rate_result.retry_after_seconds)},
         )
 
     # Input guardrails — block before enqueue if any rule blocks
-    enabled_rules, rule_config, fail_open, timeout = get_guardrail_config(deployment)
-    passed, guardrail_results = run_guardrails(
-        input_payload, "input", enabled_rules, rule_config,
-        timeout_seconds=timeout, fail_open=fail_open
-    )
+    with _stage("guardrails"):
+        enabled_rules, rule_config, fail_open, timeout = get_guardrail_config(deployment)
+        passed, guardrail_results = run_guardrails(
+            input_payload, "input", enabled_rules, rule_config,
+            timeout_seconds=timeout, fail_open=fail_open
+        )
     if not passed:
         blocked = next((r for r in guardrail_results if r.action == GuardrailAction.BLOCK), None)
         retry_secs = 60
-        response.headers["Retry-After"] = str(retry_secs)
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail={
                 "message": blocked.message if blocked else "Request blocked by guardrails",
                 "retry_after_seconds": retry_secs,
             },
+            headers={"Retry-After": str(retry_secs)},
         )
-    job = Job(
-        user_id=user.id,
-        deployment_id=deployment.id,
-        input_data=input_payload,
-        status=JobStatus.QUEUED.value,
-    )
-    db.add(job)
-    await db.flush()
-    await db.refresh(job)
-    await db.commit()  # Commit before enqueue so orchestrator can find the job
 
-    await enqueue_job(
-        job_id=job.id,
-        payload={
-            "deployment_id": deployment.id,
-            "user_id": user.id,
-            "input": input_payload,
-        },
-    )
+    # Deterministic request on a cache-enabled deployment: complete from the result cache
+    with _stage("result_cache"):
+        cached = await get_cached_result(deployment, input_payload)
+    if cached is not None:
+        with _stage("payload_offload"):
+            input_ref = await offload_payload(job_id, "input", input_payload)
+        with _stage("db_write"):
+            job = Job(
+                id=job_id,
+                user_id=user.id,
+                deployment_id=deployment.id,
+                input_ref=input_ref,
+                input_data=null() if input_ref else input_payload,  # SQL NULL, not JSON null
+                webhook_url=body.webhook_url,
+            )
+            await complete_from_cache(db, job, deployment, cached)
+            db.add(job)
+            await db.commit()
+        await release_in_flight(str(user.id), job_id)
+        await cache_job_status(job)
+        await publish_job_event(job)
+        await queue_webhook(job, deployment)
+        return RunResponse(
+            job_id=job.id,
+            status=job.status,
+            message="Result served from cache",
+            cached=True,
+        )
+
+    # Load shedding: over the queue-wait SLO the job is rejected (503) or moved to the batch lane
+    lane, wait = choose_lane()
+
+    # Large inputs are written once to MinIO; Redis and Postgres only carry the ref
+    with _stage("payload_offload"):
+        input_ref = await offload_payload(job_id, "input", input_payload)
+
+    # Job row and dispatch intent commit together; the outbox relay pushes to Redis
+    with _stage("db_write"):
+        job = Job(
+            id=job_id,
+            user_id=user.id,
+            deployment_id=deployment.id,
+            input_ref=input_ref,
+            input_data=null() if input_ref else input_payload,  # SQL NULL, not JSON null
+            status=JobStatus.QUEUED.value,
+            deadline_at=now + timedelta(seconds=body.timeout_seconds) if body.timeout_seconds else None,
+            webhook_url=body.webhook_url,
+        )
+        add_to_outbox(db, job, lane=lane)
+        await db.commit()
+    notify_outbox()
+    await publish_job_event(job)
 
     block_rate = None
     if rate_result.blocks_in_window > 0:
@@ -126,4 +215,6 @@ async def run_inference(
         status=job.status,
         message="Inference job queued",
         block_rate=block_rate,
+        lane=lane,
+        estimated_wait_seconds=round(wait, 1),
     )
@@ -1,12 +1,17 @@
 """Status endpoints."""
-from fastapi import APIRouter, Depends, HTTPException, status
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, HTTPException, Response, status
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from api.auth import CurrentUser
+from api.auth import CurrentKeyOwner, api_key_header
 from api.db import get_db
 from api.models import Deployment, Job
-from api.schemas import StatusResponse
+from api.rate_limit import admit_request
+from api.schemas import DeploymentRollout, StatusResponse
+from api.status_cache import cache_job_status, cached_job_status
+from api.webhooks import job_status_response
 
 router = APIRouter()
 
@@ -14,10 +19,20 @@ router = APIRouter()
 @router.get("/{resource_id}", response_model=StatusResponse)
 async def get_status(
     resource_id: str,
-    user: CurrentUser,
+    response: Response,
+    user: CurrentKeyOwner,
+    api_key: Annotated[str | None, Depends(api_key_header)],
     db: AsyncSession = Depends(get_db),
 ):
-    """Get status of deployment or job."""
+    """
+    Get status of deployment or job. Rate limited per API key/user.
+    Finished jobs are served from Redis (api.status_cache), so polling them skips Postgres.
+    """
+    await admit_request(response, user, api_key)
+    cached = await cached_job_status(resource_id, user.id)
+    if cached:
+        return cached
+
     # Try deployment first
     result = await db.execute(
         select(Deployment).where(
@@ -35,6 +50,12 @@ async def get_status(
             updated_at=deployment.updated_at,
             error_message=deployment.error_message,
             config=deployment.config or {},
+            rollout=DeploymentRollout(
+                phase=deployment.rollout_phase,
+                started_at=deployment.rollout_started_at,
+                completed_at=deployment.rollout_completed_at,
+                timings=deployment.rollout_timings,
+            ) if deployment.rollout_id else None,
         )
 
     # Try job
@@ -46,21 +67,8 @@ async def get_status(
     )
     job = result.scalar_one_or_none()
     if job:
-        retry_after = 60 if (job.guardrail_blocked or job.policy_action == "block") else None
-        return StatusResponse(
-            id=job.id,
-            type="job",
-            status=job.status,
-            created_at=job.created_at,
-            updated_at=job.completed_at,
-            error_message=job.error_message,
-            output_data=job.output_data,
-            tokens_used=job.tokens_used,
-            compute_seconds=job.compute_seconds,
-            guardrail_blocked=job.guardrail_blocked,
-            policy_action=job.policy_action,
-            retry_after_seconds=retry_after,
-        )
+        await cache_job_status(job)  # Finished but evicted: warm it for the next poll
+        return await job_status_response(job)
 
     raise HTTPException(
         status_code=status.HTTP_404_NOT_FOUND,
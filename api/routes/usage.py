@@ -8,9 +8,9 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from api.auth import CurrentUser
 from api.db import get_db
-from api.models import Job, JobStatus, UsageRecord
+from api.models import Job, JobStatus, UsageGranularity, UsageRollup
 from api.schemas import MetricsResponse, UsageDailyPoint, UsageHistoryResponse, UsageResponse
-from api.usage_service import get_limits_for_user
+from api.usage_service import daily_rollup_totals, get_limits_for_user
 
 router = APIRouter()
 
@@ -32,16 +32,10 @@ async def get_usage(
     end_dt = datetime.combine(end_date, datetime.max.time())
 
     result = await db.execute(
-        select(
-            func.coalesce(func.sum(UsageRecord.tokens_used), 0).label("tokens_used"),
-            func.coalesce(func.sum(UsageRecord.compute_seconds), 0).label("compute_seconds"),
-            func.coalesce(func.sum(UsageRecord.gpu_seconds), 0).label("gpu_seconds"),
-            func.count(UsageRecord.id).label("job_count"),
-        ).where(
-            UsageRecord.user_id == user.id,
-            UsageRecord.created_at >= start_dt,
-            UsageRecord.created_at <= end_dt,
-        )
+        daily_rollup_totals(
+            start_dt.replace(tzinfo=timezone.utc),
+            end_dt.replace(tzinfo=timezone.utc),
+        ).where(UsageRollup.user_id == user.id)
     )
     row = result.one()
 
@@ -57,16 +51,16 @@ async def get_usage(
     blocked_count = blocked_result.scalar() or 0
 
     token_limit, cpu_limit, gpu_limit = await get_limits_for_user(db, user.id)
-    gpu_used = float(row.gpu_seconds)
+    gpu_used = float(row.gpu)
     gpu_overage = max(0, gpu_used - gpu_limit) if gpu_limit > 0 else 0
 
     return UsageResponse(
         user_id=user.id,
         plan=user.plan or "free",
-        tokens_used=int(row.tokens_used),
-        compute_seconds=float(row.compute_seconds),
-        gpu_seconds=float(row.gpu_seconds),
-        job_count=int(row.job_count),
+        tokens_used=int(row.tokens),
+        compute_seconds=float(row.cpu),
+        gpu_seconds=float(row.gpu),
+        job_count=int(row.jobs),
         blocked_jobs_count=int(blocked_count),
         start_date=start_date,
         end_date=end_date,
@@ -89,19 +83,19 @@ async def get_usage_history(
 
     result = await db.execute(
         select(
-            cast(UsageRecord.created_at, Date).label("day"),
-            func.coalesce(func.sum(UsageRecord.tokens_used), 0).label("tokens_used"),
-            func.coalesce(func.sum(UsageRecord.compute_seconds), 0).label("compute_seconds"),
-            func.coalesce(func.sum(UsageRecord.gpu_seconds), 0).label("gpu_seconds"),
-            func.count(UsageRecord.id).label("job_count"),
+            cast(UsageRollup.bucket_start, Date).label("day"),
+            UsageRollup.tokens_used,
+            UsageRollup.compute_seconds,
+            UsageRollup.gpu_seconds,
+            UsageRollup.job_count,
         )
         .where(
-            UsageRecord.user_id == user.id,
-            UsageRecord.created_at >= datetime.combine(start_date, datetime.min.time()).replace(tzinfo=timezone.utc),
-            UsageRecord.created_at <= datetime.combine(end_date, datetime.max.time()).replace(tzinfo=timezone.utc),
+            UsageRollup.user_id == user.id,
+            UsageRollup.granularity == UsageGranularity.DAY.value,
+            UsageRollup.bucket_start >= datetime.combine(start_date, datetime.min.time()).replace(tzinfo=timezone.utc),
+            UsageRollup.bucket_start <= datetime.combine(end_date, datetime.max.time()).replace(tzinfo=timezone.utc),
         )
-        .group_by(cast(UsageRecord.created_at, Date))
-        .order_by(cast(UsageRecord.created_at, Date))
+        .order_by(UsageRollup.bucket_start)
     )
     rows = result.all()
 
@@ -124,32 +118,33 @@ async def get_metrics(
     db: Annotated[AsyncSession, Depends(get_db)],
     days: int = Query(30, ge=1, le=90),
 ):
-    """Get performance metrics: success rate, latency stats."""
+    """Get performance metrics: success rate, latency stats.
+
+    Aggregated in Postgres (count, avg, percentile_cont) so the response cost does not
+    grow with the number of jobs in the window.
+    """
     cutoff = datetime.now(timezone.utc) - timedelta(days=days)
+    has_latency = Job.compute_seconds > 0
     result = await db.execute(
-        select(Job.status, Job.compute_seconds, Job.completed_at, Job.created_at)
-        .where(Job.user_id == user.id, Job.created_at >= cutoff)
+        select(
+            func.count(Job.id).label("total"),
+            func.count(Job.id).filter(Job.status == JobStatus.COMPLETED.value).label("completed"),
+            func.avg(Job.compute_seconds).filter(has_latency).label("avg"),
+            func.percentile_cont(0.5).within_group(Job.compute_seconds).filter(has_latency).label("p50"),
+            func.percentile_cont(0.95).within_group(Job.compute_seconds).filter(has_latency).label("p95"),
+        ).where(Job.user_id == user.id, Job.created_at >= cutoff)
     )
-    jobs = result.all()
-
-    total = len(jobs)
-    completed = sum(1 for j in jobs if j.status in (JobStatus.COMPLETED.value, "completed"))
-    success_rate = completed / total if total > 0 else 0.0
+    row = result.one()
 
-    latencies = [j.compute_seconds for j in jobs if j.compute_seconds is not None and j.compute_seconds > 0]
-    if not latencies:
+    total = int(row.total or 0)
+    success_rate = int(row.completed or 0) / total if total > 0 else 0.0
+    if row.avg is None:
         return MetricsResponse(success_rate=success_rate, total_jobs=total)
 
-    latencies_sorted = sorted(latencies)
-    avg = sum(latencies_sorted) / len(latencies_sorted)
-    p50 = latencies_sorted[len(latencies_sorted) // 2] if latencies_sorted else None
-    p95_idx = int(len(latencies_sorted) * 0.95) - 1
-    p95 = latencies_sorted[max(0, p95_idx)] if latencies_sorted else None
-
     return MetricsResponse(
         success_rate=success_rate,
         total_jobs=total,
-        avg_latency_s=round(avg, 2),
-        p50_latency_s=round(p50, 2),
-        p95_latency_s=round(p95, 2),
+        avg_latency_s=round(float(row.avg), 2),
+        p50_latency_s=round(float(row.p50), 2),
+        p95_latency_s=round(float(row.p95), 2),
     )
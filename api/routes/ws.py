@@ -0,0 +1,71 @@
+"""WebSocket endpoints - live job state changes."""
+import asyncio
+
+from fastapi import APIRouter, Query, WebSocket
+
+from api.auth import CurrentUser, user_for_api_key
+from api.config import settings
+from api.db import async_session_maker
+from api.events import hub, issue_ticket, redeem_ticket
+from api.schemas import WebSocketTicketResponse
+
+router = APIRouter()
+
+POLICY_VIOLATION = 1008  # WebSocket close code
+
+
+@router.post("/ticket", response_model=WebSocketTicketResponse)
+async def create_ticket(user: CurrentUser):
+    """One-time ticket for opening /ws/jobs from a browser (which cannot send X-API-Key)."""
+    return WebSocketTicketResponse(
+        ticket=await issue_ticket(str(user.id)),
+        expires_in=settings.ws_ticket_ttl_seconds,
+    )
+
+
+@router.websocket("/jobs")
+async def job_events(
+    websocket: WebSocket,
+    ticket: str | None = Query(None, description="From POST /ws/ticket; instead of X-API-Key"),
+    deployment_id: str | None = Query(None, description="Only this deployment's jobs"),
+):
+    """
+    Stream the user's job state changes as JSON messages: job_id, deployment_id, status, at,
+    plus error, usage and guardrail fields. Authenticate with X-API-Key or a ticket.
+    """
+    user_id: str | None = None
+    api_key = websocket.headers.get("x-api-key")
+    if api_key:
+        async with async_session_maker() as db:
+            user = await user_for_api_key(db, api_key)
+        user_id = str(user.id) if user else None
+    elif ticket:
+        user_id = await redeem_ticket(ticket)
+    if not user_id:
+        await websocket.close(code=POLICY_VIOLATION, reason="Invalid API key or ticket")
+        return
+    if hub.connections(user_id) >= settings.ws_max_connections_per_user:
+        await websocket.close(code=POLICY_VIOLATION, reason="Too many open connections")
+        return
+
+    await websocket.accept()
+    with hub.subscribe(user_id) as events:
+
+        async def send() -> None:
+            while True:
+                event = await events.get()
+                if deployment_id is None or event["deployment_id"] == deployment_id:
+                    await websocket.send_json(event)
+
+        async def receive() -> None:
+            # Clients send nothing; this only notices the disconnect
+            while True:
+                await websocket.receive_text()
+
+        tasks = [asyncio.create_task(send()), asyncio.create_task(receive())]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
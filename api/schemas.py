@@ -73,7 +73,8 @@ class DeploymentListItem(BaseModel):
 
 class DeploymentListResponse(BaseModel):
     deployments: list[DeploymentListItem]
-    total: int = 0
+    next_cursor: str | None = Field(None, description="Pass as cursor for the next page; null on the last page")
+    total: int | None = Field(None, description="Matching deployments (only with include_total or offset)")
 
 
 class DeploymentRevisionItem(BaseModel):
@@ -99,6 +100,19 @@ class RollbackResponse(BaseModel):
 class RunRequest(BaseModel):
     deployment_id: str = Field(..., description="ID of deployed model")
     input: Any = Field(..., description="Inference input (JSON)")
+    timeout_seconds: int | None = Field(
+        None,
+        ge=1,
+        le=86_400,
+        description="Give up on the job this long after submission: dropped if not started by then, "
+        "and inference is stopped when the budget runs out",
+    )
+    webhook_url: str | None = Field(
+        None,
+        max_length=2048,
+        pattern=r"^https?://",
+        description="POST the final job status here (overrides the deployment's webhook_url); must resolve to a public address",
+    )
 
 
 class RunResponse(BaseModel):
@@ -109,6 +123,9 @@ class RunResponse(BaseModel):
         None,
         description="Proximity to block limit: blocks_in_window, max_blocks (only when > 0 blocks)",
     )
+    cached: bool = Field(False, description="Completed from the deployment's result cache; no inference ran")
+    lane: str | None = Field(None, description="Queue lane: interactive, or batch when shed under load")
+    estimated_wait_seconds: float | None = Field(None, description="Estimated time in queue before the job starts")
 
 
 # --- Jobs (list) ---
@@ -128,9 +145,53 @@ class JobListItem(BaseModel):
 
 class JobListResponse(BaseModel):
     jobs: list[JobListItem]
+    next_cursor: str | None = Field(None, description="Pass as cursor for the next page; null on the last page")
+    total: int | None = Field(None, description="Matching jobs (only with include_total)")
+
+
+class CancelJobResponse(BaseModel):
+    job_id: str
+    status: str
+    message: str
+    compute_seconds: float | None = Field(None, description="Compute billed for a running job up to cancellation")
+
+
+# --- Batches ---
+class BatchResponse(BaseModel):
+    id: str
+    deployment_id: str
+    status: str = Field(..., description="queued, running, completed, failed, or cancelled")
+    total_lines: int
+    processed_lines: int = Field(..., description="Lines with a result (succeeded or failed) in the output so far")
+    succeeded_lines: int
+    failed_lines: int
+    tokens_used: int
+    compute_seconds: float
+    gpu_seconds: float
+    error_message: str | None = None
+    created_at: datetime | None = None
+    started_at: datetime | None = None
+    completed_at: datetime | None = None
+
+
+class BatchListResponse(BaseModel):
+    batches: list[BatchResponse]
+    next_cursor: str | None = Field(None, description="Pass as cursor for the next page; null on the last page")
+
+
+class WebSocketTicketResponse(BaseModel):
+    ticket: str = Field(..., description="Pass as ?ticket= when opening /ws/jobs; valid once")
+    expires_in: int = Field(..., description="Seconds until the ticket expires")
 
 
 # --- Status ---
+class DeploymentRollout(BaseModel):
+    phase: str | None = Field(None, description="queued, pulling, loading, warming, smoke_test, ready or failed")
+    started_at: datetime | None = None
+    completed_at: datetime | None = None
+    timings: dict | None = Field(None, description="Seconds per phase (pull, load, warm, smoke) and total")
+
+
 class StatusResponse(BaseModel):
     id: str
     type: str = Field(..., description="deployment or job")
@@ -139,6 +200,7 @@ class StatusResponse(BaseModel):
     updated_at: datetime | None = None
     error_message: str | None = None
     config: dict | None = Field(None, description="Deployment config (when type=deployment)")
+    rollout: DeploymentRollout | None = Field(None, description="Latest rollout (when type=deployment)")
     # Job-specific
     output_data: dict | None = None
     tokens_used: int | None = None
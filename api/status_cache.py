@@ -0,0 +1,61 @@
+"""
+Hot /status reads for finished jobs.
+Whoever finishes a job (worker, cancel, result-cache hit, coalesced followers) writes its status
+document to status:job:{id} after commit, so clients polling /status/{id} are answered from Redis.
+Offloaded output stays in object storage: the entry keeps output_ref and the read loads it.
+Entries expire after status_cache_ttl_seconds; a miss falls back to Postgres.
+"""
+import json
+import logging
+
+from api.config import settings
+from api.models import Job, JobStatus
+from api.queue import shared_redis
+from api.schemas import StatusResponse
+from api.storage import load_payload
+from api.webhooks import job_status_response
+
+logger = logging.getLogger(__name__)
+
+STATUS_PREFIX = "status:job:"
+FINAL_STATUSES = (JobStatus.COMPLETED.value, JobStatus.FAILED.value, JobStatus.CANCELLED.value)
+
+
+async def cache_job_statuses(jobs: list[Job]) -> None:
+    """Store finished jobs' status documents (call after commit). Best effort: errors are logged."""
+    try:
+        pipe = shared_redis().pipeline(transaction=False)
+        for job in jobs:
+            if job.status not in FINAL_STATUSES:
+                continue
+            entry = {
+                "user_id": str(job.user_id),
+                "output_ref": job.output_ref,
+                "status": (await job_status_response(job, load_output=False)).model_dump(mode="json"),
+            }
+            pipe.set(STATUS_PREFIX + str(job.id), json.dumps(entry), ex=settings.status_cache_ttl_seconds)
+        await pipe.execute()
+    except Exception as e:
+        logger.warning("Could not cache job statuses: %s", e)
+
+
+async def cache_job_status(job: Job) -> None:
+    await cache_job_statuses([job])
+
+
+async def cached_job_status(job_id: str, user_id: str) -> StatusResponse | None:
+    """Cached status document of the user's finished job, or None (not cached, or not theirs)."""
+    try:
+        raw = await shared_redis().get(STATUS_PREFIX + job_id)
+    except Exception as e:
+        logger.warning("Status cache read failed: %s", e)
+        return None
+    if raw is None:
+        return None
+    entry = json.loads(raw)
+    if entry["user_id"] != user_id:
+        return None
+    response = StatusResponse.model_validate(entry["status"])
+    if entry["output_ref"]:
+        response.output_data = await load_payload(entry["output_ref"])
+    return response
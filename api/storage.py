@@ -0,0 +1,121 @@
+"""Object storage (MinIO / S3) helpers. The MinIO client is sync; calls run in a thread."""
+import asyncio
+import io
+import json
+from functools import lru_cache
+
+from minio import Minio
+from minio.deleteobjects import DeleteObject
+
+from api.config import settings
+
+
+@lru_cache
+def get_minio() -> Minio:
+    """Shared MinIO client (thread-safe, pooled HTTP connections)."""
+    return Minio(
+        settings.minio_endpoint,
+        access_key=settings.minio_access_key,
+        secret_key=settings.minio_secret_key,
+        secure=settings.minio_secure,
+    )
+
+
+def _ensure_bucket(client: Minio, bucket: str) -> None:
+    if not client.bucket_exists(bucket):
+        client.make_bucket(bucket)
+
+
+async def upload_file(bucket: str, object_name: str, path: str, content_type: str) -> str:
+    """Upload a local file. Returns the object ref as 'bucket/object_name'."""
+
+    def _upload() -> None:
+        client = get_minio()
+        _ensure_bucket(client, bucket)
+        client.fput_object(bucket, object_name, path, content_type=content_type)
+
+    await asyncio.to_thread(_upload)
+    return f"{bucket}/{object_name}"
+
+
+def _split_ref(ref: str) -> tuple[str, str]:
+    bucket, _, object_name = ref.partition("/")
+    return bucket, object_name
+
+
+async def put_bytes(bucket: str, object_name: str, data: bytes, content_type: str) -> str:
+    """Upload bytes. Returns the object ref as 'bucket/object_name'."""
+
+    def _put() -> None:
+        client = get_minio()
+        _ensure_bucket(client, bucket)
+        client.put_object(bucket, object_name, io.BytesIO(data), len(data), content_type=content_type)
+
+    await asyncio.to_thread(_put)
+    return f"{bucket}/{object_name}"
+
+
+async def get_bytes(ref: str) -> bytes:
+    """Download an object by 'bucket/object_name' ref."""
+    bucket, object_name = _split_ref(ref)
+
+    def _get() -> bytes:
+        response = get_minio().get_object(bucket, object_name)
+        try:
+            return response.read()
+        finally:
+            response.close()
+            response.release_conn()
+
+    return await asyncio.to_thread(_get)
+
+
+async def delete_prefix(bucket: str, prefix: str) -> None:
+    """Delete every object under prefix."""
+
+    def _delete() -> None:
+        client = get_minio()
+        names = [DeleteObject(o.object_name) for o in client.list_objects(bucket, prefix=prefix, recursive=True)]
+        for error in client.remove_objects(bucket, names):  # Lazy: iterating performs the deletes
+            raise RuntimeError(f"Could not delete {error.object_name}: {error.message}")
+
+    await asyncio.to_thread(_delete)
+
+
+async def delete_objects(refs: list[str]) -> None:
+    """Delete objects by 'bucket/object_name' ref. Missing objects are not an error."""
+    by_bucket: dict[str, list[DeleteObject]] = {}
+    for ref in refs:
+        bucket, object_name = _split_ref(ref)
+        by_bucket.setdefault(bucket, []).append(DeleteObject(object_name))
+
+    def _delete() -> None:
+        client = get_minio()
+        for bucket, names in by_bucket.items():
+            for error in client.remove_objects(bucket, names):  # Lazy: iterating performs the deletes
+                raise RuntimeError(f"Could not delete {error.object_name}: {error.message}")
+
+    await asyncio.to_thread(_delete)
+
+
+def payload_object_name(job_id: str, kind: str) -> str:
+    """Object name for a job's input/output payload in the payload bucket."""
+    return f"jobs/{job_id}/{kind}.json"
+
+
+async def offload_payload(job_id: str, kind: str, payload: dict) -> str | None:
+    """
+    Store a job payload in MinIO when it exceeds payload_inline_max_bytes.
+    Returns the ref, or None when the payload is small enough to keep inline (Redis/JSONB).
+    """
+    data = json.dumps(payload).encode()
+    if len(data) <= settings.payload_inline_max_bytes:
+        return None
+    return await put_bytes(
+        settings.minio_payload_bucket, payload_object_name(job_id, kind), data, "application/json"
+    )
+
+
+async def load_payload(ref: str) -> dict:
+    """Fetch a payload stored by offload_payload (or by the inference container)."""
+    return json.loads(await get_bytes(ref))
@@ -1,10 +1,11 @@
 """Usage tracking and limit enforcement."""
 from datetime import date, datetime, timedelta, timezone
 
-from sqlalchemy import func, select
-from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
 
-from api.models import User, UsageRecord
+from api.models import User, UsageGranularity, UsageRecord, UsageRollup
 from api.models import UserPlan, PLAN_LIMITS
 
 
@@ -19,6 +20,110 @@ def _period_start_end() -> tuple[datetime, datetime]:
     return start, end
 
 
+def daily_rollup_totals(start: datetime, end: datetime):
+    """
+    Select (tokens, cpu, gpu, jobs) summed over daily rollups in [start, end].
+    Exact for day-aligned windows; callers add their own user filter / grouping.
+    """
+    return select(
+        func.coalesce(func.sum(UsageRollup.tokens_used), 0).label("tokens"),
+        func.coalesce(func.sum(UsageRollup.compute_seconds), 0).label("cpu"),
+        func.coalesce(func.sum(UsageRollup.gpu_seconds), 0).label("gpu"),
+        func.coalesce(func.sum(UsageRollup.job_count), 0).label("jobs"),
+    ).where(
+        UsageRollup.granularity == UsageGranularity.DAY.value,
+        UsageRollup.bucket_start >= start,
+        UsageRollup.bucket_start <= end,
+    )
+
+
+async def record_usage(
+    db: AsyncSession,
+    *,
+    user_id: str,
+    job_id: str | None,
+    tokens_used: int = 0,
+    compute_seconds: float = 0.0,
+    gpu_seconds: float = 0.0,
+    batch_id: str | None = None,
+    job_count: int = 1,
+) -> UsageRecord:
+    """
+    Add a UsageRecord and bump its daily rollup in the same transaction. There are no hourly
+    rollups: every reader (/usage, /usage/history, plan limits, the usage gauges) sums whole UTC
+    days, so an hourly bucket would only double the upserts per record.
+    A batch chunk is one record (batch_id) counting job_count requests, one per line.
+    """
+    now = datetime.now(timezone.utc)
+    usage = UsageRecord(
+        user_id=user_id,
+        job_id=job_id,
+        batch_id=batch_id,
+        tokens_used=tokens_used,
+        compute_seconds=compute_seconds,
+        gpu_seconds=gpu_seconds,
+        job_count=job_count,
+        created_at=now,
+    )
+    db.add(usage)
+
+    stmt = pg_insert(UsageRollup).values(
+        user_id=user_id,
+        granularity=UsageGranularity.DAY.value,
+        bucket_start=now.replace(hour=0, minute=0, second=0, microsecond=0),
+        tokens_used=tokens_used,
+        compute_seconds=compute_seconds,
+        gpu_seconds=gpu_seconds,
+        job_count=job_count,
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[UsageRollup.user_id, UsageRollup.granularity, UsageRollup.bucket_start],
+        set_={
+            "tokens_used": UsageRollup.tokens_used + stmt.excluded.tokens_used,
+            "compute_seconds": UsageRollup.compute_seconds + stmt.excluded.compute_seconds,
+            "gpu_seconds": UsageRollup.gpu_seconds + stmt.excluded.gpu_seconds,
+            "job_count": UsageRollup.job_count + stmt.excluded.job_count,
+        },
+    )
+    await db.execute(stmt)
+    return usage
+
+
+async def backfill_usage_rollups(conn: AsyncConnection) -> None:
+    """
+    Recompute every daily rollup that has raw usage_records from those records, including
+    buckets live upserts already filled in part. The table lock holds back record_usage
+    upserts until the caller commits, so none is overwritten by a stale sum.
+    """
+    await conn.execute(text("LOCK TABLE usage_rollups IN SHARE ROW EXCLUSIVE MODE"))
+    await conn.execute(
+        text(
+            """
+            INSERT INTO usage_rollups
+                (user_id, granularity, bucket_start, tokens_used, compute_seconds, gpu_seconds, job_count)
+            SELECT user_id, :granularity,
+                   date_trunc(:granularity, created_at AT TIME ZONE 'UTC') AT TIME ZONE 'UTC',
+                   COALESCE(SUM(tokens_used), 0), COALESCE(SUM(compute_seconds), 0),
+                   COALESCE(SUM(gpu_seconds), 0), COALESCE(SUM(job_count), 0)
+            FROM usage_records
+            GROUP BY 1, 2, 3
+            ON CONFLICT (user_id, granularity, bucket_start) DO UPDATE SET
+                tokens_used = EXCLUDED.tokens_used,
+                compute_seconds = EXCLUDED.compute_seconds,
+                gpu_seconds = EXCLUDED.gpu_seconds,
+                job_count = EXCLUDED.job_count
+            """
+        ),
+        {"granularity": UsageGranularity.DAY.value},
+    )
+
+
+def period_usage_subquery(user_id: str):
+    """One-row subquery of the user's current-period totals (tokens, cpu, gpu, jobs), for joins."""
+    start, end = _period_start_end()
+    return daily_rollup_totals(start, end).where(UsageRollup.user_id == user_id).subquery("period_usage")
+
+
 async def get_current_period_usage(
     db: AsyncSession,
     user_id: str,
@@ -26,15 +131,7 @@ async def get_current_period_usage(
     """Return (tokens_used, cpu_seconds, gpu_seconds) for the current period (month)."""
     start, end = _period_start_end()
     result = await db.execute(
-        select(
-            func.coalesce(func.sum(UsageRecord.tokens_used), 0).label("tokens"),
-            func.coalesce(func.sum(UsageRecord.compute_seconds), 0).label("cpu"),
-            func.coalesce(func.sum(UsageRecord.gpu_seconds), 0).label("gpu"),
-        ).where(
-            UsageRecord.user_id == user_id,
-            UsageRecord.created_at >= start,
-            UsageRecord.created_at <= end,
-        )
+        daily_rollup_totals(start, end).where(UsageRollup.user_id == user_id)
     )
     row = result.one()
     return int(row.tokens), float(row.cpu), float(row.gpu)
@@ -66,8 +163,20 @@ async def check_usage_limits(
     Check if user is within their plan limits. Returns (ok, error_message).
     For GPU jobs, checks gpu_limit. For CPU jobs, checks cpu_limit.
     """
-    token_limit, cpu_limit, gpu_limit = await get_limits_for_user(db, user_id)
-    tokens_used, cpu_used, gpu_used = await get_current_period_usage(db, user_id)
+    limits = await get_limits_for_user(db, user_id)
+    used = await get_current_period_usage(db, user_id)
+    return evaluate_usage_limits(limits, used, is_gpu_job=is_gpu_job)
+
+
+def evaluate_usage_limits(
+    limits: tuple[int, float, float],
+    used: tuple[int, float, float],
+    *,
+    is_gpu_job: bool = False,
+) -> tuple[bool, str | None]:
+    """check_usage_limits on already-loaded (token, cpu, gpu) limits and usage."""
+    token_limit, cpu_limit, gpu_limit = limits
+    tokens_used, cpu_used, gpu_used = used
 
     if token_limit > 0 and tokens_used >= token_limit:
         return False, f"Token limit reached ({tokens_used:,}/{token_limit:,} this month). Upgrade to Pro for more."
@@ -0,0 +1,294 @@
+"""
+Completion webhooks.
+When a job reaches a final state its /status body is queued for the webhook URL given on the
+request (RunRequest.webhook_url) or in the deployment config ("webhook_url"); output offloaded to
+MinIO is queued as its ref and loaded only when the POST is sent. Deliveries live in
+Redis: messages in a hash, ids in a ZSET scored by next attempt time. The dispatcher (one per
+API replica) claims due deliveries with a lease, POSTs them over a pooled HTTP client and retries
+failures with exponential backoff; a replica that dies mid-delivery leaves its lease to expire.
+URLs are user-supplied, so before each POST the host is resolved and the delivery dropped unless
+every address is public (no loopback, private, link-local or webhook_blocked_networks, no
+cluster-internal names). The POST then connects to a checked address instead of resolving the
+name again (Host and TLS still use the name); redirects are never followed.
+
+Deployment config:
+  webhook_url         default URL for the deployment's jobs
+  webhook_secret      signs every POST: Quantlix-Signature: t=<unix>,v1=<hex HMAC-SHA256 of "<t>.<body>">
+  webhook_batch_size  > 1 sends up to that many jobs per POST as {"jobs": [...]}; else one job per POST
+"""
+import asyncio
+import hashlib
+import hmac
+import ipaddress
+import json
+import logging
+import random
+import socket
+import time
+import uuid
+from collections import defaultdict
+from functools import lru_cache
+
+import httpx
+
+from api.config import settings
+from api.metrics import quantlix_webhook_deliveries_total
+from api.models import Deployment, Job, JobStatus
+from api.queue import shared_redis
+from api.schemas import StatusResponse
+from api.storage import load_payload
+
+logger = logging.getLogger(__name__)
+
+WEBHOOKS_DUE = "webhooks:due"
+WEBHOOKS_PAYLOADS = "webhooks:payloads"
+SIGNATURE_HEADER = "Quantlix-Signature"
+MAX_BATCH_SIZE = 100
+INTERNAL_HOST_SUFFIXES = (".localhost", ".local", ".internal", ".svc", ".cluster.local")
+
+# KEYS[1] = due ZSET, KEYS[2] = payload hash; ARGV = now, lease expiry, limit
+# Leases up to limit due deliveries and returns their messages; ids whose message is gone are dropped.
+_CLAIM_SCRIPT = """
+local ids = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[3]))
+local out = {}
+for _, id in ipairs(ids) do
+  local raw = redis.call('HGET', KEYS[2], id)
+  if raw then
+    redis.call('ZADD', KEYS[1], ARGV[2], id)
+    table.insert(out, raw)
+  else
+    redis.call('ZREM', KEYS[1], id)
+  end
+end
+return out
+"""
+
+_scripts: dict[str, object] = {}
+
+
+def _script(source: str):
+    if source not in _scripts:
+        _scripts[source] = shared_redis().register_script(source)
+    return _scripts[source]
+
+
+def sign(secret: str, timestamp: int, body: bytes) -> str:
+    """Quantlix-Signature header value for a webhook body."""
+    digest = hmac.new(secret.encode(), f"{timestamp}.".encode() + body, hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={digest}"
+
+
+@lru_cache
+def _blocked_networks() -> tuple[ipaddress.IPv4Network | ipaddress.IPv6Network, ...]:
+    return tuple(
+        ipaddress.ip_network(cidr.strip(), strict=False)
+        for cidr in settings.webhook_blocked_networks.split(",")
+        if cidr.strip()
+    )
+
+
+async def public_address(url: str) -> str | None:
+    """
+    An address to connect to for url's host if it resolves only to globally routable addresses
+    outside webhook_blocked_networks, else None. Deliveries connect to this address rather than
+    resolving again, so a DNS answer that changes after the check cannot redirect them.
+    """
+    try:
+        host = httpx.URL(url).host.rstrip(".").lower()
+    except httpx.InvalidURL:
+        return None
+    if not host or host == "localhost" or host.endswith(INTERNAL_HOST_SUFFIXES) or ("." not in host and ":" not in host):
+        return None  # Bare names resolve through the cluster's search domains
+    try:
+        infos = await asyncio.get_running_loop().getaddrinfo(host, None, type=socket.SOCK_STREAM)
+    except OSError:
+        return None
+    for *_, sockaddr in infos:
+        ip = ipaddress.ip_address(sockaddr[0].split("%")[0])
+        if not ip.is_global or any(ip in net for net in _blocked_networks()):
+            return None
+    return infos[0][4][0] if infos else None
+
+
+async def job_status_response(job: Job, load_output: bool = True) -> StatusResponse:
+    """
+    GET /status body for a job; webhooks deliver the same document.
+    load_output=False leaves offloaded output (job.output_ref) unloaded: output_data is None.
+    """
+    retry_after = 60 if (job.guardrail_blocked or job.policy_action == "block") else None
+    if job.output_ref:
+        output_data = await load_payload(job.output_ref) if load_output else None
+    else:
+        output_data = job.output_data
+    return StatusResponse(
+        id=job.id,
+        type="job",
+        status=job.status,
+        created_at=job.created_at,
+        updated_at=job.completed_at,
+        error_message=job.error_message,
+        output_data=output_data,
+        tokens_used=job.tokens_used,
+        compute_seconds=job.compute_seconds,
+        guardrail_blocked=job.guardrail_blocked,
+        policy_action=job.policy_action,
+        retry_after_seconds=retry_after,
+    )
+
+
+async def queue_webhooks(jobs: list[Job], deployment: Deployment) -> int:
+    """
+    Queue completion webhooks for finished jobs of one deployment (call after commit).
+    Jobs without a webhook URL are skipped. Best effort: a Redis error is logged, not raised.
+    Returns the number queued.
+    """
+    cfg = deployment.config or {}
+    final = (JobStatus.COMPLETED.value, JobStatus.FAILED.value, JobStatus.CANCELLED.value)
+    deliveries: dict[str, str] = {}
+    try:
+        for job in jobs:
+            url = job.webhook_url or cfg.get("webhook_url")
+            if not url or job.status not in final:
+                continue
+            delivery_id = str(uuid.uuid4())
+            deliveries[delivery_id] = json.dumps({
+                "id": delivery_id,
+                "url": url,
+                "secret": cfg.get("webhook_secret"),
+                "batch_size": max(1, min(int(cfg.get("webhook_batch_size", 1)), MAX_BATCH_SIZE)),
+                "attempts": 0,
+                # Offloaded output stays in MinIO until the POST (see _post), not in Redis across retries
+                "job": (await job_status_response(job, load_output=False)).model_dump(mode="json"),
+                "output_ref": job.output_ref,
+            })
+        if deliveries:
+            pipe = shared_redis().pipeline(transaction=True)
+            pipe.hset(WEBHOOKS_PAYLOADS, mapping=deliveries)
+            pipe.zadd(WEBHOOKS_DUE, {delivery_id: time.time() for delivery_id in deliveries})
+            await pipe.execute()
+    except Exception as e:
+        logger.warning("Could not queue webhooks for deployment %s: %s", deployment.id, e)
+        return 0
+    return len(deliveries)
+
+
+async def queue_webhook(job: Job, deployment: Deployment) -> int:
+    return await queue_webhooks([job], deployment)
+
+
+def _backoff_seconds(attempts: int) -> float:
+    wait = settings.webhook_backoff_base_seconds * 2 ** (attempts - 1)
+    return min(wait, settings.webhook_backoff_max_seconds) * random.uniform(0.8, 1.2)
+
+
+async def _post(client: httpx.AsyncClient, batch: list[dict]) -> bool | None:
+    """POST one delivery, or a batch of deliveries to the same URL. True on 2xx; None if the URL is not allowed."""
+    first = batch[0]
+    url = httpx.URL(first["url"])
+    headers = {"Content-Type": "application/json", "Quantlix-Delivery": first["id"]}
+    extensions = {}
+    if not settings.webhook_allow_private_networks:
+        address = await public_address(first["url"])
+        if address is None:
+            logger.warning("Webhook %s to %s rejected: host is not a public address", first["id"], first["url"])
+            return None
+        # Connect to the vetted address; Host and TLS (SNI, certificate check) keep the name
+        headers["Host"] = url.netloc.decode("ascii")
+        extensions["sni_hostname"] = url.host
+        url = url.copy_with(host=address)
+    try:
+        jobs = [
+            {**d["job"], "output_data": await load_payload(d["output_ref"])} if d.get("output_ref") else d["job"]
+            for d in batch
+        ]
+    except Exception as e:
+        logger.info("Webhook %s: could not load offloaded output: %s", first["id"], e)
+        return False
+    document = {"jobs": jobs} if first["batch_size"] > 1 else jobs[0]
+    body = json.dumps(document, separators=(",", ":")).encode()
+    if first["secret"]:
+        headers[SIGNATURE_HEADER] = sign(first["secret"], int(time.time()), body)
+    try:
+        r = await client.post(url, content=body, headers=headers, extensions=extensions)
+    except httpx.HTTPError as e:
+        logger.info("Webhook %s to %s failed: %s", first["id"], first["url"], e)
+        return False
+    if r.is_success:
+        return True
+    logger.info("Webhook %s to %s returned %d", first["id"], first["url"], r.status_code)
+    return False
+
+
+async def deliver_due_webhooks(client: httpx.AsyncClient, limit: int) -> int:
+    """
+    Claim up to limit due deliveries and send them, batching per (URL, secret) where the
+    deployment asks for it. Failures are rescheduled with backoff or dropped after
+    webhook_max_attempts. Returns the number of deliveries claimed.
+    """
+    now = time.time()
+    raws = await _script(_CLAIM_SCRIPT)(
+        keys=[WEBHOOKS_DUE, WEBHOOKS_PAYLOADS],
+        args=[now, now + settings.webhook_lease_seconds, limit],
+    )
+    if not raws:
+        return 0
+
+    groups: dict[tuple, list[dict]] = defaultdict(list)
+    for raw in raws:
+        delivery = json.loads(raw)
+        groups[(delivery["url"], delivery["secret"], delivery["batch_size"])].append(delivery)
+    batches = [
+        group[i:i + size]
+        for (_, _, size), group in groups.items()
+        for i in range(0, len(group), size)
+    ]
+    results = await asyncio.gather(*(_post(client, batch) for batch in batches))
+
+    pipe = shared_redis().pipeline(transaction=False)
+    for batch, ok in zip(batches, results):
+        for delivery in batch:
+            delivery["attempts"] += 1
+            if ok is None:
+                pipe.zrem(WEBHOOKS_DUE, delivery["id"])
+                pipe.hdel(WEBHOOKS_PAYLOADS, delivery["id"])
+                result = "rejected"
+            elif ok or delivery["attempts"] >= settings.webhook_max_attempts:
+                pipe.zrem(WEBHOOKS_DUE, delivery["id"])
+                pipe.hdel(WEBHOOKS_PAYLOADS, delivery["id"])
+                result = "delivered" if ok else "dropped"
+                if not ok:
+                    logger.warning("Dropping webhook %s to %s after %d attempts", delivery["id"], delivery["url"], delivery["attempts"])
+            else:
+                pipe.hset(WEBHOOKS_PAYLOADS, delivery["id"], json.dumps(delivery))
+                pipe.zadd(WEBHOOKS_DUE, {delivery["id"]: time.time() + _backoff_seconds(delivery["attempts"])})
+                result = "retried"
+            quantlix_webhook_deliveries_total.labels(result=result).inc()
+    await pipe.execute()
+    return len(raws)
+
+
+def webhook_client() -> httpx.AsyncClient:
+    """Pooled client shared by all deliveries of one dispatcher."""
+    return httpx.AsyncClient(
+        timeout=settings.webhook_timeout_seconds,
+        limits=httpx.Limits(
+            max_connections=settings.webhook_max_connections,
+            max_keepalive_connections=settings.webhook_max_connections,
+        ),
+        follow_redirects=False,
+    )
+
+
+async def run_webhook_dispatcher(client: httpx.AsyncClient | None = None) -> None:
+    """Dispatcher loop: drain due deliveries, then poll every webhook_poll_seconds."""
+    client = client or webhook_client()
+    try:
+        while True:
+            try:
+                while await deliver_due_webhooks(client, settings.webhook_claim_batch) == settings.webhook_claim_batch:
+                    pass
+            except Exception as e:
+                logger.exception("Webhook dispatch failed: %s", e)
+            await asyncio.sleep(settings.webhook_poll_seconds)
+    finally:
+        await client.aclose()
@@ -414,12 +414,132 @@ def status(
             table.add_row("compute_seconds", str(result.compute_seconds))
         if result.output_data:
             table.add_row("output_data", json.dumps(result.output_data, indent=2))
+        if result.rollout:
+            table.add_row("rollout", result.rollout.get("phase") or "")
+            for phase, seconds in (result.rollout.get("timings") or {}).items():
+                table.add_row(f"  {phase}", f"{seconds}s")
         console.print(table)
     except Exception as e:
         console.print(f"[red]Error: {e}[/red]")
         raise typer.Exit(1)
 
 
+@app.command()
+def cancel(
+    job_id: str = typer.Argument(..., help="Job ID to cancel"),
+    api_key: Optional[str] = typer.Option(None, "--api-key", "-k", envvar="QUANTLIX_API_KEY"),
+    base_url: Optional[str] = typer.Option(None, "--url", "-u", envvar="QUANTLIX_API_URL"),
+):
+    """Cancel a queued or running job."""
+    client = _get_client(api_key=api_key, base_url=base_url)
+    try:
+        result = client.cancel(job_id)
+        console.print(f"[green]{result.message}[/green]")
+        console.print(f"  job_id: [bold]{result.job_id}[/bold]")
+        if result.compute_seconds is not None:
+            console.print(f"  compute billed: {result.compute_seconds}s")
+    except Exception as e:
+        console.print(f"[red]Error: {e}[/red]")
+        raise typer.Exit(1)
+
+
+def _print_batch(result) -> None:
+    table = Table(show_header=False)
+    table.add_column("Field", style="dim")
+    table.add_column("Value", style="")
+    table.add_row("id", result.id)
+    table.add_row("deployment_id", result.deployment_id)
+    table.add_row("status", result.status)
+    table.add_row("progress", f"{result.processed_lines}/{result.total_lines} lines")
+    table.add_row("succeeded", str(result.succeeded_lines))
+    table.add_row("failed", str(result.failed_lines))
+    table.add_row("tokens_used", str(result.tokens_used))
+    table.add_row("compute_seconds", str(result.compute_seconds))
+    if result.gpu_seconds:
+        table.add_row("gpu_seconds", str(result.gpu_seconds))
+    if result.error_message:
+        table.add_row("error_message", result.error_message)
+    console.print(table)
+
+
+@app.command("batch-submit")
+def batch_submit(
+    deployment_id: str = typer.Argument(..., help="Deployment ID that runs every line"),
+    file: Path = typer.Argument(..., help='JSONL file, one {"input": ..., "custom_id": "..."} per line'),
+    api_key: Optional[str] = typer.Option(None, "--api-key", "-k", envvar="QUANTLIX_API_KEY"),
+    base_url: Optional[str] = typer.Option(None, "--url", "-u", envvar="QUANTLIX_API_URL"),
+):
+    """Submit a bulk batch from a JSONL file (runs at low priority)."""
+    client = _get_client(api_key=api_key, base_url=base_url)
+    path = file.expanduser()
+    if not path.exists():
+        console.print(f"[red]Error: File not found: {file}[/red]")
+        raise typer.Exit(1)
+    try:
+        result = client.submit_batch(deployment_id, path.read_bytes())
+        console.print("[green]Batch queued[/green]")
+        console.print(f"  batch_id: [bold]{result.id}[/bold]")
+        console.print(f"  lines: {result.total_lines}")
+    except Exception as e:
+        console.print(f"[red]Error: {e}[/red]")
+        raise typer.Exit(1)
+
+
+@app.command("batch-status")
+def batch_status(
+    batch_id: str = typer.Argument(..., help="Batch ID"),
+    api_key: Optional[str] = typer.Option(None, "--api-key", "-k", envvar="QUANTLIX_API_KEY"),
+    base_url: Optional[str] = typer.Option(None, "--url", "-u", envvar="QUANTLIX_API_URL"),
+):
+    """Get status and progress of a batch."""
+    client = _get_client(api_key=api_key, base_url=base_url)
+    try:
+        _print_batch(client.batch_status(batch_id))
+    except Exception as e:
+        console.print(f"[red]Error: {e}[/red]")
+        raise typer.Exit(1)
+
+
+@app.command("batch-output")
+def batch_output(
+    batch_id: str = typer.Argument(..., help="Batch ID"),
+    output: Optional[Path] = typer.Option(None, "--output", "-o", help="Write JSONL here instead of stdout"),
+    api_key: Optional[str] = typer.Option(None, "--api-key", "-k", envvar="QUANTLIX_API_KEY"),
+    base_url: Optional[str] = typer.Option(None, "--url", "-u", envvar="QUANTLIX_API_URL"),
+):
+    """Print (or save) the output lines a batch has written so far."""
+    client = _get_client(api_key=api_key, base_url=base_url)
+    try:
+        lines = client.batch_output(batch_id)
+    except Exception as e:
+        console.print(f"[red]Error: {e}[/red]")
+        raise typer.Exit(1)
+    data = "".join(json.dumps(line) + "\n" for line in lines)
+    if output:
+        output.expanduser().write_text(data)
+        console.print(f"[green]Wrote {len(lines)} lines to {output}[/green]")
+    else:
+        typer.echo(data, nl=False)
+
+
+@app.command("batch-cancel")
+def batch_cancel(
+    batch_id: str = typer.Argument(..., help="Batch ID to cancel"),
+    api_key: Optional[str] = typer.Option(None, "--api-key", "-k", envvar="QUANTLIX_API_KEY"),
+    base_url: Optional[str] = typer.Option(None, "--url", "-u", envvar="QUANTLIX_API_URL"),
+):
+    """Cancel a queued or running batch (a chunk already running still finishes)."""
+    client = _get_client(api_key=api_key, base_url=base_url)
+    try:
+        result = client.cancel_batch(batch_id)
+        console.print("[green]Batch cancelled[/green]")
+        console.print(f"  batch_id: [bold]{result.id}[/bold]")
+        console.print(f"  processed: {result.processed_lines}/{result.total_lines} lines")
+    except Exception as e:
+        console.print(f"[red]Error: {e}[/red]")
+        raise typer.Exit(1)
+
+
 @app.command()
 def usage(
     start_date: Optional[str] = typer.Option(None, "--start", "-s", help="Start date (YYYY-MM-DD)"),
@@ -0,0 +1,313 @@
+"""
+Node-local model artifact cache, shared by every inference process on the node (MODEL_CACHE_DIR).
+Layout:
+  blobs/<sha256>        file contents, stored once per node however many models contain them
+  etags/<sha256>        (etag, size) of a store object -> blob digest, so known objects are not re-fetched
+  artifacts/<key>/      one model as it was listed in the store: hard links into blobs/
+  locks/<key>.lock      flock: shared while a process uses the artifact, exclusive to fetch or evict it
+  tmp/                  downloads and staged artifacts (same filesystem, so renames are atomic)
+The artifact key hashes the object listing (names, sizes, etags), so re-uploaded weights under
+the same model_path are a new artifact. The first process to need an artifact downloads it, split
+into ranged GETs run in parallel; others on the node block on its lock and then use the result.
+Artifacts are evicted least recently used first once blobs exceed the disk budget, skipping any a
+process still holds; a blob goes with its last artifact (no hard links left).
+"""
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+
+STREAM_CHUNK_BYTES = 1024 * 1024
+STALE_TMP_SECONDS = 24 * 3600  # Leftovers of crashed downloads
+
+
+class StoreObject(NamedTuple):
+    name: str  # Path within the model, e.g. "config.json"
+    key: str  # Store key passed back to read_range
+    size: int
+    etag: str
+
+
+class FilesystemStore:
+    """Model store in a local directory: model_path "bucket/prefix" is root/bucket/prefix (tests, local dev)."""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def list(self, model_path: str) -> list[StoreObject]:
+        base = os.path.join(self.root, model_path)
+        objects = []
+        for dirpath, _, files in os.walk(base):
+            for f in files:
+                path = os.path.join(dirpath, f)
+                st = os.stat(path)
+                objects.append(
+                    StoreObject(os.path.relpath(path, base), path, st.st_size, f"{st.st_mtime_ns:x}-{st.st_ino:x}")
+                )
+        return objects
+
+    def read_range(self, key: str, offset: int, length: int) -> Iterator[bytes]:
+        with open(key, "rb") as f:
+            f.seek(offset)
+            while length > 0 and (data := f.read(min(length, STREAM_CHUNK_BYTES))):
+                length -= len(data)
+                yield data
+
+
+class MinioStore:
+    """Model store in MinIO: model_path is "bucket/prefix"."""
+
+    def __init__(self, client):
+        self.client = client
+
+    def list(self, model_path: str) -> list[StoreObject]:
+        bucket, _, prefix = model_path.partition("/")
+        objects = []
+        for obj in self.client.list_objects(bucket, prefix=prefix, recursive=True):
+            name = obj.object_name[len(prefix):].lstrip("/") or os.path.basename(obj.object_name)
+            objects.append(StoreObject(name, f"{bucket}/{obj.object_name}", obj.size, obj.etag))
+        return objects
+
+    def read_range(self, key: str, offset: int, length: int) -> Iterator[bytes]:
+        bucket, _, name = key.partition("/")
+        response = self.client.get_object(bucket, name, offset=offset, length=length)
+        try:
+            yield from response.stream(STREAM_CHUNK_BYTES)
+        finally:
+            response.close()
+            response.release_conn()
+
+
+def _sha256(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def _file_digest(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while data := f.read(STREAM_CHUNK_BYTES):
+            h.update(data)
+    return h.hexdigest()
+
+
+def artifact_key(objects: list[StoreObject]) -> str:
+    return _sha256(json.dumps(sorted((o.name, o.size, o.etag) for o in objects)))
+
+
+class ModelCache:
+    def __init__(
+        self,
+        root: str,
+        store,
+        max_bytes: int = 0,
+        concurrency: int = 8,
+        range_bytes: int = 16 * 1024 * 1024,
+    ):
+        """max_bytes: disk budget for blobs (0 = unlimited). concurrency: ranged GETs in flight."""
+        self.root = root
+        self.store = store
+        self.max_bytes = max_bytes
+        self.concurrency = max(concurrency, 1)
+        self.range_bytes = max(range_bytes, STREAM_CHUNK_BYTES)
+        self._held: dict[str, int] = {}  # Artifact key -> lock fd, kept open while this process uses it
+        for sub in ("blobs", "etags", "artifacts", "locks", "tmp"):
+            os.makedirs(os.path.join(root, sub), exist_ok=True)
+
+    def _path(self, *parts: str) -> str:
+        return os.path.join(self.root, *parts)
+
+    def _lock(self, name: str, flags: int) -> int | None:
+        """Open and flock locks/<name>.lock; None if flags has LOCK_NB and it is taken."""
+        fd = os.open(self._path("locks", f"{name}.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, flags)
+        except BlockingIOError:
+            os.close(fd)
+            return None
+        return fd
+
+    def fetch(self, model_path: str) -> str:
+        """
+        Local directory with model_path's files, fetched into the cache unless already there.
+        The artifact stays held (never evicted) until release() or the process exits.
+        Raises FileNotFoundError if the store has nothing under model_path.
+        """
+        objects = self.store.list(model_path)
+        if not objects:
+            raise FileNotFoundError(f"Model {model_path} not found")
+        key = artifact_key(objects)
+        if key in self._held:
+            return self._path("artifacts", key)
+        fd = self._lock(key, fcntl.LOCK_SH)
+        try:
+            target = self._path("artifacts", key)
+            if not os.path.isdir(target):
+                fcntl.flock(fd, fcntl.LOCK_EX)  # Waits while another process fetches it
+                if not os.path.isdir(target):
+                    self._fill(key, objects, target)
+                fcntl.flock(fd, fcntl.LOCK_SH)
+            os.utime(target)  # Last use, for LRU eviction
+        except BaseException:
+            os.close(fd)
+            raise
+        self._held[key] = fd
+        return target
+
+    def release(self, path: str) -> None:
+        """Let the artifact at path (from fetch) be evicted again."""
+        fd = self._held.pop(os.path.basename(path), None)
+        if fd is not None:
+            os.close(fd)
+
+    def _blob_for(self, obj: StoreObject) -> str | None:
+        try:
+            with open(self._path("etags", _sha256(f"{obj.etag}:{obj.size}"))) as f:
+                return self._path("blobs", f.read().strip())
+        except FileNotFoundError:
+            return None
+
+    def _fill(self, key: str, objects: list[StoreObject], target: str) -> None:
+        staging = tempfile.mkdtemp(prefix=f"{key[:16]}-", dir=self._path("tmp"))
+        try:
+            missing = []
+            for obj in objects:
+                dest = os.path.join(staging, obj.name)
+                os.makedirs(os.path.dirname(dest), exist_ok=True)
+                blob = self._blob_for(obj)
+                try:
+                    if blob is None:
+                        raise FileNotFoundError
+                    os.link(blob, dest)
+                except FileNotFoundError:  # Unknown, or evicted since it was indexed
+                    missing.append((obj, dest))
+            self.evict(sum(obj.size for obj, _ in missing), keep=key)
+            self._download(missing)
+            for obj, dest in missing:
+                self._store_blob(obj, dest)
+            os.rename(staging, target)  # Atomic: a directory under artifacts/ is always complete
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+
+    def _download(self, missing: list[tuple[StoreObject, str]]) -> None:
+        """Fetch every missing object as ranged GETs of range_bytes, concurrency at a time."""
+        fds = {}
+        ranges = []
+        try:
+            for obj, dest in missing:
+                fds[dest] = os.open(dest, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o444)
+                os.ftruncate(fds[dest], obj.size)
+                ranges += [(obj, fds[dest], offset) for offset in range(0, obj.size, self.range_bytes)]
+
+            def get(item: tuple[StoreObject, int, int]) -> None:
+                obj, fd, offset = item
+                length = min(self.range_bytes, obj.size - offset)
+                for data in self.store.read_range(obj.key, offset, length):
+                    os.pwrite(fd, data, offset)
+                    offset += len(data)
+                    length -= len(data)
+                if length:
+                    raise OSError(f"Short read of {obj.key}: {length} bytes missing")
+
+            with ThreadPoolExecutor(self.concurrency) as pool:
+                list(pool.map(get, ranges))
+        finally:
+            for fd in fds.values():
+                os.close(fd)
+
+    def _store_blob(self, obj: StoreObject, dest: str) -> None:
+        """Move a downloaded file into blobs/ by content (staging keeps a link) and index its etag."""
+        digest = _file_digest(dest)
+        blob = self._path("blobs", digest)
+        try:
+            os.link(dest, blob)
+        except FileExistsError:  # Same content under another name: keep one copy
+            link = f"{dest}.link"
+            os.link(blob, link)
+            os.replace(link, dest)
+        index = self._path("etags", _sha256(f"{obj.etag}:{obj.size}"))
+        with open(f"{index}.tmp{os.getpid()}", "w") as f:
+            f.write(digest)
+        os.replace(f"{index}.tmp{os.getpid()}", index)
+
+    def usage(self) -> int:
+        """Bytes of blobs on disk."""
+        with os.scandir(self._path("blobs")) as entries:
+            return sum(e.stat().st_size for e in entries)
+
+    def evict(self, incoming: int = 0, keep: str | None = None) -> None:
+        """
+        Make room for incoming bytes within max_bytes: drop unreferenced blobs, then artifacts least
+        recently used first. Artifacts held by a process (or being fetched) and keep are skipped, so
+        the cache can end up over budget rather than pull a model out from under a running pod.
+        """
+        if not self.max_bytes:
+            return
+        fd = self._lock("evict", fcntl.LOCK_EX)  # One evictor per node at a time
+        try:
+            self._sweep()
+            if self.usage() + incoming <= self.max_bytes:
+                return
+            artifacts = [e for e in os.scandir(self._path("artifacts")) if e.name != keep]
+            for entry in sorted(artifacts, key=lambda e: e.stat().st_mtime):
+                lock = self._lock(entry.name, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                if lock is None:
+                    continue
+                try:
+                    # Rename first: a half-deleted artifact must never look complete
+                    doomed = tempfile.mkdtemp(prefix="evict-", dir=self._path("tmp"))
+                    os.rename(entry.path, os.path.join(doomed, "artifact"))
+                    shutil.rmtree(doomed)
+                finally:
+                    os.close(lock)
+                self._sweep()
+                if self.usage() + incoming <= self.max_bytes:
+                    return
+        finally:
+            os.close(fd)
+
+    def _sweep(self) -> None:
+        """Delete blobs no artifact links to and stale tmp/ leftovers."""
+        with os.scandir(self._path("blobs")) as entries:
+            for e in entries:
+                if e.stat().st_nlink == 1:
+                    os.unlink(e.path)
+        cutoff = time.time() - STALE_TMP_SECONDS
+        with os.scandir(self._path("tmp")) as entries:
+            for e in entries:
+                if e.stat(follow_symlinks=False).st_mtime < cutoff:
+                    shutil.rmtree(e.path, ignore_errors=True)
+
+
+def load_safetensors(path: str) -> dict:
+    """
+    Tensors of a .safetensors file, backed by a private mmap of it rather than copied into memory:
+    every process loading the file shares its pages through the page cache (copy-on-write).
+    """
+    import torch
+
+    dtypes = {
+        "F64": torch.float64, "F32": torch.float32, "F16": torch.float16, "BF16": torch.bfloat16,
+        "I64": torch.int64, "I32": torch.int32, "I16": torch.int16, "I8": torch.int8,
+        "U8": torch.uint8, "BOOL": torch.bool,
+    }
+    with open(path, "rb") as f:
+        header_len = int.from_bytes(f.read(8), "little")
+        header = json.loads(f.read(header_len))
+    size = os.path.getsize(path)
+    storage = torch.UntypedStorage.from_file(path, False, size)  # shared=False: MAP_PRIVATE
+    data = torch.empty(0, dtype=torch.uint8).set_(storage)
+    base = 8 + header_len
+    tensors = {}
+    for name, info in header.items():
+        if name == "__metadata__":
+            continue
+        begin, end = info["data_offsets"]
+        raw = data[base + begin:base + end]
+        tensors[name] = raw.view(dtypes[info["dtype"]]).reshape(info["shape"])
+    return tensors
@@ -2,55 +2,396 @@
 """
 Quantlix inference container — runs text generation with DistilGPT2.
 Modes:
-  - Job mode (K8s): JOB_ID, INPUT, REDIS_URL env → run inference, write result to Redis
-  - Server mode (local): HTTP server for orchestrator to call when MOCK_K8S=true
+  - Job mode (K8s): JOB_ID, INPUT_KEY (or INPUT_REF), REDIS_URL env → run inference, write result to Redis
+    (inference:result:{job_id}) and push it to inference:done:{job_id} for the waiting worker.
+    INPUT_KEY names a Redis string holding the input JSON, read in chunks. Large payloads go
+    through MinIO: INPUT_REF is read from it, outputs above PAYLOAD_INLINE_MAX_BYTES are written
+    to OUTPUT_REF instead of Redis. A literal INPUT env var is still accepted.
+  - Runner mode (K8s): RUNNER_QUEUE, RUNNER_LEASE_KEY, RUNNER_TOKEN → one pod serves many jobs of a
+    deployment, loading the model once: pops {job_id, input_key | input_ref, output_ref} items off
+    RUNNER_QUEUE and pushes each result as in job mode. Exits after RUNNER_MAX_JOBS jobs or
+    RUNNER_IDLE_SECONDS without work; renews RUNNER_LEASE_KEY meanwhile so no second runner starts.
+    A job's generation stops once inference:stop:{job_id} is set (cancelled or out of time).
+    Startup phases (pulling, loading, warming, ready) go to RUNNER_PHASE_KEY; results of smoke
+    items (deployment rollouts) carry the startup timings as "runner".
+  MODEL_PATH ("bucket/prefix" in MinIO), when set, is the model every mode loads, through the node's
+  model cache in MODEL_CACHE_DIR (a hostPath volume; see model_cache.py): pulled once per node with
+  MODEL_PULL_CONCURRENCY ranged GETs, evicted LRU beyond MODEL_CACHE_MAX_BYTES, safetensors mmapped.
+  MODEL_STORE_DIR replaces MinIO with a local directory holding bucket/prefix.
+  - Batch job mode (K8s): JOB_ID, BATCH_INPUT_REF, BATCH_OUTPUT_REF → one pod for a whole chunk of a
+    bulk batch: reads JSONL inputs from MinIO, generates GENERATION_BATCH_SIZE prompts at a time,
+    writes one JSONL output line per input and pushes {compute_seconds} to inference:done:{job_id}.
+  - Server mode (local): HTTP server for orchestrator to call when MOCK_K8S=true.
+    POST /cancel/{job_id} stops a running generation after its current token; POST /run_batch
+    runs a batch chunk ({job_id, inputs}) in one call.
 """
 import json
 import os
+import threading
 import time
+from functools import lru_cache
+
+READ_CHUNK_BYTES = 64 * 1024  # Payload reads never pull more than this per round-trip
+DEFAULT_MODEL = "distilbert/distilgpt2"
+
+
+def _minio_client():
+    from minio import Minio
+    return Minio(
+        os.environ.get("MINIO_ENDPOINT", "localhost:9000"),
+        access_key=os.environ.get("MINIO_ACCESS_KEY", "minioadmin"),
+        secret_key=os.environ.get("MINIO_SECRET_KEY", "minioadmin"),
+        secure=os.environ.get("MINIO_SECURE", "false").lower() == "true",
+    )
+
+
+def read_payload(ref: str) -> dict:
+    """Fetch a JSON payload by 'bucket/object' ref."""
+    bucket, _, name = ref.partition("/")
+    response = _minio_client().get_object(bucket, name)
+    try:
+        return json.loads(b"".join(response.stream(READ_CHUNK_BYTES)))
+    finally:
+        response.close()
+        response.release_conn()
+
+
+def write_payload(ref: str, payload: dict) -> None:
+    import io
+    bucket, _, name = ref.partition("/")
+    client = _minio_client()
+    if not client.bucket_exists(bucket):
+        client.make_bucket(bucket)
+    data = json.dumps(payload).encode()
+    client.put_object(bucket, name, io.BytesIO(data), len(data), content_type="application/json")
+
+
+def read_jsonl(ref: str) -> list[dict]:
+    bucket, _, name = ref.partition("/")
+    response = _minio_client().get_object(bucket, name)
+    try:
+        data = b"".join(response.stream(READ_CHUNK_BYTES))
+    finally:
+        response.close()
+        response.release_conn()
+    return [json.loads(line) for line in data.decode().splitlines() if line]
+
+
+def write_jsonl(ref: str, lines: list[dict]) -> None:
+    import io
+    bucket, _, name = ref.partition("/")
+    data = "".join(json.dumps(line) + "\n" for line in lines).encode()
+    _minio_client().put_object(bucket, name, io.BytesIO(data), len(data), content_type="application/x-ndjson")
+
+
+def read_input_key(redis_url: str, key: str) -> dict:
+    """Fetch a JSON input from a Redis string in GETRANGE chunks (no single huge reply)."""
+    import redis
+    r = redis.Redis.from_url(redis_url)
+    size = r.strlen(key)
+    if not size:
+        raise SystemExit(f"Input key {key} missing or expired")
+    chunks = [r.getrange(key, offset, offset + READ_CHUNK_BYTES - 1) for offset in range(0, size, READ_CHUNK_BYTES)]
+    return json.loads(b"".join(chunks))
+
+
+def _run_job(input_data: dict, output_ref: str | None, should_stop=None) -> dict:
+    """Inference for one job. Returns the result the worker expects; large output goes to output_ref."""
+    inline_max = int(os.environ.get("PAYLOAD_INLINE_MAX_BYTES", "16384"))
+    start = time.perf_counter()
+    result = run_inference(_prompt(input_data), should_stop=should_stop)
+    elapsed = time.perf_counter() - start
+
+    output_data = {"generated": result["text"], "model": "qx-example"}
+    output = {
+        "output_data": output_data,
+        "tokens_used": result.get("tokens_used", 50),
+        "compute_seconds": round(elapsed, 2),
+    }
+    if output_ref and len(json.dumps(output_data)) > inline_max:
+        write_payload(output_ref, output_data)
+        del output["output_data"]
+        output["output_ref"] = output_ref
+    return output
+
+
+def _push_result(r, job_id: str, output: dict) -> None:
+    raw = json.dumps(output)
+    done_key = f"inference:done:{job_id}"
+    pipe = r.pipeline()
+    pipe.setex(f"inference:result:{job_id}", 3600, raw)  # Read by the worker if it missed the push
+    pipe.lpush(done_key, raw)  # Wakes the worker's BLPOP immediately
+    pipe.expire(done_key, 3600)
+    pipe.execute()
+
 
 # Job mode: run once and exit
 def run_job_mode() -> None:
     job_id = os.environ.get("JOB_ID")
+    input_key = os.environ.get("INPUT_KEY")
+    input_ref = os.environ.get("INPUT_REF")
     input_str = os.environ.get("INPUT", "{}")
     redis_url = os.environ.get("REDIS_URL", "redis://localhost:6379/0")
     if not job_id:
         raise SystemExit("JOB_ID required in job mode")
 
+    if input_key:
+        input_data = read_input_key(redis_url, input_key)
+    elif input_ref:
+        input_data = read_payload(input_ref)
+    else:
+        try:
+            input_data = json.loads(input_str)
+        except json.JSONDecodeError:
+            input_data = {"prompt": input_str[:200]}
+
+    output = _run_job(input_data, os.environ.get("OUTPUT_REF"))
+
+    import redis
+    _push_result(redis.Redis.from_url(redis_url, decode_responses=True), job_id, output)
+    print(f"Wrote result to Redis for job {job_id}")
+
+
+# Renew the lease only while this pod still holds it
+RENEW_LEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+# Give the lease up when idle, unless work arrived meanwhile: 1 released, 0 queue not empty, -1 not ours
+RELEASE_LEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+  return -1
+end
+if ARGV[2] == '1' and redis.call('LLEN', KEYS[2]) > 0 then
+  return 0
+end
+redis.call('DEL', KEYS[1])
+return 1
+"""
+
+
+# Runner mode: many jobs of one deployment, model loaded once
+def run_runner_mode() -> None:
+    queue = os.environ["RUNNER_QUEUE"]
+    lease_key = os.environ["RUNNER_LEASE_KEY"]
+    token = os.environ["RUNNER_TOKEN"]
+    lease_seconds = int(os.environ.get("RUNNER_LEASE_SECONDS", "30"))
+    max_jobs = int(os.environ.get("RUNNER_MAX_JOBS", "32"))
+    idle_seconds = int(os.environ.get("RUNNER_IDLE_SECONDS", "30"))
+    redis_url = os.environ.get("REDIS_URL", "redis://localhost:6379/0")
+
+    import redis
+    r = redis.Redis.from_url(redis_url, decode_responses=True)
+    renew = r.register_script(RENEW_LEASE_SCRIPT)
+    release = r.register_script(RELEASE_LEASE_SCRIPT)
+    stopped = threading.Event()
+
+    def heartbeat() -> None:
+        while not stopped.wait(lease_seconds / 3):
+            try:
+                renew(keys=[lease_key], args=[token, lease_seconds])
+            except redis.RedisError as e:
+                print(f"Lease renewal failed: {e}")
+
+    threading.Thread(target=heartbeat, daemon=True).start()
+    renew(keys=[lease_key], args=[token, lease_seconds])
+
+    # Pull, load and warm the model before taking work
+    phase_key = os.environ.get("RUNNER_PHASE_KEY")
+    startup: dict[str, float] = {}
+    for phase, step in (
+        ("pulling", _model_dir),
+        ("loading", _generator),
+        ("warming", lambda: run_inference("Hello", max_new_tokens=8)),
+    ):
+        if phase_key:
+            r.set(phase_key, phase, ex=3600)
+        start = time.perf_counter()
+        step()
+        startup[f"{phase.removesuffix('ing')}_seconds"] = round(time.perf_counter() - start, 2)
+    if phase_key:
+        r.set(phase_key, "ready", ex=3600)
+
+    served = 0
     try:
-        input_data = json.loads(input_str)
-    except json.JSONDecodeError:
-        input_data = {"prompt": input_str[:200]}
+        while served < max_jobs:
+            popped = r.blpop(queue, timeout=idle_seconds)
+            if not popped:
+                if release(keys=[lease_key, queue], args=[token, "1"]) != 0:
+                    break
+                continue
+            item = json.loads(popped[1])
+            job_id = item["job_id"]
+            stop = f"inference:stop:{job_id}"
+            if r.exists(stop):
+                continue  # Cancelled between queueing and now
+            last_check = [0.0, False]
+
+            def should_stop() -> bool:
+                # One Redis round-trip per second at most, not per token
+                now = time.monotonic()
+                if now - last_check[0] >= 1.0:
+                    last_check[:] = [now, bool(r.exists(stop))]
+                return last_check[1]
 
+            try:
+                if item.get("input_key"):
+                    input_data = read_input_key(redis_url, item["input_key"])
+                else:
+                    input_data = read_payload(item["input_ref"])
+                output = _run_job(input_data, item.get("output_ref"), should_stop=should_stop)
+            except (Exception, SystemExit) as e:
+                output = {"error": f"Inference failed: {e}"}
+            if item.get("smoke"):
+                output["runner"] = startup
+            _push_result(r, job_id, output)
+            served += 1
+            print(f"Wrote result to Redis for job {job_id} ({served}/{max_jobs})")
+    finally:
+        stopped.set()
+        release(keys=[lease_key, queue], args=[token, "0"])  # Waiting workers start the next runner
+        if phase_key:
+            r.delete(phase_key)
+
+
+def _prompt(input_data: dict) -> str:
     prompt = input_data.get("prompt", input_data.get("text", "Hello"))
     if isinstance(prompt, list):
         prompt = prompt[0] if prompt else "Hello"
+    return str(prompt)
 
-    start = time.perf_counter()
-    result = run_inference(prompt)
-    elapsed = time.perf_counter() - start
 
-    output = {
-        "output_data": {"generated": result["text"], "model": "qx-example"},
-        "tokens_used": result.get("tokens_used", 50),
-        "compute_seconds": round(elapsed, 2),
-    }
+def _tokens_used(text: str) -> int:
+    # Rough token count (4 chars ~ 1 token for English)
+    return min(len(text.split()) * 2, 999)  # approximate
 
-    import redis
-    r = redis.Redis.from_url(redis_url, decode_responses=True)
-    r.setex(f"inference:result:{job_id}", 3600, json.dumps(output))
-    print(f"Wrote result to Redis for job {job_id}")
+
+@lru_cache
+def _model_dir() -> str:
+    """Local directory of MODEL_PATH from the node's model cache (fetched on a miss); else DEFAULT_MODEL."""
+    model_path = os.environ.get("MODEL_PATH")
+    if not model_path:
+        return DEFAULT_MODEL
+    from model_cache import FilesystemStore, MinioStore, ModelCache
+
+    store_dir = os.environ.get("MODEL_STORE_DIR")  # Local stand-in for MinIO (tests, local dev)
+    cache = ModelCache(
+        os.environ.get("MODEL_CACHE_DIR", "/var/cache/quantlix/models"),
+        FilesystemStore(store_dir) if store_dir else MinioStore(_minio_client()),
+        max_bytes=int(os.environ.get("MODEL_CACHE_MAX_BYTES", "0")),
+        concurrency=int(os.environ.get("MODEL_PULL_CONCURRENCY", "8")),
+        range_bytes=int(os.environ.get("MODEL_PULL_RANGE_BYTES", str(16 * 1024 * 1024))),
+    )
+    try:
+        return cache.fetch(model_path)
+    except FileNotFoundError as e:
+        raise SystemExit(str(e)) from None
+
+
+def _load_model(model_dir: str):
+    """
+    Causal LM from model_dir. Safetensors weights are mmapped (model_cache.load_safetensors), so
+    inference processes on a node share one copy in the page cache; other formats load as usual.
+    """
+    import glob
+
+    from transformers import AutoConfig, AutoModelForCausalLM
+
+    weights = sorted(glob.glob(os.path.join(model_dir, "*.safetensors")))
+    if not weights:
+        return AutoModelForCausalLM.from_pretrained(model_dir)
+    from model_cache import load_safetensors
+
+    state_dict = {}
+    for path in weights:  # Sharded checkpoints: model-0000N-of-0000M.safetensors
+        state_dict.update(load_safetensors(path))
+    return AutoModelForCausalLM.from_pretrained(
+        None, config=AutoConfig.from_pretrained(model_dir), state_dict=state_dict, low_cpu_mem_usage=True
+    )
 
 
-def run_inference(prompt: str, max_new_tokens: int = 50) -> dict:
-    """Run text generation. Returns {text, tokens_used}."""
-    from transformers import pipeline
-    generator = pipeline("text-generation", model="distilbert/distilgpt2")
-    out = generator(prompt, max_new_tokens=max_new_tokens, do_sample=True, pad_token_id=50256)
+@lru_cache
+def _generator():
+    """Text-generation pipeline, loaded once per process."""
+    from transformers import AutoTokenizer, pipeline
+    model_dir = _model_dir()
+    if model_dir == DEFAULT_MODEL:
+        generator = pipeline("text-generation", model=model_dir)
+    else:
+        generator = pipeline(
+            "text-generation", model=_load_model(model_dir), tokenizer=AutoTokenizer.from_pretrained(model_dir)
+        )
+    generator.tokenizer.pad_token_id = 50256  # GPT-2 has no pad token; batched prompts need one
+    generator.tokenizer.padding_side = "left"
+    return generator
+
+
+def run_inference(prompt: str, max_new_tokens: int = 50, should_stop=None) -> dict:
+    """Run text generation. Returns {text, tokens_used}. should_stop() is polled after each token."""
+    generator = _generator()
+    kwargs = {}
+    if should_stop:
+        import torch
+        from transformers import StoppingCriteria, StoppingCriteriaList
+
+        class _Abort(StoppingCriteria):
+            def __call__(self, input_ids, scores, **_):
+                return torch.full((input_ids.shape[0],), should_stop(), dtype=torch.bool, device=input_ids.device)
+
+        kwargs["stopping_criteria"] = StoppingCriteriaList([_Abort()])
+    out = generator(prompt, max_new_tokens=max_new_tokens, do_sample=True, pad_token_id=50256, **kwargs)
     text = out[0]["generated_text"] if out else ""
-    # Rough token count (4 chars ~ 1 token for English)
-    tokens_used = len(text.split()) * 2  # approximate
-    return {"text": text, "tokens_used": min(tokens_used, 999)}
+    return {"text": text, "tokens_used": _tokens_used(text)}
+
+
+def run_inference_batch(inputs: list[dict], max_new_tokens: int = 50) -> list[dict]:
+    """
+    Generate for many inputs, GENERATION_BATCH_SIZE prompts per forward pass.
+    Returns one {output_data, tokens_used} per input, in order.
+    """
+    batch_size = int(os.environ.get("GENERATION_BATCH_SIZE", "16"))
+    prompts = [_prompt(data)[:500] for data in inputs]
+    outs = _generator()(
+        prompts, max_new_tokens=max_new_tokens, do_sample=True, pad_token_id=50256, batch_size=batch_size
+    )
+    results = []
+    for out in outs:
+        text = out[0]["generated_text"] if out else ""
+        results.append({
+            "output_data": {"generated": text, "model": "qx-example"},
+            "tokens_used": _tokens_used(text),
+        })
+    return results
+
+
+# Batch job mode: one chunk of a bulk batch, then exit
+def run_batch_job_mode() -> None:
+    job_id = os.environ.get("JOB_ID")
+    input_ref = os.environ["BATCH_INPUT_REF"]
+    output_ref = os.environ.get("BATCH_OUTPUT_REF")
+    redis_url = os.environ.get("REDIS_URL", "redis://localhost:6379/0")
+    if not job_id or not output_ref:
+        raise SystemExit("JOB_ID and BATCH_OUTPUT_REF required in batch job mode")
+
+    inputs = read_jsonl(input_ref)
+    start = time.perf_counter()
+    outputs = run_inference_batch(inputs)
+    elapsed = time.perf_counter() - start
+    write_jsonl(output_ref, outputs)
+
+    import redis
+    r = redis.Redis.from_url(redis_url, decode_responses=True)
+    raw = json.dumps({"compute_seconds": round(elapsed, 2), "lines": len(outputs)})
+    done_key = f"inference:done:{job_id}"
+    pipe = r.pipeline()
+    pipe.setex(f"inference:result:{job_id}", 3600, raw)
+    pipe.lpush(done_key, raw)
+    pipe.expire(done_key, 3600)
+    pipe.execute()
+    print(f"Wrote {len(outputs)} batch outputs for {job_id}")
 
 
 # Server mode: HTTP API for local dev
@@ -63,7 +404,13 @@ def run_server_mode() -> None:
         job_id: str
         input: dict
 
+    class RunBatchRequest(BaseModel):
+        job_id: str
+        inputs: list[dict]
+
     app = FastAPI(title="Quantlix Inference")
+    running: set[str] = set()
+    cancelled: set[str] = set()
 
     @app.on_event("startup")
     def load_model():
@@ -71,11 +418,13 @@ def run_server_mode() -> None:
 
     @app.post("/run")
     def run(req: RunRequest) -> dict:
-        prompt = req.input.get("prompt", req.input.get("text", "Hello"))
-        if isinstance(prompt, list):
-            prompt = prompt[0] if prompt else "Hello"
         start = time.perf_counter()
-        result = run_inference(str(prompt)[:500])
+        running.add(req.job_id)
+        try:
+            result = run_inference(_prompt(req.input)[:500], should_stop=lambda: req.job_id in cancelled)
+        finally:
+            running.discard(req.job_id)
+            cancelled.discard(req.job_id)
         elapsed = time.perf_counter() - start
         return {
             "output_data": {"generated": result["text"], "model": "qx-example"},
@@ -83,6 +432,19 @@ def run_server_mode() -> None:
             "compute_seconds": round(elapsed, 2),
         }
 
+    @app.post("/run_batch")
+    def run_batch(req: RunBatchRequest) -> dict:
+        start = time.perf_counter()
+        outputs = run_inference_batch(req.inputs)
+        return {"outputs": outputs, "compute_seconds": round(time.perf_counter() - start, 2)}
+
+    @app.post("/cancel/{job_id}")
+    def cancel(job_id: str) -> dict:
+        if job_id not in running:
+            return {"status": "not_running"}
+        cancelled.add(job_id)
+        return {"status": "cancelling"}
+
     @app.get("/health")
     def health() -> dict:
         return {"status": "ok"}
@@ -92,7 +454,11 @@ def run_server_mode() -> None:
 
 
 if __name__ == "__main__":
-    if os.environ.get("JOB_ID"):
+    if os.environ.get("RUNNER_QUEUE"):
+        run_runner_mode()
+    elif os.environ.get("BATCH_INPUT_REF"):
+        run_batch_job_mode()
+    elif os.environ.get("JOB_ID"):
         run_job_mode()
     else:
         run_server_mode()
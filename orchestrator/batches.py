@@ -0,0 +1,256 @@
+"""
+Batch worker — runs one chunk of a bulk batch per queue message (see api.batches).
+Claim: a conditional UPDATE leases the batch's next chunk, so a duplicate message or a second
+worker finds nothing to do. Inference: input guardrails drop blocked lines, the rest go to one
+K8s Job (or one /run_batch call, or the mock) for the whole chunk; output guardrails run per line.
+Commit: the chunk's counters, its UsageRecord and the dispatch of the next chunk are written in
+one transaction, guarded by next_chunk so a chunk is never counted twice.
+Plan limits are checked before every chunk, not only at submission: a batch whose user runs out
+of tokens or compute fails with the limit message, keeping the chunks already done.
+"""
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func, or_, select, update
+
+from api.batches import read_batch_part, write_batch_part
+from api.db import async_session_maker
+from api.guardrails.base import GuardrailAction
+from api.guardrails.config import get_guardrail_config
+from api.guardrails.runner import run_guardrails
+from api.models import Batch, Deployment, JobStatus
+from api.outbox import add_batch_to_outbox
+from api.usage_service import check_usage_limits, record_usage
+from orchestrator.config import settings
+from orchestrator.inference_client import call_inference_batch_http, wait_for_inference_result
+from orchestrator.k8s import batch_run_id, create_batch_inference_job, delete_inference_job
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ChunkResult:
+    lines: list[dict] = field(default_factory=list)  # Output lines, in input order
+    succeeded: int = 0
+    failed: int = 0
+    tokens_used: int = 0
+    compute_seconds: float = 0.0
+
+
+async def _claim(batch_id: str) -> tuple[Batch, Deployment] | None:
+    """Lease the batch's next chunk for this worker. None if it is finished, cancelled or leased."""
+    now = datetime.now(timezone.utc)
+    async with async_session_maker() as db:
+        claimed = await db.scalar(
+            update(Batch)
+            .where(
+                Batch.id == batch_id,
+                Batch.status.in_([JobStatus.QUEUED.value, JobStatus.RUNNING.value]),
+                or_(Batch.lease_until.is_(None), Batch.lease_until < now),
+            )
+            .values(
+                status=JobStatus.RUNNING.value,
+                started_at=func.coalesce(Batch.started_at, func.now()),
+                lease_until=now + timedelta(seconds=settings.batch_chunk_timeout_seconds + 60),
+                chunk_attempts=Batch.chunk_attempts + 1,
+            )
+            .returning(Batch.id)
+        )
+        if claimed is None:
+            return None
+        row = (
+            await db.execute(
+                select(Batch, Deployment)
+                .join(Deployment, Batch.deployment_id == Deployment.id)
+                .where(Batch.id == batch_id)
+            )
+        ).one()
+        await db.commit()
+        return row.Batch, row.Deployment
+
+
+async def _usage_limit_error(batch: Batch, deployment: Deployment) -> str | None:
+    """Why the batch's user may not run another chunk (plan limits for this period), or None."""
+    async with async_session_maker() as db:
+        ok, err = await check_usage_limits(
+            db, str(batch.user_id), is_gpu_job=bool(deployment.config and deployment.config.get("gpu"))
+        )
+    return None if ok else err
+
+
+async def _infer(batch: Batch, deployment: Deployment, chunk: int, inputs: list[dict]) -> tuple[list[dict], float]:
+    """One inference call for the chunk's runnable inputs. Returns (one output per input, compute seconds)."""
+    run_id = batch_run_id(batch.id, chunk, batch.chunk_attempts)
+    timeout = settings.batch_chunk_timeout_seconds
+    job_name = await create_batch_inference_job(
+        batch.id,
+        chunk,
+        batch.chunk_attempts,
+        str(batch.user_id),
+        deployment.model_id,
+        inputs,
+        model_path=deployment.model_path,
+        use_gpu=bool(deployment.config and deployment.config.get("gpu")),
+    )
+    if job_name:
+        success, err, summary = await wait_for_inference_result(run_id, job_name, timeout_seconds=timeout)
+        if not success:
+            if err == "Timeout":
+                await delete_inference_job(job_name)
+            raise RuntimeError(f"Inference job {job_name} failed: {err}")
+        outputs = await read_batch_part(batch.id, "raw", chunk)
+        compute_seconds = (summary or {}).get("compute_seconds", 0.0)
+    elif settings.inference_url:
+        result = await call_inference_batch_http(run_id, inputs, timeout_seconds=timeout)
+        if result is None:
+            raise RuntimeError("Inference service unavailable")
+        outputs, compute_seconds = result["outputs"], result.get("compute_seconds", 0.0)
+    else:
+        # Pure mock: simulate one batched call
+        await asyncio.sleep(1)
+        outputs = [{"output_data": {"result": "ok", "mock": True}, "tokens_used": 100} for _ in inputs]
+        compute_seconds = 1.5
+    if len(outputs) != len(inputs):
+        raise RuntimeError(f"Inference returned {len(outputs)} outputs for {len(inputs)} inputs")
+    return outputs, compute_seconds
+
+
+async def _run_chunk(batch: Batch, deployment: Deployment, chunk: int, lines: list[dict]) -> ChunkResult:
+    enabled_rules, rule_config, fail_open, gr_timeout = get_guardrail_config(deployment)
+
+    def blocked(data: dict, stage: str) -> str | None:
+        passed, results = run_guardrails(
+            data, stage, enabled_rules, rule_config, timeout_seconds=gr_timeout, fail_open=fail_open
+        )
+        if passed:
+            return None
+        return next((r.message for r in results if r.action == GuardrailAction.BLOCK), f"{stage.capitalize()} blocked by guardrails")
+
+    result = ChunkResult()
+    first = chunk * batch.chunk_size
+    runnable: list[tuple[dict, dict]] = []
+    for i, item in enumerate(lines):
+        entry = {"line": first + i, "custom_id": item.get("custom_id")}
+        result.lines.append(entry)
+        reason = blocked(item["input"], "input")
+        if reason:
+            entry["error"] = reason
+        else:
+            runnable.append((entry, item["input"]))
+
+    if runnable:
+        outputs, result.compute_seconds = await _infer(batch, deployment, chunk, [data for _, data in runnable])
+        for (entry, _), output in zip(runnable, outputs):
+            if "error" in output:
+                entry["error"] = output["error"]
+                continue
+            output_data = output.get("output_data") or {}
+            reason = blocked(output_data, "output")
+            if reason:
+                entry["error"] = reason
+                continue
+            entry["output"] = output_data
+            entry["tokens_used"] = output.get("tokens_used", 0)
+            result.tokens_used += entry["tokens_used"]
+
+    result.failed = sum(1 for entry in result.lines if "error" in entry)
+    result.succeeded = len(result.lines) - result.failed
+    return result
+
+
+async def _commit_chunk(batch_id: str, chunk: int, result: ChunkResult, is_gpu: bool) -> None:
+    """Count and bill a finished chunk, then complete the batch or stage its next chunk."""
+    async with async_session_maker() as db:
+        batch = (await db.execute(select(Batch).where(Batch.id == batch_id).with_for_update())).scalar_one()
+        if batch.next_chunk != chunk:
+            logger.info("Batch %s chunk %d was already committed", batch_id, chunk)
+            return
+        secs = result.compute_seconds
+        batch.next_chunk = chunk + 1
+        batch.chunk_attempts = 0
+        batch.lease_until = None
+        batch.processed_lines += len(result.lines)
+        batch.succeeded_lines += result.succeeded
+        batch.failed_lines += result.failed
+        batch.tokens_used += result.tokens_used
+        batch.compute_seconds += 0.0 if is_gpu else secs
+        batch.gpu_seconds += secs if is_gpu else 0.0
+        await record_usage(
+            db,
+            user_id=str(batch.user_id),
+            job_id=None,
+            batch_id=batch_id,
+            tokens_used=result.tokens_used,
+            compute_seconds=0.0 if is_gpu else secs,
+            gpu_seconds=secs if is_gpu else 0.0,
+            job_count=len(result.lines),
+        )
+        if batch.status == JobStatus.RUNNING.value:  # Cancelled: keep what ran, start nothing new
+            if batch.next_chunk >= batch.total_chunks:
+                batch.status = JobStatus.COMPLETED.value
+                batch.completed_at = datetime.now(timezone.utc)
+            else:
+                add_batch_to_outbox(db, batch)
+        await db.commit()
+
+
+async def _retry_chunk(batch_id: str, chunk: int) -> None:
+    """Drop the lease and dispatch the chunk again now (its attempts are already counted)."""
+    async with async_session_maker() as db:
+        batch = (await db.execute(select(Batch).where(Batch.id == batch_id).with_for_update())).scalar_one()
+        if batch.next_chunk == chunk and batch.status == JobStatus.RUNNING.value:
+            batch.lease_until = None
+            add_batch_to_outbox(db, batch)
+        await db.commit()
+
+
+async def _fail_batch(batch_id: str, reason: str) -> None:
+    async with async_session_maker() as db:
+        await db.execute(
+            update(Batch)
+            .where(Batch.id == batch_id, Batch.status == JobStatus.RUNNING.value)
+            .values(
+                status=JobStatus.FAILED.value,
+                error_message=reason,
+                completed_at=datetime.now(timezone.utc),
+                lease_until=None,
+            )
+        )
+        await db.commit()
+
+
+async def process_batch_chunk(payload: dict) -> bool:
+    """
+    Run the next chunk of the batch in payload["job_id"]. Returns False without doing anything
+    when there is nothing to claim (duplicate message, batch finished, cancelled, or leased).
+    """
+    batch_id = payload.get("job_id")
+    claimed = await _claim(batch_id)
+    if not claimed:
+        logger.info("Batch %s skipped (finished, cancelled or already claimed)", batch_id)
+        return False
+    batch, deployment = claimed
+    chunk = batch.next_chunk
+    if batch.chunk_attempts > settings.batch_max_chunk_attempts:
+        await _fail_batch(batch_id, f"Chunk {chunk} failed {batch.chunk_attempts - 1} times")
+        logger.warning("Batch %s failed on chunk %d", batch_id, chunk)
+        return True
+    limit_error = await _usage_limit_error(batch, deployment)
+    if limit_error:
+        await _fail_batch(batch_id, limit_error)
+        logger.info("Batch %s stopped before chunk %d: %s", batch_id, chunk, limit_error)
+        return True
+
+    try:
+        lines = await read_batch_part(batch.id, "input", chunk)
+        result = await _run_chunk(batch, deployment, chunk, lines)
+        await write_batch_part(batch.id, "output", chunk, result.lines)
+    except Exception as e:
+        logger.exception("Batch %s chunk %d failed: %s", batch_id, chunk, e)
+        await _retry_chunk(batch_id, chunk)
+        return True
+    await _commit_chunk(batch_id, chunk, result, bool(deployment.config and deployment.config.get("gpu")))
+    logger.info("Batch %s chunk %d/%d done: %d ok, %d failed", batch_id, chunk + 1, batch.total_chunks, result.succeeded, result.failed)
+    return True
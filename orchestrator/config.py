@@ -16,6 +16,35 @@ class Settings(BaseSettings):
     mock_k8s: bool = False  # True = simulate completion without real K8s (for dev)
     inference_url: str = ""  # When mock_k8s: call this for real inference (e.g. http://inference:8080)
     inference_image: str = "quantlix-inference:latest"  # K8s Job container image
+    inference_input_ttl_seconds: int = 3600  # inference:input:{job_id} keys; outlive pending/retried pods
+    inference_timeout_seconds: int = 300  # Per-job inference budget when the job has no deadline
+    # Runner pods: one pod per deployment burst drains up to this many jobs (0 = one pod per job)
+    inference_runner_max_jobs: int = 32
+    inference_runner_idle_seconds: int = 30  # A runner pod exits after this long without work
+    inference_runner_start_seconds: int = 180  # Lease while a runner pod is scheduled and loads its model
+    inference_runner_max_pods: int = 8  # Runner pods per deployment at once (each generates one job at a time)
+    inference_runner_backlog_per_pod: int = 2  # Queued jobs per runner before another one is started
+    model_cache_host_path: str = "/var/cache/quantlix/models"  # Node-local model cache (hostPath) for inference pods
+    model_cache_max_bytes: int = 200 * 1024**3  # Disk budget of that cache; least recently used models evicted (0 = unlimited)
+    model_pull_concurrency: int = 8  # Parallel ranged GETs while an inference pod pulls a model
+
+    # Deployment rollouts (orchestrator.rollout)
+    rollout_timeout_seconds: int = 900  # Pull + load + warm + smoke inference; must stay below api rollout_stale_seconds
+
+    # Worker scaling (see infra/kubernetes/README.md for the KEDA ScaledObject)
+    worker_concurrency: int = 4  # Jobs one worker process runs at once (mostly waiting on K8s)
+    metrics_sample_seconds: float = 2.0  # Queue depth / age / saturation sampling interval
+
+    # Bulk batches (orchestrator.batches): one inference call per chunk of api batch_chunk_size lines
+    batch_chunk_timeout_seconds: int = 1800  # Inference budget per chunk; the chunk's lease adds a minute
+    batch_max_chunk_attempts: int = 3  # A chunk that fails this often fails the batch
+
+    # Payload store (inference pods read INPUT_REF / write OUTPUT_REF directly; must match api.config)
+    minio_endpoint: str = "localhost:9000"
+    minio_secure: bool = False
+    minio_secret_name: str = "minio"  # K8s secret with access-key / secret-key, mounted into inference pods
+    minio_payload_bucket: str = "payloads"
+    payload_inline_max_bytes: int = 16_384
 
     # Guardrails (used by worker; must match api.config)
     guardrail_block_window_seconds: int = 300
@@ -1,21 +1,27 @@
 """
 Inference client — Call inference HTTP API (mock mode) or read result from Redis (K8s mode).
 """
+import asyncio
 import json
+from collections.abc import Awaitable, Callable
 from typing import Any
 
 import httpx
 
+from api.queue import shared_redis
 from orchestrator.config import settings
+from orchestrator.k8s import RunnerTarget, ensure_runner, wait_for_job_completion
 
+RUNNER_CHECK_SECONDS = 5  # How often a worker waiting on a runner pod checks that one is live
 
-async def call_inference_http(job_id: str, input_data: dict) -> dict | None:
+
+async def call_inference_http(job_id: str, input_data: dict, timeout_seconds: float = 120.0) -> dict | None:
     """Call inference HTTP API. Returns {output_data, tokens_used, compute_seconds} or None."""
     if not settings.inference_url or not settings.inference_url.strip():
         return None
     url = settings.inference_url.rstrip("/") + "/run"
     try:
-        async with httpx.AsyncClient(timeout=120.0) as client:
+        async with httpx.AsyncClient(timeout=timeout_seconds) as client:
             r = await client.post(url, json={"job_id": job_id, "input": input_data})
             r.raise_for_status()
             return r.json()
@@ -23,6 +29,31 @@ async def call_inference_http(job_id: str, input_data: dict) -> dict | None:
         return None
 
 
+async def call_inference_batch_http(run_id: str, inputs: list[dict], timeout_seconds: float) -> dict | None:
+    """
+    Run a batch chunk in one call to the inference server's /run_batch.
+    Returns {outputs: [{output_data, tokens_used} | {error}], compute_seconds} or None.
+    """
+    url = settings.inference_url.rstrip("/") + "/run_batch"
+    try:
+        async with httpx.AsyncClient(timeout=timeout_seconds) as client:
+            r = await client.post(url, json={"job_id": run_id, "inputs": inputs})
+            r.raise_for_status()
+            return r.json()
+    except Exception:
+        return None
+
+
+async def cancel_inference_http(job_id: str) -> None:
+    """Ask the inference server to stop generating for job_id (best effort)."""
+    url = settings.inference_url.rstrip("/") + f"/cancel/{job_id}"
+    try:
+        async with httpx.AsyncClient(timeout=5.0) as client:
+            await client.post(url)
+    except Exception:
+        pass
+
+
 async def read_inference_result_from_redis(job_id: str) -> dict | None:
     """Read inference result from Redis (written by K8s Job container)."""
     try:
@@ -36,3 +67,60 @@ async def read_inference_result_from_redis(job_id: str) -> dict | None:
     except Exception:
         pass
     return None
+
+
+async def wait_for_inference_result(
+    job_id: str, job_name: str, timeout_seconds: int = 300
+) -> tuple[bool, str | None, dict | None]:
+    """
+    Wait for a K8s inference job. Returns (success, error_message, result).
+    The container pushes its result to inference:done:{job_id}; BLPOP sees it within
+    milliseconds. Polling the Job status runs alongside only to detect failures (and successes
+    whose push was missed, which then fall back to the stored result key).
+    """
+    pushed = asyncio.create_task(shared_redis().blpop(f"inference:done:{job_id}", timeout=timeout_seconds))
+    polled = asyncio.create_task(wait_for_job_completion(job_name, timeout_seconds))
+    try:
+        done, _ = await asyncio.wait({pushed, polled}, return_when=asyncio.FIRST_COMPLETED)
+    except asyncio.CancelledError:  # Job cancelled: stop polling too
+        pushed.cancel()
+        polled.cancel()
+        raise
+
+    if pushed in done and pushed.exception() is None and pushed.result():
+        polled.cancel()
+        return True, None, json.loads(pushed.result()[1])
+
+    success, err = await polled
+    pushed.cancel()
+    if not success:
+        return False, err, None
+    return True, None, await read_inference_result_from_redis(job_id)
+
+
+async def wait_for_runner_result(
+    job_id: str,
+    target: RunnerTarget,
+    timeout_seconds: int,
+    on_check: Callable[[], Awaitable[None]] | None = None,
+) -> tuple[bool, str | None, dict | None]:
+    """
+    Wait for a runner pod's push to inference:done:{job_id}. Returns (success, error_message, result).
+    Every RUNNER_CHECK_SECONDS a new runner is started if the target's lease lapsed: the last
+    pod exited (idle, or RUNNER_MAX_JOBS served) or died while this job was still queued; then
+    on_check runs (rollouts mirror the pod's startup phase with it).
+    A pod that dies mid-job loses that job to the timeout.
+    """
+    loop = asyncio.get_running_loop()
+    end = loop.time() + timeout_seconds
+    while (left := end - loop.time()) > 0:
+        popped = await shared_redis().blpop(f"inference:done:{job_id}", timeout=min(left, RUNNER_CHECK_SECONDS))
+        if popped:
+            result = json.loads(popped[1])
+            if "error" in result:
+                return False, result["error"], None
+            return True, None, result
+        await ensure_runner(target)
+        if on_check:
+            await on_check()
+    return False, "Timeout", None
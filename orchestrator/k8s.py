@@ -2,18 +2,37 @@
 Kubernetes client — Create inference jobs.
 Shared namespace + labels for multi-tenancy.
 Mock mode for local dev without K8s cluster.
+Runner pods (inference_runner_max_jobs > 0): jobs are queued per deployment and runner pods drain
+them, each loading the model once and generating one job at a time. Runners scale with the queue:
+one per inference_runner_backlog_per_pod waiting jobs, up to inference_runner_max_pods. Each holds
+a Redis lease slot (taken by the worker that starts it, then renewed by the pod); waiting workers
+start runners for lapsed slots.
+Runners are scoped to the deployment's rollout, so a redeploy never reaches a pod with the old model.
+Inference pods pull MODEL_PATH into a node-local cache (hostPath model_cache_host_path, inference/model_cache.py).
 """
 import asyncio
 import json
+import uuid
+from dataclasses import dataclass
 from datetime import datetime
 
 from kubernetes import client, config
+from kubernetes.client.rest import ApiException
 from kubernetes.config.config_exception import ConfigException
 
+from api.batches import part_ref, write_batch_part
+from api.models import Deployment
+from api.queue import shared_redis
 from orchestrator.config import settings
 
 NAMESPACE = "quantlix"
 JOB_LABELS = {"app": "inference", "managed-by": "quantlix"}
+RUNNER_LEASE_SECONDS = 30  # A running runner pod renews its lease every third of this
+
+
+def input_key(job_id: str) -> str:
+    """Redis key holding a K8s job's inline input (read by inference/serve.py via INPUT_KEY)."""
+    return f"inference:input:{job_id}"
 
 
 def _get_k8s_client() -> client.BatchV1Api | None:
@@ -30,45 +49,109 @@ def _get_k8s_client() -> client.BatchV1Api | None:
         return None
 
 
-async def create_inference_job(
-    job_id: str,
-    deployment_id: str,
-    user_id: str,
-    model_id: str,
-    input_data: dict,
-    *,
-    use_gpu: bool = False,
-) -> str | None:
-    """
-    Create K8s Job for inference. Returns job name if created, None if mock/skipped.
-    """
-    k8s = _get_k8s_client()
-    if not k8s:
-        return None
+def output_ref(job_id: str) -> str:
+    """Where an inference pod writes a job's output above payload_inline_max_bytes."""
+    return f"{settings.minio_payload_bucket}/jobs/{job_id}/output.json"
 
-    job_name = f"inference-{job_id[:8]}"
-    labels = {
-        **JOB_LABELS,
-        "user": user_id[:8],
-        "model": model_id[:32].replace(".", "-"),
-        "job-id": job_id,
-    }
 
-    input_json = json.dumps(input_data)[:4096]  # Reasonable limit for env
+@dataclass(frozen=True)
+class RunnerTarget:
+    """What a runner pod serves: one deployment as of one rollout."""
+    deployment_id: str
+    rollout_id: str | None  # None: deployments created before rollouts
+    user_id: str
+    model_id: str
+    model_path: str | None
+    use_gpu: bool
+
+    @property
+    def key(self) -> str:
+        return f"inference:runner:{self.deployment_id}:{self.rollout_id or 'initial'}"
+
+    def lease(self, slot: int) -> str:
+        """Redis key held (by token) by the runner pod in this slot."""
+        return f"{self.key}:{slot}"
+
+    @property
+    def queue(self) -> str:
+        """Redis list of jobs waiting for a runner pod."""
+        return f"{self.key}:queue"
+
+    @property
+    def phase(self) -> str:
+        """Startup phase the slot 0 runner pod reports (pulling, loading, warming, ready)."""
+        return f"{self.key}:phase"
+
+
+def runner_target(deployment: Deployment) -> RunnerTarget:
+    return RunnerTarget(
+        deployment_id=str(deployment.id),
+        rollout_id=deployment.rollout_id,
+        user_id=str(deployment.user_id),
+        model_id=deployment.model_id,
+        model_path=deployment.model_path,
+        use_gpu=bool(deployment.config and deployment.config.get("gpu")),
+    )
+
 
+def stop_key(job_id: str) -> str:
+    """Set when a job queued on a runner pod is cancelled or out of time; the pod stops generating."""
+    return f"inference:stop:{job_id}"
+
+
+def _payload_store_env(job_id: str | None) -> list[client.V1EnvVar]:
+    """MinIO access for INPUT_REF reads and large-output writes to OUTPUT_REF (runner items carry their own)."""
+
+    def secret(key: str) -> client.V1EnvVarSource:
+        return client.V1EnvVarSource(
+            secret_key_ref=client.V1SecretKeySelector(name=settings.minio_secret_name, key=key)
+        )
+
+    env = [client.V1EnvVar(name="OUTPUT_REF", value=output_ref(job_id))] if job_id else []
+    return env + [
+        client.V1EnvVar(name="PAYLOAD_INLINE_MAX_BYTES", value=str(settings.payload_inline_max_bytes)),
+        client.V1EnvVar(name="MINIO_ENDPOINT", value=settings.minio_endpoint),
+        client.V1EnvVar(name="MINIO_SECURE", value=str(settings.minio_secure).lower()),
+        client.V1EnvVar(name="MINIO_ACCESS_KEY", value_from=secret("access-key")),
+        client.V1EnvVar(name="MINIO_SECRET_KEY", value_from=secret("secret-key")),
+    ]
+
+
+async def _submit_job(
+    k8s: client.BatchV1Api,
+    job_name: str,
+    labels: dict[str, str],
+    env: list[client.V1EnvVar],
+    use_gpu: bool,
+    model_path: str | None = None,
+) -> None:
+    """Create one inference Job running settings.inference_image with env and the node's model cache."""
+    cache_dir = settings.model_cache_host_path
+    env = [
+        *env,
+        client.V1EnvVar(name="REDIS_URL", value=settings.redis_url),
+        client.V1EnvVar(name="MODEL_CACHE_DIR", value=cache_dir),
+        client.V1EnvVar(name="MODEL_CACHE_MAX_BYTES", value=str(settings.model_cache_max_bytes)),
+        client.V1EnvVar(name="MODEL_PULL_CONCURRENCY", value=str(settings.model_pull_concurrency)),
+    ]
+    if model_path:
+        env.append(client.V1EnvVar(name="MODEL_PATH", value=model_path))
     container = client.V1Container(
         name="inference",
         image=settings.inference_image,
-        env=[
-            client.V1EnvVar(name="JOB_ID", value=job_id),
-            client.V1EnvVar(name="INPUT", value=input_json),
-            client.V1EnvVar(name="REDIS_URL", value=settings.redis_url),
-        ],
+        env=env,
+        volume_mounts=[client.V1VolumeMount(name="model-cache", mount_path=cache_dir)],
     )
 
     pod_spec = client.V1PodSpec(
         restart_policy="Never",
         containers=[container],
+        volumes=[
+            client.V1Volume(
+                name="model-cache",
+                host_path=client.V1HostPathVolumeSource(path=cache_dir, type="DirectoryOrCreate"),
+            )
+        ],
     )
     if use_gpu:
         pod_spec.node_selector = {"quantlix.com/gpu": "true"}
@@ -98,9 +181,200 @@ async def create_inference_job(
         namespace=NAMESPACE,
         body=job,
     )
+
+
+async def create_inference_job(
+    job_id: str,
+    deployment_id: str,
+    user_id: str,
+    model_id: str,
+    input_data: dict | None,
+    *,
+    input_ref: str | None = None,
+    model_path: str | None = None,
+    use_gpu: bool = False,
+) -> str | None:
+    """
+    Create K8s Job for inference. Returns job name if created, None if mock/skipped.
+    The Job spec never carries the input itself, so it stays small in etcd: inline input is
+    written to Redis and passed as INPUT_KEY, offloaded input is passed as INPUT_REF (MinIO).
+    """
+    k8s = _get_k8s_client()
+    if not k8s:
+        return None
+
+    job_name = f"inference-{job_id[:8]}"
+    labels = {
+        **JOB_LABELS,
+        "user": user_id[:8],
+        "model": model_id[:32].replace(".", "-"),
+        "job-id": job_id,
+    }
+
+    if input_ref:
+        input_env = client.V1EnvVar(name="INPUT_REF", value=input_ref)
+    else:
+        input_env = client.V1EnvVar(name="INPUT_KEY", value=await _store_input(job_id, input_data))
+
+    env = [client.V1EnvVar(name="JOB_ID", value=job_id), input_env, *_payload_store_env(job_id)]
+    await _submit_job(k8s, job_name, labels, env, use_gpu, model_path)
+    return job_name
+
+
+async def _store_input(job_id: str, input_data: dict | None) -> str:
+    key = input_key(job_id)
+    await shared_redis().set(key, json.dumps(input_data or {}), ex=settings.inference_input_ttl_seconds)
+    return key
+
+
+async def ensure_runner(target: RunnerTarget) -> list[str]:
+    """
+    Start runner pods until the target has one per inference_runner_backlog_per_pod queued jobs
+    (at least one, at most inference_runner_max_pods). Returns the new Job names; empty if enough
+    runners are live (or mock). A slot's lease covers scheduling and model load
+    (inference_runner_start_seconds) until its pod starts renewing it.
+    """
+    k8s = _get_k8s_client()
+    if not k8s:
+        return []
+    redis = shared_redis()
+    backlog = await redis.llen(target.queue)
+    wanted = min(-(-backlog // max(settings.inference_runner_backlog_per_pod, 1)), settings.inference_runner_max_pods)
+    started = []
+    for slot in range(max(wanted, 1)):
+        token = uuid.uuid4().hex[:8]
+        if await redis.set(target.lease(slot), token, nx=True, ex=settings.inference_runner_start_seconds):
+            started.append(await _start_runner(k8s, target, slot, token))
+    return started
+
+
+async def _start_runner(k8s: client.BatchV1Api, target: RunnerTarget, slot: int, token: str) -> str:
+    """Submit the runner pod for a lease slot just taken with token."""
+    lease = target.lease(slot)
+    job_name = f"runner-{target.deployment_id[:8]}-{token}"
+    labels = {
+        **JOB_LABELS,
+        "user": target.user_id[:8],
+        "model": target.model_id[:32].replace(".", "-"),
+        "deployment-id": target.deployment_id,
+    }
+    env = [
+        client.V1EnvVar(name="RUNNER_QUEUE", value=target.queue),
+        client.V1EnvVar(name="RUNNER_LEASE_KEY", value=lease),
+        client.V1EnvVar(name="RUNNER_TOKEN", value=token),
+        client.V1EnvVar(name="RUNNER_LEASE_SECONDS", value=str(RUNNER_LEASE_SECONDS)),
+        client.V1EnvVar(name="RUNNER_MAX_JOBS", value=str(max(settings.inference_runner_max_jobs, 1))),
+        client.V1EnvVar(name="RUNNER_IDLE_SECONDS", value=str(settings.inference_runner_idle_seconds)),
+        *_payload_store_env(None),
+    ]
+    if slot == 0:  # Rollouts mirror the first runner's startup
+        env.append(client.V1EnvVar(name="RUNNER_PHASE_KEY", value=target.phase))
+    try:
+        await _submit_job(k8s, job_name, labels, env, target.use_gpu, target.model_path)
+    except Exception:
+        if await shared_redis().get(lease) == token:
+            await shared_redis().delete(lease)  # Let the next waiting worker try again
+        raise
+    return job_name
+
+
+async def queue_for_runner(
+    target: RunnerTarget,
+    job_id: str,
+    input_data: dict | None,
+    *,
+    input_ref: str | None = None,
+    smoke: bool = False,
+) -> str | None:
+    """
+    Queue a job for the target's runner pods, starting more if the backlog calls for it. Returns the queued
+    item (for withdraw_from_runner), or None if mock/skipped. Input is passed as for create_inference_job.
+    A smoke item (rollout) gets the pod's startup timings back with its result.
+    """
+    if not _get_k8s_client():
+        return None
+    item = {"job_id": job_id, "output_ref": output_ref(job_id)}
+    if input_ref:
+        item["input_ref"] = input_ref
+    else:
+        item["input_key"] = await _store_input(job_id, input_data)
+    if smoke:
+        item["smoke"] = True
+    raw = json.dumps(item)
+    await shared_redis().rpush(target.queue, raw)
+    await ensure_runner(target)
+    return raw
+
+
+async def withdraw_from_runner(target: RunnerTarget, job_id: str, item: str) -> None:
+    """Take a cancelled or timed-out job back: out of the queue if still waiting, else stop its generation."""
+    redis = shared_redis()
+    if not await redis.lrem(target.queue, 1, item):
+        await redis.set(stop_key(job_id), "1", ex=settings.inference_timeout_seconds)
+
+
+def batch_run_id(batch_id: str, chunk: int, attempt: int) -> str:
+    """Id of one attempt at a batch chunk: the pod's JOB_ID and its inference:done key."""
+    return f"{batch_id}-{chunk}-{attempt}"
+
+
+async def create_batch_inference_job(
+    batch_id: str,
+    chunk: int,
+    attempt: int,
+    user_id: str,
+    model_id: str,
+    inputs: list[dict],
+    *,
+    model_path: str | None = None,
+    use_gpu: bool = False,
+) -> str | None:
+    """
+    Create one K8s Job for a whole batch chunk (orchestrator.batches). Returns the job name, or
+    None if mock/skipped. The inputs are written to MinIO as JSONL (BATCH_INPUT_REF); the pod
+    writes one output line per input to BATCH_OUTPUT_REF and pushes {compute_seconds} to
+    inference:done:{batch_run_id}.
+    """
+    k8s = _get_k8s_client()
+    if not k8s:
+        return None
+
+    input_ref = await write_batch_part(batch_id, "pending", chunk, inputs)
+    run_id = batch_run_id(batch_id, chunk, attempt)
+    job_name = f"batch-{batch_id[:8]}-{chunk}-{attempt}"  # A retry must not collide with the Job kept for its TTL
+    labels = {
+        **JOB_LABELS,
+        "user": user_id[:8],
+        "model": model_id[:32].replace(".", "-"),
+        "batch-id": batch_id,
+    }
+    env = [
+        client.V1EnvVar(name="JOB_ID", value=run_id),
+        client.V1EnvVar(name="BATCH_INPUT_REF", value=input_ref),
+        client.V1EnvVar(name="BATCH_OUTPUT_REF", value=part_ref(batch_id, "raw", chunk)),
+        *_payload_store_env(run_id),
+    ]
+    await _submit_job(k8s, job_name, labels, env, use_gpu, model_path)
     return job_name
 
 
+async def delete_inference_job(job_name: str) -> None:
+    """Delete a Job and its pod (job cancelled). The pod is sent SIGTERM; missing Jobs are ignored."""
+    k8s = _get_k8s_client()
+    if not k8s:
+        return
+    try:
+        await asyncio.to_thread(
+            k8s.delete_namespaced_job,
+            name=job_name,
+            namespace=NAMESPACE,
+            propagation_policy="Background",
+        )
+    except ApiException as e:
+        if e.status != 404:
+            raise
+
+
 async def wait_for_job_completion(job_name: str, timeout_seconds: int = 300) -> tuple[bool, str | None]:
     """
     Poll job until complete or timeout. Returns (success, error_message).
@@ -0,0 +1,95 @@
+"""
+Orchestrator metrics for autoscaling (served on :9091).
+Sampled on a fixed interval, independent of job processing, so they stay fresh while every
+worker slot is busy with a long job. Scale on inference_queue_oldest_age_seconds (wait time)
+or inference_queue_depth; inference_worker_saturation shows whether workers are the bottleneck.
+"""
+import asyncio
+import logging
+import time
+
+from prometheus_client import Gauge
+from redis.asyncio import Redis
+
+from api.queue import QUEUE_AGES, QUEUE_LANES
+from orchestrator.config import settings
+
+logger = logging.getLogger(__name__)
+
+OLDEST_CANDIDATES = 10  # Oldest ids checked per sample (skipping ones no longer queued)
+
+queue_depth = Gauge("inference_queue_depth", "Jobs waiting in the inference queue", ["lane"])
+queue_oldest_age = Gauge(
+    "inference_queue_oldest_age_seconds",
+    "Seconds the oldest queued job has been waiting since it was created (0 when empty)",
+    ["lane"],
+)
+jobs_in_flight = Gauge("inference_worker_jobs_in_flight", "Jobs this worker process is running")
+worker_concurrency = Gauge("inference_worker_concurrency", "Job slots in this worker process")
+worker_saturation = Gauge(
+    "inference_worker_saturation",
+    "Busy fraction of this worker's job slots (1.0 = every slot busy)",
+)
+
+
+class WorkerSlots:
+    """Counts jobs running in this process."""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.active = 0
+        worker_concurrency.set(capacity)
+
+    def __enter__(self) -> "WorkerSlots":
+        self.active += 1
+        self._export()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.active -= 1
+        self._export()
+
+    def _export(self) -> None:
+        jobs_in_flight.set(self.active)
+        worker_saturation.set(self.active / self.capacity if self.capacity else 0.0)
+
+
+async def sample_queue_metrics(redis: Redis) -> None:
+    """
+    Depth and oldest wait for every lane, in two round-trips: depth and the oldest ids (QUEUE_AGES),
+    then which of them are still queued. Ids left behind by a worker that died between popping
+    and cleaning up are dropped instead of reported as an ever-growing age.
+    """
+    pipe = redis.pipeline(transaction=False)
+    for lane, queue in QUEUE_LANES.items():
+        pipe.zcard(queue)
+        pipe.zrange(QUEUE_AGES[lane], 0, OLDEST_CANDIDATES - 1, withscores=True)
+    replies = await pipe.execute()
+    candidates = [replies[2 * i + 1] for i in range(len(QUEUE_LANES))]
+    pipe = redis.pipeline(transaction=False)
+    for queue, oldest in zip(QUEUE_LANES.values(), candidates):
+        pipe.zmscore(queue, [job_id for job_id, _ in oldest] or [""])
+    queued = await pipe.execute()
+    now = time.time()
+    for i, lane in enumerate(QUEUE_LANES):
+        queue_depth.labels(lane=lane).set(replies[2 * i])
+        age = 0.0
+        stale = []
+        for (job_id, since), score in zip(candidates[i], queued[i]):
+            if score is None:
+                stale.append(job_id)
+            else:
+                age = max(0.0, now - since)
+                break
+        if stale:
+            await redis.zrem(QUEUE_AGES[lane], *stale)
+        queue_oldest_age.labels(lane=lane).set(age)
+
+
+async def run_metrics_sampler(redis: Redis) -> None:
+    while True:
+        try:
+            await sample_queue_metrics(redis)
+        except Exception as e:
+            logger.warning("Queue metrics sample failed: %s", e)
+        await asyncio.sleep(settings.metrics_sample_seconds)
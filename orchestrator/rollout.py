@@ -0,0 +1,180 @@
+"""
+Deployment rollout — one queue message per POST /deploy or rollback (api.outbox.add_rollout_to_outbox).
+Claim: PENDING -> DEPLOYING for the message's rollout_id only, so a duplicate message or a rollout
+superseded by a redeploy does nothing; every later write is guarded the same way.
+K8s: the rollout starts its runner pod (orchestrator.k8s), which pulls MODEL_PATH into the node's
+model cache, loads and warms the model, then serves a smoke inference. The pod's startup phases are
+mirrored into rollout_phase and its timings come back with the smoke result. The pod stays up as
+the deployment's warm runner, so the first real job skips the cold start.
+Without K8s the smoke inference goes to the inference server (or the mock).
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy import select, update
+
+from api.db import async_session_maker
+from api.email import send_first_deploy_email
+from api.models import Deployment, DeploymentStatus, RolloutPhase, User
+from api.queue import shared_redis
+from orchestrator.config import settings
+from orchestrator.inference_client import call_inference_http, wait_for_runner_result
+from orchestrator.k8s import input_key, queue_for_runner, runner_target, withdraw_from_runner
+
+logger = logging.getLogger(__name__)
+
+SMOKE_INPUT = {"prompt": "Hello"}
+# Runner pod startup phases -> rollout phase (once the model is warm the smoke inference is next)
+POD_PHASES = {
+    "pulling": RolloutPhase.PULLING.value,
+    "loading": RolloutPhase.LOADING.value,
+    "warming": RolloutPhase.WARMING.value,
+    "ready": RolloutPhase.SMOKE_TEST.value,
+}
+
+
+class RolloutError(Exception):
+    """The model could not be pulled, loaded or smoke-tested."""
+
+
+def _current(deployment_id: str, rollout_id: str):
+    return (
+        Deployment.id == deployment_id,
+        Deployment.rollout_id == rollout_id,
+        Deployment.status == DeploymentStatus.DEPLOYING.value,
+    )
+
+
+async def _claim(deployment_id: str, rollout_id: str) -> Deployment | None:
+    async with async_session_maker() as db:
+        claimed = await db.scalar(
+            update(Deployment)
+            .where(
+                Deployment.id == deployment_id,
+                Deployment.rollout_id == rollout_id,
+                Deployment.status == DeploymentStatus.PENDING.value,
+            )
+            .values(
+                status=DeploymentStatus.DEPLOYING.value,
+                rollout_phase=RolloutPhase.PULLING.value,
+                rollout_started_at=datetime.now(timezone.utc),
+            )
+            .returning(Deployment.id)
+        )
+        if claimed is None:
+            return None
+        deployment = await db.scalar(select(Deployment).where(Deployment.id == deployment_id))
+        await db.commit()
+        return deployment
+
+
+async def _set_phase(deployment_id: str, rollout_id: str, phase: str) -> None:
+    async with async_session_maker() as db:
+        await db.execute(
+            update(Deployment)
+            .where(*_current(deployment_id, rollout_id), Deployment.rollout_phase != phase)
+            .values(rollout_phase=phase)
+        )
+        await db.commit()
+
+
+async def _smoke_on_runner(deployment: Deployment, rollout_id: str) -> dict | None:
+    """Warm the rollout's runner pod and smoke-test it. Returns timings, or None without K8s."""
+    target = runner_target(deployment)
+    run_id = f"rollout-{rollout_id}"
+    item = await queue_for_runner(target, run_id, SMOKE_INPUT, smoke=True)
+    if item is None:
+        return None
+    reported: list[str | None] = [None]
+
+    async def mirror_phase() -> None:
+        phase = POD_PHASES.get(await shared_redis().get(target.phase) or "")
+        if phase and phase != reported[0]:
+            reported[0] = phase
+            await _set_phase(deployment.id, rollout_id, phase)
+
+    success, err, result = await wait_for_runner_result(
+        run_id, target, settings.rollout_timeout_seconds, on_check=mirror_phase
+    )
+    await shared_redis().delete(input_key(run_id))
+    if not success:
+        if err == "Timeout":
+            await withdraw_from_runner(target, run_id, item)
+        raise RolloutError(f"Smoke inference failed: {err}")
+    return {**result.get("runner", {}), "smoke_seconds": result.get("compute_seconds")}
+
+
+async def _smoke(deployment: Deployment, rollout_id: str) -> dict:
+    timings = await _smoke_on_runner(deployment, rollout_id)
+    if timings is not None:
+        return timings
+    await _set_phase(deployment.id, rollout_id, RolloutPhase.SMOKE_TEST.value)
+    start = time.perf_counter()
+    if settings.inference_url:
+        # The inference server loads its model on first use, so this also warms it
+        result = await call_inference_http(
+            f"rollout-{rollout_id}", SMOKE_INPUT, timeout_seconds=settings.rollout_timeout_seconds
+        )
+        if result is None:
+            raise RolloutError("Smoke inference failed: inference service unavailable")
+    else:
+        await asyncio.sleep(1)  # Pure mock
+    return {"smoke_seconds": round(time.perf_counter() - start, 2)}
+
+
+async def _finish(deployment_id: str, rollout_id: str, timings: dict | None, error: str | None) -> bool:
+    """Mark the rollout READY (or FAILED with error). False if it was superseded meanwhile."""
+    async with async_session_maker() as db:
+        deployment = await db.scalar(
+            select(Deployment).where(*_current(deployment_id, rollout_id)).with_for_update()
+        )
+        if not deployment:
+            return False
+        now = datetime.now(timezone.utc)
+        total = round((now - deployment.rollout_started_at).total_seconds(), 2)
+        deployment.status = DeploymentStatus.FAILED.value if error else DeploymentStatus.READY.value
+        deployment.rollout_phase = RolloutPhase.FAILED.value if error else RolloutPhase.READY.value
+        deployment.error_message = error
+        deployment.rollout_completed_at = now
+        deployment.rollout_timings = {**(timings or {}), "total_seconds": total}
+        if not error:
+            # Send first-deploy email if user hasn't received it yet
+            user = await db.scalar(select(User).where(User.id == deployment.user_id))
+            if user and not user.first_deploy_email_sent:
+                try:
+                    await send_first_deploy_email(user.email)
+                    user.first_deploy_email_sent = True
+                except Exception as e:
+                    logger.warning("Failed to send first deploy email: %s", e)
+        await db.commit()
+        return True
+
+
+async def process_rollout(payload: dict) -> bool:
+    """
+    Roll out the deployment in payload["job_id"] as of payload["rollout_id"]. Returns False without
+    doing anything when that rollout is not PENDING (duplicate message, superseded, or finished).
+    """
+    deployment_id = payload.get("job_id")
+    rollout_id = payload.get("rollout_id")
+    deployment = await _claim(deployment_id, rollout_id)
+    if not deployment:
+        logger.info("Rollout %s of deployment %s skipped (superseded or already claimed)", rollout_id, deployment_id)
+        return False
+
+    timings, error = None, None
+    try:
+        timings = await _smoke(deployment, rollout_id)
+    except RolloutError as e:
+        logger.warning("Rollout of deployment %s failed: %s", deployment_id, e)
+        error = str(e)
+    except Exception as e:
+        logger.exception("Rollout of deployment %s failed: %s", deployment_id, e)
+        error = str(e)
+    if await _finish(deployment_id, rollout_id, timings, error):
+        logger.info("Deployment %s rollout %s: %s", deployment_id, "failed" if error else "ready", timings)
+    else:
+        logger.info("Rollout %s of deployment %s superseded while running", rollout_id, deployment_id)
+    return True
@@ -1,67 +1,110 @@
 """
 Redis queue worker — Consumes jobs, schedules on K8s, updates DB.
-Scaling: HPA on queue depth (custom metric).
+Each process runs worker_concurrency job slots. Scaling: KEDA/HPA on the queue metrics exported by
+orchestrator.metrics (depth and oldest-job age per lane, slot saturation).
 """
 import asyncio
-import json
 import logging
+import time
+from collections.abc import Awaitable
 from datetime import datetime, timezone
+from typing import Any
 
-from prometheus_client import Gauge
 from redis.asyncio import Redis
-from sqlalchemy import select
+from sqlalchemy import inspect, null, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from api.coalescing import coalescing_enabled, coalescing_group, join_or_lead, settle_followers
 from api.config import settings
 from api.db import async_session_maker
-from api.email import send_first_deploy_email
+from api.events import publish_job_event
 from api.guardrails.base import GuardrailAction, GuardrailResult
 from api.guardrails.block_rate import increment_block_count
 from api.guardrails.config import get_guardrail_config
 from api.guardrails.runner import run_guardrails
-from api.models import Deployment, DeploymentStatus, Job, JobStatus, UsageRecord, User
+from api.models import Deployment, DeploymentStatus, Job, JobStatus
+from api.outbox import add_rollout_to_outbox
 from api.policies.policy import PolicyConfig, PolicyAction, apply_policy
+from api.queue import QUEUE_LANES, cancel_key, pop_job, record_served, release_in_flight, shared_redis
+from api.result_cache import cache_entry, store_result
 from api.scoring.scorer import compute_score
+from api.status_cache import cache_job_status
+from api.storage import load_payload, offload_payload
+from api.usage_service import record_usage
+from api.webhooks import queue_webhook
+from orchestrator.batches import process_batch_chunk
 from orchestrator.config import settings
-from orchestrator.inference_client import call_inference_http, read_inference_result_from_redis
-from orchestrator.k8s import create_inference_job, wait_for_job_completion
+from orchestrator.inference_client import (
+    call_inference_http,
+    cancel_inference_http,
+    wait_for_inference_result,
+    wait_for_runner_result,
+)
+from orchestrator.k8s import (
+    create_inference_job,
+    delete_inference_job,
+    input_key,
+    queue_for_runner,
+    runner_target,
+    withdraw_from_runner,
+)
+from orchestrator.metrics import WorkerSlots, run_metrics_sampler
+from orchestrator.rollout import process_rollout
 
 logger = logging.getLogger(__name__)
 
-INFERENCE_QUEUE = "inference:queue"
-
 
 def _serialize_flags(results: list[GuardrailResult]) -> dict | None:
     """Serialize FLAG results to JSON-serializable dict for storage."""
     flags = [{"rule": r.rule_name, "message": r.message, "details": r.details} for r in results if r.action == GuardrailAction.FLAG]
     return {"flags": flags} if flags else None
-queue_depth = Gauge("inference_queue_depth", "Number of jobs in inference queue")
-
-
-async def update_queue_metric(redis: Redis) -> None:
-    """Update Prometheus gauge with current queue length."""
-    try:
-        depth = await redis.llen(INFERENCE_QUEUE)
-        queue_depth.set(depth)
-    except Exception:
-        pass
 
 
 async def get_redis() -> Redis:
     return Redis.from_url(settings.redis_url, decode_responses=True)
 
 
-async def process_job(payload: dict) -> None:
-    """Process a single inference job: update status, run K8s, record usage."""
+async def _unless_cancelled(job_id: str, inference: Awaitable[Any]) -> tuple[bool, Any]:
+    """
+    Await inference unless the job is cancelled first (POST /jobs/{id}/cancel pushes to
+    cancel_key). Returns (cancelled, result). If Redis fails the watch is dropped, not the job.
+    """
+    work = asyncio.ensure_future(inference)
+    watch = asyncio.create_task(shared_redis().blpop(cancel_key(job_id), timeout=0))
+    try:
+        done, _ = await asyncio.wait({work, watch}, return_when=asyncio.FIRST_COMPLETED)
+        if work in done:
+            return False, work.result()
+        if watch.exception() is None and watch.result():
+            work.cancel()
+            return True, None
+        return False, await work
+    finally:
+        watch.cancel()
+        if not work.done():
+            work.cancel()
+
+
+async def process_job(payload: dict) -> bool:
+    """
+    Process a single inference job: update status, run K8s, record usage.
+    Returns False without doing anything if the job was already claimed: the outbox delivers
+    at least once, so the same job can be popped twice.
+    """
     job_id = payload.get("job_id")
     deployment_id = payload.get("deployment_id")
     user_id = payload.get("user_id")
+    input_ref = payload.get("input_ref")
     input_data = payload.get("input", {})
+    input_ref_loaded = False
 
     if not all([job_id, deployment_id, user_id]):
         logger.error("Invalid job payload: missing job_id, deployment_id, or user_id")
-        return
+        return False
+    deadline = payload.get("deadline")  # Epoch seconds (RunRequest.timeout_seconds)
 
+    group: str | None = None  # Coalescing group this job leads, if any (api.coalescing)
+    deployment: Deployment | None = None
     async with async_session_maker() as db:
         try:
             # Fetch job and deployment (job_id only — payload is trusted from our queue)
@@ -71,62 +114,139 @@ async def process_job(payload: dict) -> None:
                 ).where(Job.id == job_id)
             )
             row = result.one_or_none()
-            if not row:
-                logger.error(
-                    "Job %s not found (job does not exist in DB)",
-                    job_id,
-                )
-                return
-
+            if not row or row.Job.status != JobStatus.QUEUED.value:
+                logger.info("Job %s skipped (missing or already claimed)", job_id)
+                return False
             job, deployment = row
             user_id = str(job.user_id)  # Use job's user_id for block_rate, usage, etc.
 
-            # Update job to RUNNING
-            job.status = JobStatus.RUNNING.value
-            await db.flush()
-
-            # Ensure deployment is READY (lazy deploy)
-            if deployment.status == DeploymentStatus.PENDING.value:
-                deployment.status = DeploymentStatus.DEPLOYING.value
-                await db.flush()
-                # For MVP: no real model deploy, just mark ready
-                deployment.status = DeploymentStatus.READY.value
-                # Send first-deploy email if user hasn't received it yet
-                result_user = await db.execute(select(User).where(User.id == user_id))
-                user_row = result_user.scalar_one_or_none()
-                if user_row and not user_row.first_deploy_email_sent:
+            # Client's deadline passed while queued: drop it without running inference
+            if deadline and deadline <= time.time():
+                expired = await db.scalar(
+                    update(Job)
+                    .where(Job.id == job_id, Job.status == JobStatus.QUEUED.value)
+                    .values(
+                        status=JobStatus.FAILED.value,
+                        error_message="Deadline exceeded before the job started",
+                        completed_at=datetime.now(timezone.utc),
+                    )
+                    .returning(Job.id)
+                )
+                await db.commit()
+                if expired is None:
+                    return False
+                logger.info("Job %s expired in queue", job_id)
+                await cache_job_status(job)  # The update synchronized job's fields
+                await publish_job_event(job)
+                await queue_webhook(job, deployment)
+                return True
+
+            # Identical deterministic job already running: wait for its result instead of running
+            if coalescing_enabled(deployment):
+                if input_ref:
+                    input_data = await load_payload(input_ref)
+                    input_ref_loaded = True
+                group = coalescing_group(deployment, input_data)
+                if group:
                     try:
-                        await send_first_deploy_email(user_row.email)
-                        user_row.first_deploy_email_sent = True
+                        leader = await join_or_lead(group, job_id, str(deployment.id))
                     except Exception as e:
-                        logger.warning("Failed to send first deploy email: %s", e)
+                        logger.warning("Coalescing skipped for job %s: %s", job_id, e)
+                        group, leader = None, None
+                    if leader:
+                        job.enqueued_at = datetime.now(timezone.utc)  # Sweeper requeues it if the leader dies
+                        await db.commit()
+                        logger.info("Job %s follows job %s", job_id, leader)
+                        return False
+
+            # Claim: QUEUED -> RUNNING only once, whichever worker gets there first
+            claimed = await db.scalar(
+                update(Job)
+                .where(Job.id == job_id, Job.status == JobStatus.QUEUED.value)
+                .values(status=JobStatus.RUNNING.value, started_at=datetime.now(timezone.utc))
+                .returning(Job.id)
+            )
+            if not claimed:
+                logger.info("Job %s skipped (already claimed)", job_id)
+                return False
+            job.status = JobStatus.RUNNING.value
+
+            # Deployed before rollouts existed: roll it out now (this job runs meanwhile)
+            if deployment.status == DeploymentStatus.PENDING.value and not deployment.rollout_id:
+                add_rollout_to_outbox(db, deployment)
 
             await db.commit()
+            await publish_job_event(job)
+
+            # Offloaded input: K8s pods fetch it themselves; guardrails and HTTP inference need it here
+            if input_ref and not input_ref_loaded:
+                input_data = await load_payload(input_ref)
 
-            # Run inference (K8s, inference HTTP, or mock)
+            # Run inference (K8s runner pod or per-job pod, inference HTTP, or mock)
             is_gpu = bool(deployment.config and deployment.config.get("gpu"))
-            job_name = await create_inference_job(
-                job_id=job_id,
-                deployment_id=deployment_id,
-                user_id=user_id,
-                model_id=deployment.model_id,
-                input_data=input_data,
-                use_gpu=is_gpu,
-            )
+            target = runner_target(deployment)
+            job_name: str | None = None
+            runner_item: str | None = None
+            if settings.inference_runner_max_jobs:
+                runner_item = await queue_for_runner(
+                    target, job_id, None if input_ref else input_data, input_ref=input_ref
+                )
+            else:
+                job_name = await create_inference_job(
+                    job_id=job_id,
+                    deployment_id=deployment_id,
+                    user_id=user_id,
+                    model_id=deployment.model_id,
+                    input_data=None if input_ref else input_data,
+                    input_ref=input_ref,
+                    model_path=deployment.model_path,
+                    use_gpu=is_gpu,
+                )
 
+            # Inference may use what is left of the job's budget, else the default timeout
+            budget = settings.inference_timeout_seconds
+            if deadline:
+                budget = max(1, int(deadline - time.time()))
             inference_result: dict | None = None
-            if job_name:
-                success, err = await wait_for_job_completion(job_name)
-                if success:
-                    inference_result = await read_inference_result_from_redis(job_id)
+            if runner_item:
+                inference = wait_for_runner_result(job_id, target, timeout_seconds=budget)
+            elif job_name:
+                inference = wait_for_inference_result(job_id, job_name, timeout_seconds=budget)
             elif settings.inference_url:
                 # Mock K8s but real inference via HTTP
-                inference_result = await call_inference_http(job_id, input_data)
+                inference = call_inference_http(job_id, input_data, timeout_seconds=budget)
+            else:
+                # Pure mock: simulate completion
+                inference = asyncio.sleep(1)
+            cancelled, outcome = await _unless_cancelled(job_id, inference)
+            if job_name or runner_item:
+                await shared_redis().delete(input_key(job_id))  # Pod is done with it; TTL is the fallback
+
+            if cancelled:
+                # The API already marked the job cancelled and billed it; free the compute
+                if runner_item:
+                    await withdraw_from_runner(target, job_id, runner_item)
+                elif job_name:
+                    await delete_inference_job(job_name)
+                elif settings.inference_url:
+                    await cancel_inference_http(job_id)
+                logger.info("Job %s cancelled while running", job_id)
+                if group:
+                    await settle_followers(group, job, deployment)  # Requeues them
+                return True
+            if runner_item:
+                success, err, inference_result = outcome
+                if err == "Timeout":
+                    await withdraw_from_runner(target, job_id, runner_item)  # The pod moves on
+            elif job_name:
+                success, err, inference_result = outcome
+                if err == "Timeout":
+                    await delete_inference_job(job_name)  # Out of budget: stop paying for the pod
+            elif settings.inference_url:
+                inference_result = outcome
                 success = inference_result is not None
                 err = None if success else "Inference service unavailable"
             else:
-                # Pure mock: simulate completion
-                await asyncio.sleep(1)
                 success, err = True, None
 
             # Update job and create UsageRecord
@@ -134,14 +254,25 @@ async def process_job(payload: dict) -> None:
                 result = await db2.execute(
                     select(Job, Deployment).join(
                         Deployment, Job.deployment_id == Deployment.id
-                    ).where(Job.id == job_id)
+                    ).where(Job.id == job_id).with_for_update(of=Job)
                 )
                 row = result.one()
                 job, deployment = row
+                if job.status == JobStatus.CANCELLED.value:
+                    # Cancelled as it finished: keep the cancellation and what it billed
+                    logger.info("Job %s cancelled before its result was stored", job_id)
+                    return True
 
                 if success:
-                    output_data = inference_result.get("output_data", {"result": "ok"}) if inference_result else {"result": "ok", "mock": True}
-                    job.output_data = output_data
+                    output_ref = inference_result.get("output_ref") if inference_result else None
+                    if output_ref:
+                        # Large output already written to MinIO by the inference pod
+                        output_data = await load_payload(output_ref)
+                    else:
+                        output_data = inference_result.get("output_data", {"result": "ok"}) if inference_result else {"result": "ok", "mock": True}
+                        output_ref = await offload_payload(job_id, "output", output_data)
+                    job.output_ref = output_ref
+                    job.output_data = null() if output_ref else output_data  # SQL NULL, not JSON null
                     job.tokens_used = inference_result.get("tokens_used", 100) if inference_result else 100
                     job.compute_seconds = inference_result.get("compute_seconds", 1.5) if inference_result else 1.5
                     job.completed_at = datetime.now(timezone.utc)
@@ -193,7 +324,8 @@ async def process_job(payload: dict) -> None:
                         if policy_action == PolicyAction.BLOCK:
                             job.status = JobStatus.FAILED.value
                             job.error_message = reason
-                            job.output_data = None
+                            job.output_data = null()
+                            job.output_ref = None
                             window = cfg.get("guardrail_block_window", settings.guardrail_block_window_seconds)
                             await increment_block_count(str(user_id), str(deployment.id), window)
                         else:
@@ -204,54 +336,101 @@ async def process_job(payload: dict) -> None:
                     secs = job.compute_seconds or 0.0
                     is_gpu = bool(deployment.config and deployment.config.get("gpu"))
                     if job.status == JobStatus.COMPLETED.value:
-                        usage = UsageRecord(
+                        await record_usage(
+                            db2,
                             user_id=user_id,
                             job_id=job_id,
                             tokens_used=job.tokens_used or 0,
                             compute_seconds=0.0 if is_gpu else secs,
                             gpu_seconds=secs if is_gpu else 0.0,
                         )
-                        db2.add(usage)
                 else:
                     job.status = JobStatus.FAILED.value
                     job.error_message = err
                     job.completed_at = datetime.now(timezone.utc)
 
                 await db2.commit()
+                if "output_data" in inspect(job).unloaded:  # Expired by null(); the caches below read it
+                    await db2.refresh(job, ["output_data"])
                 logger.info("Job %s completed: %s", job_id, job.status)
+                await cache_job_status(job)
+                await publish_job_event(job)
+                await queue_webhook(job, deployment)
+                if job.status == JobStatus.COMPLETED.value:
+                    await store_result(deployment, input_data, cache_entry(job))
+                if group:
+                    await settle_followers(group, job, deployment)
 
         except Exception as e:
             logger.exception("Job %s failed: %s", job_id, e)
             async with async_session_maker() as db2:
-                result = await db2.execute(select(Job).where(Job.id == job_id))
+                result = await db2.execute(select(Job).where(Job.id == job_id).with_for_update())
                 job = result.scalar_one_or_none()
-                if job:
+                if job and job.status != JobStatus.CANCELLED.value:
                     job.status = JobStatus.FAILED.value
                     job.error_message = str(e)
                     job.completed_at = datetime.now(timezone.utc)
                     await db2.commit()
-
-
-async def run_worker() -> None:
-    """Consume jobs from Redis queue indefinitely."""
-    redis = await get_redis()
-    logger.info("Worker started, consuming from %s", INFERENCE_QUEUE)
-
+                    await cache_job_status(job)
+                    await publish_job_event(job)
+                    if deployment:
+                        await queue_webhook(job, deployment)
+            if group and job:
+                try:
+                    await settle_followers(group, job, deployment)  # Requeues them
+                except Exception:
+                    logger.exception("Could not settle followers of job %s", job_id)
+    return True
+
+
+async def _consume(redis: Redis, slots: WorkerSlots) -> None:
+    """One job slot: pop and process jobs one at a time, interactive lane before batch."""
     while True:
         try:
-            await update_queue_metric(redis)
             # Blocking pop with 5s timeout (allows graceful shutdown)
-            result = await redis.blpop(INFERENCE_QUEUE, timeout=5)
-            if not result:
+            popped = await pop_job(redis, timeout=5)
+            if not popped:
                 continue
 
-            _, raw = result
-            payload = json.loads(raw)
-            await process_job(payload)
+            lane, payload = popped
+            claimed = True
+            with slots:
+                if payload.get("kind") == "batch":
+                    claimed = await process_batch_chunk(payload)  # Batches hold no in-flight slot
+                elif payload.get("kind") == "rollout":
+                    claimed = await process_rollout(payload)
+                else:
+                    try:
+                        claimed = await process_job(payload)
+                    finally:
+                        # A duplicate delivery must not free the slot of the copy that is still running
+                        if claimed and payload.get("user_id") and payload.get("job_id"):
+                            await release_in_flight(payload["user_id"], payload["job_id"])
+            if claimed:
+                await record_served(lane)  # Feeds the API's queue-wait estimate
         except asyncio.CancelledError:
-            break
+            raise
         except Exception as e:
             logger.exception("Worker error: %s", e)
             await asyncio.sleep(5)
 
-    await redis.aclose()
+
+async def run_worker() -> None:
+    """Consume jobs from Redis queue indefinitely with worker_concurrency slots."""
+    redis = await get_redis()
+    slots = WorkerSlots(settings.worker_concurrency)
+    logger.info("Worker started, consuming from %s with %d slot(s)", ", ".join(QUEUE_LANES.values()), slots.capacity)
+
+    tasks = [
+        asyncio.create_task(run_metrics_sampler(redis)),
+        *(asyncio.create_task(_consume(redis, slots)) for _ in range(slots.capacity)),
+    ]
+    try:
+        await asyncio.gather(*tasks)
+    except asyncio.CancelledError:
+        pass
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await redis.aclose()
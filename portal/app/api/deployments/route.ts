@@ -10,13 +10,15 @@ export async function GET(request: NextRequest) {
   }
 
   const { searchParams } = new URL(request.url);
-  const limit = searchParams.get("limit") || "10";
-  const offset = searchParams.get("offset") || "0";
+  const params = new URLSearchParams({ limit: searchParams.get("limit") || "10" });
+  for (const key of ["cursor", "include_total", "status"]) {
+    const value = searchParams.get(key);
+    if (value) params.set(key, value);
+  }
 
-  const res = await fetch(
-    `${API_URL}/deployments?limit=${limit}&offset=${offset}`,
-    { headers: { "X-API-Key": apiKey } }
-  );
+  const res = await fetch(`${API_URL}/deployments?${params}`, {
+    headers: { "X-API-Key": apiKey },
+  });
   const data = await res.json().catch(() => ({}));
 
   if (!res.ok) {
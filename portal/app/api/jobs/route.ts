@@ -10,9 +10,13 @@ export async function GET(request: NextRequest) {
   }
 
   const { searchParams } = new URL(request.url);
-  const limit = searchParams.get("limit") || "20";
+  const params = new URLSearchParams({ limit: searchParams.get("limit") || "20" });
+  for (const key of ["cursor", "include_total", "status", "deployment_id"]) {
+    const value = searchParams.get(key);
+    if (value) params.set(key, value);
+  }
 
-  const res = await fetch(`${API_URL}/jobs?limit=${limit}`, {
+  const res = await fetch(`${API_URL}/jobs?${params}`, {
     headers: { "X-API-Key": apiKey },
   });
   const data = await res.json().catch(() => ({}));
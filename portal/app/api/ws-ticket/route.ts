@@ -0,0 +1,23 @@
+import { NextRequest, NextResponse } from "next/server";
+import { COOKIE_NAME } from "@/lib/api";
+
+const API_URL = process.env.NEXT_PUBLIC_API_URL || "http://localhost:8000";
+
+/** One-time ticket for opening /ws/jobs from the browser (the API key stays in the httpOnly cookie). */
+export async function POST(request: NextRequest) {
+  const apiKey = request.cookies.get(COOKIE_NAME)?.value;
+  if (!apiKey) {
+    return NextResponse.json({ detail: "Unauthorized" }, { status: 401 });
+  }
+
+  const res = await fetch(`${API_URL}/ws/ticket`, {
+    method: "POST",
+    headers: { "X-API-Key": apiKey },
+  });
+  const data = await res.json().catch(() => ({}));
+
+  if (!res.ok) {
+    return NextResponse.json(data, { status: res.status });
+  }
+  return NextResponse.json(data);
+}
@@ -1,6 +1,6 @@
 "use client";
 
-import { Suspense, useCallback, useEffect, useState } from "react";
+import { Suspense, useCallback, useEffect, useRef, useState } from "react";
 import { useSearchParams, useRouter } from "next/navigation";
 import Link from "next/link";
 import { Button } from "@/components/ui/button";
@@ -220,7 +220,7 @@ quantlix run <deployment_id> -i '{"prompt": "Hello!"}' --api-key <your_api_key>`
                 3. CLI quickstart
               </p>
               <p className="mb-2 text-xs text-slate-500">
-                API key required. The first run activates the deployment and moves it from pending to ready.
+                API key required. The model is warmed in the background after deploy (pending → deploying → ready); you can run jobs right away.
               </p>
               <div className="relative rounded border border-slate-700 bg-slate-800/50 p-4 font-mono text-xs text-slate-300">
                 <pre className="overflow-x-auto whitespace-pre-wrap break-all">
@@ -266,6 +266,8 @@ function DeploymentsSection() {
   const [deployments, setDeployments] = useState<DeploymentItem[]>([]);
   const [total, setTotal] = useState(0);
   const [page, setPage] = useState(1);
+  // cursors[n] opens page n + 1 (keyset pagination: every page costs the same)
+  const cursors = useRef<(string | null)[]>([null]);
   const [loading, setLoading] = useState(true);
   const [expanded, setExpanded] = useState<Set<string>>(new Set());
   const [revisions, setRevisions] = useState<Record<string, RevisionItem[]>>({});
@@ -274,14 +276,16 @@ function DeploymentsSection() {
   const [error, setError] = useState<string | null>(null);
 
   const refresh = useCallback((pageNum: number = page) => {
-    const offset = (pageNum - 1) * DEPLOYMENTS_PAGE_SIZE;
-    fetch(
-      `/api/deployments?limit=${DEPLOYMENTS_PAGE_SIZE}&offset=${offset}`
-    )
+    const params = new URLSearchParams({ limit: String(DEPLOYMENTS_PAGE_SIZE) });
+    const cursor = cursors.current[pageNum - 1];
+    if (cursor) params.set("cursor", cursor);
+    if (pageNum === 1) params.set("include_total", "true");
+    fetch(`/api/deployments?${params}`)
       .then((r) => (r.ok ? r.json() : { deployments: [], total: 0 }))
       .then((data) => {
         setDeployments(data.deployments || []);
-        setTotal(data.total ?? 0);
+        cursors.current[pageNum] = data.next_cursor ?? null;
+        if (data.total != null) setTotal(data.total);
       })
       .catch(() => {
         setDeployments([]);
@@ -474,7 +478,7 @@ function DeploymentsSection() {
             <Button
               variant="outline"
               size="sm"
-              disabled={page >= Math.ceil(total / DEPLOYMENTS_PAGE_SIZE)}
+              disabled={!cursors.current[page]}
               onClick={() =>
                 setPage((p) =>
                   Math.min(Math.ceil(total / DEPLOYMENTS_PAGE_SIZE), p + 1)
@@ -819,10 +823,84 @@ function LogsSection({ plan, realtime }: { plan: string; realtime?: boolean }) {
     refresh();
   }, [refresh]);
 
+  // Live updates from /ws/jobs; falls back to polling every 5s while the socket is down
+  const [live, setLive] = useState(false);
+  const jobsRef = useRef(jobs);
+  jobsRef.current = jobs;
   useEffect(() => {
     if (!realtime) return;
-    const id = setInterval(refresh, 5000);
-    return () => clearInterval(id);
+    let socket: WebSocket | null = null;
+    let retry: ReturnType<typeof setTimeout> | undefined;
+    let pendingRefresh: ReturnType<typeof setTimeout> | undefined;
+    let closed = false;
+    const refreshSoon = () => {
+      // At most one reload per 2s however many events arrive for jobs not on the page
+      if (pendingRefresh) return;
+      pendingRefresh = setTimeout(() => {
+        pendingRefresh = undefined;
+        refresh();
+      }, 2000);
+    };
+    const poll = setInterval(() => {
+      if (socket?.readyState !== WebSocket.OPEN) refresh();
+    }, 5000);
+
+    const connect = async () => {
+      const res = await fetch("/api/ws-ticket", { method: "POST" }).catch(() => null);
+      const data = res?.ok ? await res.json() : null;
+      if (closed || !data?.ticket) {
+        if (!closed) retry = setTimeout(connect, 30000);
+        return;
+      }
+      const apiUrl = process.env.NEXT_PUBLIC_API_URL || "http://localhost:8000";
+      socket = new WebSocket(`${apiUrl.replace(/^http/, "ws")}/ws/jobs?ticket=${encodeURIComponent(data.ticket)}`);
+      socket.onopen = () => {
+        setLive(true);
+        refresh(); // Catch up on anything missed while disconnected
+      };
+      socket.onmessage = (msg) => {
+        const event = JSON.parse(msg.data);
+        if (!jobsRef.current.some((j) => j.id === event.job_id)) {
+          if (event.status === "queued") {
+            // New job: add it to the top of the page from the event itself
+            setJobs((prev) => [
+              {
+                id: event.job_id,
+                deployment_id: event.deployment_id,
+                status: event.status,
+                tokens_used: event.tokens_used,
+                compute_seconds: event.compute_seconds,
+                created_at: event.at,
+              },
+              ...prev.filter((j) => j.id !== event.job_id),
+            ].slice(0, Math.max(prev.length, 20)));
+          } else {
+            refreshSoon(); // Queued event missed (or a job off this page): reload, debounced
+          }
+          return;
+        }
+        setJobs((prev) =>
+          prev.map((j) =>
+            j.id === event.job_id
+              ? { ...j, status: event.status, tokens_used: event.tokens_used, compute_seconds: event.compute_seconds }
+              : j
+          )
+        );
+      };
+      socket.onclose = () => {
+        setLive(false);
+        if (!closed) retry = setTimeout(connect, 5000);
+      };
+    };
+    connect();
+
+    return () => {
+      closed = true;
+      clearInterval(poll);
+      clearTimeout(retry);
+      clearTimeout(pendingRefresh);
+      socket?.close();
+    };
   }, [realtime, refresh]);
 
   if (loading) {
@@ -832,7 +910,7 @@ function LogsSection({ plan, realtime }: { plan: string; realtime?: boolean }) {
   return (
     <div className="space-y-3">
       {realtime && (
-        <p className="text-xs text-slate-500">Auto-refreshing every 5s</p>
+        <p className="text-xs text-slate-500">{live ? "Live" : "Auto-refreshing every 5s"}</p>
       )}
       {plan === "free" && (
         <p className="text-xs text-slate-500">
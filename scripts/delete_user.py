@@ -1,8 +1,10 @@
 #!/usr/bin/env python3
 """
-Delete a user and all related data (api_keys, deployments, jobs, usage_records).
+Delete a user and all related data (api_keys, deployments, jobs, batches, usage_records, usage_rollups),
+plus their batches' files in MinIO.
 Usage: python scripts/delete_user.py <email>
 Env: POSTGRES_HOST, POSTGRES_USER, POSTGRES_PASSWORD, POSTGRES_DB (or use .env)
+     MINIO_ENDPOINT, MINIO_ACCESS_KEY, MINIO_SECRET_KEY, MINIO_SECURE, MINIO_PAYLOAD_BUCKET
 
 For prod via port-forward: POSTGRES_HOST=localhost + kubectl port-forward svc/postgres 5432:5432 -n quantlix
 """
@@ -29,6 +31,24 @@ def _get_sync_url() -> str:
     return f"postgresql+psycopg2://{user}:{password}@{host}:{port}/{db}"
 
 
+def _delete_batch_files(batch_ids: list[str]) -> None:
+    """Remove batches/{id}/ (input, output and pod exchange parts) from the payload bucket."""
+    from minio import Minio
+    from minio.deleteobjects import DeleteObject
+
+    client = Minio(
+        os.environ.get("MINIO_ENDPOINT", "localhost:9000"),
+        access_key=os.environ.get("MINIO_ACCESS_KEY", "minioadmin"),
+        secret_key=os.environ.get("MINIO_SECRET_KEY", "minioadmin"),
+        secure=os.environ.get("MINIO_SECURE", "false").lower() == "true",
+    )
+    bucket = os.environ.get("MINIO_PAYLOAD_BUCKET", "payloads")
+    for batch_id in batch_ids:
+        objects = client.list_objects(bucket, prefix=f"batches/{batch_id}/", recursive=True)
+        for error in client.remove_objects(bucket, [DeleteObject(o.object_name) for o in objects]):
+            print(f"Could not delete {error.object_name}: {error.message}")
+
+
 def delete_user(email: str) -> bool:
     engine = create_engine(_get_sync_url(), echo=False)
     Session = sessionmaker(bind=engine, autocommit=False, autoflush=False)
@@ -42,14 +62,29 @@ def delete_user(email: str) -> bool:
         user_id = row[0]
         print(f"Deleting user {email} (id={user_id})...")
 
+        batch_ids = [
+            str(r[0]) for r in session.execute(text("SELECT id FROM batches WHERE user_id = :uid"), {"uid": user_id})
+        ]
+
         # Delete in order (respect FK constraints)
+        session.execute(text("DELETE FROM usage_rollups WHERE user_id = :uid"), {"uid": user_id})
         session.execute(text("DELETE FROM usage_records WHERE user_id = :uid"), {"uid": user_id})
         session.execute(text("DELETE FROM jobs WHERE user_id = :uid"), {"uid": user_id})
+        session.execute(
+            text("DELETE FROM job_outbox WHERE job_id IN (SELECT id FROM batches WHERE user_id = :uid)"),
+            {"uid": user_id},
+        )
+        session.execute(text("DELETE FROM batches WHERE user_id = :uid"), {"uid": user_id})
         session.execute(text("DELETE FROM deployments WHERE user_id = :uid"), {"uid": user_id})
         session.execute(text("DELETE FROM api_keys WHERE user_id = :uid"), {"uid": user_id})
         session.execute(text("DELETE FROM users WHERE id = :uid"), {"uid": user_id})
 
         session.commit()
+        if batch_ids:
+            try:
+                _delete_batch_files(batch_ids)
+            except Exception as e:
+                print(f"Could not delete batch files from MinIO: {e}")
         print("User deleted.")
         return True
 
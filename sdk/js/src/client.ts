@@ -1,6 +1,7 @@
 import type {
   APIKeyInfo,
   AuthResult,
+  CancelResult,
   CreateAPIKeyResult,
   DeployResult,
   RunResult,
@@ -242,6 +243,19 @@ export class QuantlixCloudClient {
     return res.json();
   }
 
+  /** Cancel a queued or running job. Throws if it already finished (409). */
+  async cancel(jobId: string): Promise<CancelResult> {
+    const res = await fetch(`${this.baseUrl}/jobs/${jobId}/cancel`, {
+      method: "POST",
+      headers: this.headers(),
+    });
+    if (!res.ok) {
+      const err = await res.json().catch(() => ({ detail: res.statusText }));
+      throw new Error(err.detail ?? `Cancel failed: ${res.status}`);
+    }
+    return res.json();
+  }
+
   /** Get usage stats for the authenticated user. */
   async usage(options?: {
     startDate?: string;
@@ -2,6 +2,7 @@ export { QuantlixCloudClient, DEFAULT_BASE_URL } from "./client";
 export type {
   APIKeyInfo,
   AuthResult,
+  CancelResult,
   CreateAPIKeyResult,
   DeployResult,
   RunResult,
@@ -25,6 +25,14 @@ export interface StatusResult {
   compute_seconds: number | null;
 }
 
+/** Result of cancel() */
+export interface CancelResult {
+  job_id: string;
+  status: string;
+  message: string;
+  compute_seconds: number | null; // Billed for a running job up to cancellation
+}
+
 /** Result of usage() */
 export interface UsageResult {
   user_id: string;
@@ -2,6 +2,8 @@
 
 from sdk.quantlix.client import (
     AuthResult,
+    BatchResult,
+    CancelResult,
     DEFAULT_BASE_URL,
     DeployResult,
     QuantlixCloudClient,
@@ -9,13 +11,18 @@ from sdk.quantlix.client import (
     StatusResult,
     UsageResult,
 )
+from sdk.quantlix.webhooks import WebhookVerificationError, verify_webhook
 
 __all__ = [
     "AuthResult",
+    "BatchResult",
+    "CancelResult",
     "DEFAULT_BASE_URL",
     "DeployResult",
     "QuantlixCloudClient",
     "RunResult",
     "StatusResult",
     "UsageResult",
+    "WebhookVerificationError",
+    "verify_webhook",
 ]
@@ -1,6 +1,11 @@
 """
 Quantlix Python SDK — Thin wrapper around Quantlix REST API.
 """
+import json
+import random
+import time
+import uuid
+from collections.abc import Iterable
 from dataclasses import dataclass
 from datetime import date
 from typing import Any
@@ -8,6 +13,11 @@ from typing import Any
 import httpx
 
 DEFAULT_BASE_URL = "https://api.quantlix.ai"
+DEFAULT_MAX_RETRIES = 3  # Retries after 429 (rate or in-flight limit) and, for run/deploy, transient errors
+MAX_BACKOFF_SECONDS = 60.0
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+# Safe to retry only with an Idempotency-Key: 409 = first attempt still in progress
+IDEMPOTENT_RETRY_STATUSES = frozenset({409, 502, 503, 504})
 
 
 @dataclass
@@ -23,6 +33,32 @@ class RunResult:
     job_id: str
     status: str
     message: str
+    cached: bool = False  # Completed from the deployment's result cache (status is already "completed")
+
+
+@dataclass
+class CancelResult:
+    job_id: str
+    status: str
+    message: str
+    compute_seconds: float | None = None  # Billed for a running job up to cancellation
+
+
+@dataclass
+class BatchResult:
+    id: str
+    deployment_id: str
+    status: str
+    total_lines: int
+    processed_lines: int
+    succeeded_lines: int
+    failed_lines: int
+    tokens_used: int
+    compute_seconds: float
+    gpu_seconds: float
+    error_message: str | None = None
+    created_at: str | None = None
+    completed_at: str | None = None
 
 
 @dataclass
@@ -36,6 +72,7 @@ class StatusResult:
     output_data: dict | None
     tokens_used: int | None
     compute_seconds: float | None
+    rollout: dict | None = None  # Deployments: {phase, started_at, completed_at, timings}
 
 
 @dataclass
@@ -79,16 +116,83 @@ class CreateAPIKeyResult:
     name: str | None
 
 
+def _backoff_seconds(response: httpx.Response | None, attempt: int) -> float:
+    """Wait before retrying: Retry-After, else RateLimit-Reset, else exponential; plus jitter."""
+    headers = response.headers if response is not None else {}
+    for header in ("Retry-After", "RateLimit-Reset"):
+        try:
+            wait = float(headers[header])
+            break
+        except (KeyError, ValueError):
+            continue
+    else:
+        wait = 2.0**attempt
+    return min(wait, MAX_BACKOFF_SECONDS) + random.uniform(0, 0.5)
+
+
+def _batch_result(data: dict[str, Any]) -> BatchResult:
+    return BatchResult(
+        id=data["id"],
+        deployment_id=data["deployment_id"],
+        status=data["status"],
+        total_lines=data["total_lines"],
+        processed_lines=data["processed_lines"],
+        succeeded_lines=data["succeeded_lines"],
+        failed_lines=data["failed_lines"],
+        tokens_used=data["tokens_used"],
+        compute_seconds=data["compute_seconds"],
+        gpu_seconds=data["gpu_seconds"],
+        error_message=data.get("error_message"),
+        created_at=data.get("created_at"),
+        completed_at=data.get("completed_at"),
+    )
+
+
 class QuantlixCloudClient:
     """Client for Quantlix API."""
 
-    def __init__(self, api_key: str, base_url: str = DEFAULT_BASE_URL):
+    def __init__(
+        self,
+        api_key: str,
+        base_url: str = DEFAULT_BASE_URL,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+    ):
         self.api_key = api_key
         self.base_url = base_url.rstrip("/")
+        self.max_retries = max_retries
 
     def _headers(self) -> dict[str, str]:
         return {"Content-Type": "application/json", "X-API-Key": self.api_key}
 
+    def _request(
+        self, method: str, path: str, idempotency_key: str | None = None, **kwargs: Any
+    ) -> httpx.Response:
+        """
+        Authenticated request. On 429, sleeps as the server asks and retries (max_retries).
+        With an idempotency_key, timeouts, connection errors, 409 and 502-504 are retried too:
+        every attempt carries the same key, so the server runs the request at most once.
+        """
+        headers = self._headers()
+        headers.update(kwargs.pop("headers", {}))
+        if idempotency_key:
+            headers[IDEMPOTENCY_HEADER] = idempotency_key
+        for attempt in range(self.max_retries + 1):
+            try:
+                with httpx.Client() as client:
+                    r = client.request(method, f"{self.base_url}{path}", headers=headers, **kwargs)
+            except httpx.TransportError:
+                if not idempotency_key or attempt == self.max_retries:
+                    raise
+                time.sleep(_backoff_seconds(None, attempt))
+                continue
+            retryable = r.status_code == 429 or (
+                idempotency_key is not None and r.status_code in IDEMPOTENT_RETRY_STATUSES
+            )
+            if not retryable or attempt == self.max_retries:
+                return r
+            time.sleep(_backoff_seconds(r, attempt))
+        return r
+
     @staticmethod
     def signup(email: str, password: str, base_url: str = DEFAULT_BASE_URL) -> SignupResult:
         """Create account. Sends verification email; use verify_email() after clicking the link."""
@@ -167,8 +271,12 @@ class QuantlixCloudClient:
         model_path: str | None = None,
         config: dict[str, Any] | None = None,
         deployment_id: str | None = None,
+        idempotency_key: str | None = None,
     ) -> DeployResult:
-        """Deploy a model. Pass deployment_id to update existing (creates new revision)."""
+        """
+        Deploy a model. Pass deployment_id to update existing (creates new revision).
+        An idempotency key is generated per call unless given, so retries never deploy twice.
+        """
         payload: dict[str, Any] = {
             "model_id": model_id,
             "model_path": model_path,
@@ -176,144 +284,187 @@ class QuantlixCloudClient:
         }
         if deployment_id:
             payload["deployment_id"] = deployment_id
-        with httpx.Client() as client:
-            r = client.post(
-                f"{self.base_url}/deploy",
-                headers=self._headers(),
-                json=payload,
-            )
-            r.raise_for_status()
-            data = r.json()
-            return DeployResult(
-                deployment_id=data["deployment_id"],
-                status=data["status"],
-                message=data.get("message", ""),
-                revision=data.get("revision"),
-            )
-
-    def run(self, deployment_id: str, input_data: dict | list | Any) -> RunResult:
-        """Run inference on a deployed model."""
-        with httpx.Client() as client:
-            r = client.post(
-                f"{self.base_url}/run",
-                headers=self._headers(),
-                json={"deployment_id": deployment_id, "input": input_data},
-            )
-            r.raise_for_status()
-            data = r.json()
-            return RunResult(
-                job_id=data["job_id"],
-                status=data["status"],
-                message=data.get("message", ""),
-            )
+        r = self._request(
+            "POST",
+            "/deploy",
+            idempotency_key=idempotency_key or str(uuid.uuid4()),
+            json=payload,
+        )
+        r.raise_for_status()
+        data = r.json()
+        return DeployResult(
+            deployment_id=data["deployment_id"],
+            status=data["status"],
+            message=data.get("message", ""),
+            revision=data.get("revision"),
+        )
+
+    def run(
+        self,
+        deployment_id: str,
+        input_data: dict | list | Any,
+        idempotency_key: str | None = None,
+        timeout_seconds: int | None = None,
+        webhook_url: str | None = None,
+    ) -> RunResult:
+        """
+        Run inference on a deployed model.
+        An idempotency key is generated per call unless given, so retries never create a second job.
+        With timeout_seconds the job fails instead of starting after that long, and inference is
+        cut off when the budget runs out. webhook_url receives the final status (see verify_webhook).
+        """
+        body: dict[str, Any] = {"deployment_id": deployment_id, "input": input_data}
+        if timeout_seconds is not None:
+            body["timeout_seconds"] = timeout_seconds
+        if webhook_url:
+            body["webhook_url"] = webhook_url
+        r = self._request(
+            "POST",
+            "/run",
+            idempotency_key=idempotency_key or str(uuid.uuid4()),
+            json=body,
+        )
+        r.raise_for_status()
+        data = r.json()
+        return RunResult(
+            job_id=data["job_id"],
+            status=data["status"],
+            message=data.get("message", ""),
+            cached=data.get("cached", False),
+        )
 
     def status(self, resource_id: str) -> StatusResult:
         """Get status of a deployment or job."""
-        with httpx.Client() as client:
-            r = client.get(
-                f"{self.base_url}/status/{resource_id}",
-                headers=self._headers(),
-            )
-            r.raise_for_status()
-            data = r.json()
-            return StatusResult(
-                id=data["id"],
-                type=data["type"],
-                status=data["status"],
-                created_at=data.get("created_at"),
-                updated_at=data.get("updated_at"),
-                error_message=data.get("error_message"),
-                output_data=data.get("output_data"),
-                tokens_used=data.get("tokens_used"),
-                compute_seconds=data.get("compute_seconds"),
-            )
+        r = self._request("GET", f"/status/{resource_id}")
+        r.raise_for_status()
+        data = r.json()
+        return StatusResult(
+            id=data["id"],
+            type=data["type"],
+            status=data["status"],
+            created_at=data.get("created_at"),
+            updated_at=data.get("updated_at"),
+            error_message=data.get("error_message"),
+            output_data=data.get("output_data"),
+            tokens_used=data.get("tokens_used"),
+            compute_seconds=data.get("compute_seconds"),
+            rollout=data.get("rollout"),
+        )
+
+    def cancel(self, job_id: str) -> CancelResult:
+        """Cancel a queued or running job. Raises HTTPStatusError (409) if it already finished."""
+        r = self._request("POST", f"/jobs/{job_id}/cancel")
+        r.raise_for_status()
+        data = r.json()
+        return CancelResult(
+            job_id=data["job_id"],
+            status=data["status"],
+            message=data.get("message", ""),
+            compute_seconds=data.get("compute_seconds"),
+        )
+
+    def submit_batch(self, deployment_id: str, lines: Iterable[dict] | bytes) -> BatchResult:
+        """
+        Submit a batch: one {"input": ..., "custom_id": "..."} per line, or the bytes of a JSONL file.
+        Lines run in large chunks at low priority; poll batch_status() and fetch batch_output().
+        """
+        content = lines if isinstance(lines, bytes) else "".join(json.dumps(line) + "\n" for line in lines).encode()
+        r = self._request(
+            "POST",
+            "/batches",
+            params={"deployment_id": deployment_id},
+            content=content,
+            headers={"Content-Type": "application/x-ndjson"},
+            timeout=300.0,
+        )
+        r.raise_for_status()
+        return _batch_result(r.json())
+
+    def batch_status(self, batch_id: str) -> BatchResult:
+        """Get a batch's status and progress counters."""
+        r = self._request("GET", f"/batches/{batch_id}")
+        r.raise_for_status()
+        return _batch_result(r.json())
+
+    def batch_output(self, batch_id: str) -> list[dict[str, Any]]:
+        """Output lines written so far, in input order: {line, custom_id, output, tokens_used} or {line, custom_id, error}."""
+        r = self._request("GET", f"/batches/{batch_id}/output", timeout=300.0)
+        r.raise_for_status()
+        return [json.loads(line) for line in r.text.splitlines() if line]
+
+    def cancel_batch(self, batch_id: str) -> BatchResult:
+        """Cancel a queued or running batch. Raises HTTPStatusError (409) if it already finished."""
+        r = self._request("POST", f"/batches/{batch_id}/cancel")
+        r.raise_for_status()
+        return _batch_result(r.json())
 
     def list_deployments(self, limit: int = 50) -> list[dict[str, Any]]:
         """List deployments with revision counts."""
-        with httpx.Client() as client:
-            r = client.get(
-                f"{self.base_url}/deployments",
-                headers=self._headers(),
-                params={"limit": limit},
-            )
-            r.raise_for_status()
-            return r.json().get("deployments", [])
+        r = self._request(
+            "GET",
+            "/deployments",
+            params={"limit": limit},
+        )
+        r.raise_for_status()
+        return r.json().get("deployments", [])
 
     def list_revisions(self, deployment_id: str) -> list[dict[str, Any]]:
         """List revisions for a deployment."""
-        with httpx.Client() as client:
-            r = client.get(
-                f"{self.base_url}/deployments/{deployment_id}/revisions",
-                headers=self._headers(),
-            )
-            r.raise_for_status()
-            return r.json().get("revisions", [])
+        r = self._request("GET", f"/deployments/{deployment_id}/revisions")
+        r.raise_for_status()
+        return r.json().get("revisions", [])
 
     def rollback(self, deployment_id: str, revision: int) -> dict[str, Any]:
         """Rollback deployment to a previous revision."""
-        with httpx.Client() as client:
-            r = client.post(
-                f"{self.base_url}/deployments/{deployment_id}/rollback",
-                headers=self._headers(),
-                params={"revision": revision},
-            )
-            r.raise_for_status()
-            return r.json()
+        r = self._request(
+            "POST",
+            f"/deployments/{deployment_id}/rollback",
+            params={"revision": revision},
+        )
+        r.raise_for_status()
+        return r.json()
 
     def list_api_keys(self) -> list[APIKeyInfo]:
         """List API keys for the current user."""
-        with httpx.Client() as client:
-            r = client.get(
-                f"{self.base_url}/auth/api-keys",
-                headers=self._headers(),
-            )
-            r.raise_for_status()
-            data = r.json()
-            return [
-                APIKeyInfo(id=k["id"], name=k.get("name"), created_at=k["created_at"])
-                for k in data["api_keys"]
-            ]
+        r = self._request("GET", "/auth/api-keys")
+        r.raise_for_status()
+        data = r.json()
+        return [
+            APIKeyInfo(id=k["id"], name=k.get("name"), created_at=k["created_at"])
+            for k in data["api_keys"]
+        ]
 
     def create_api_key(self, name: str | None = None) -> CreateAPIKeyResult:
         """Create a new API key. The key is shown only once."""
-        with httpx.Client() as client:
-            r = client.post(
-                f"{self.base_url}/auth/api-keys",
-                headers=self._headers(),
-                json={"name": name} if name else {},
-            )
-            r.raise_for_status()
-            data = r.json()
-            return CreateAPIKeyResult(
-                api_key=data["api_key"],
-                id=data["id"],
-                name=data.get("name"),
-            )
+        r = self._request(
+            "POST",
+            "/auth/api-keys",
+            json={"name": name} if name else {},
+        )
+        r.raise_for_status()
+        data = r.json()
+        return CreateAPIKeyResult(
+            api_key=data["api_key"],
+            id=data["id"],
+            name=data.get("name"),
+        )
 
     def revoke_api_key(self, key_id: str) -> dict:
         """Revoke an API key."""
-        with httpx.Client() as client:
-            r = client.delete(
-                f"{self.base_url}/auth/api-keys/{key_id}",
-                headers=self._headers(),
-            )
-            r.raise_for_status()
-            return r.json()
+        r = self._request("DELETE", f"/auth/api-keys/{key_id}")
+        r.raise_for_status()
+        return r.json()
 
     def rotate_api_key(self) -> CreateAPIKeyResult:
         """Create a new API key and revoke the current one. Returns the new key."""
-        with httpx.Client() as client:
-            r = client.post(
-                f"{self.base_url}/auth/api-keys/rotate",
-                headers=self._headers(),
-            )
-            r.raise_for_status()
-            data = r.json()
-            return CreateAPIKeyResult(
-                api_key=data["api_key"],
-                id=data["id"],
-                name=data.get("name"),
-            )
+        r = self._request("POST", "/auth/api-keys/rotate")
+        r.raise_for_status()
+        data = r.json()
+        return CreateAPIKeyResult(
+            api_key=data["api_key"],
+            id=data["id"],
+            name=data.get("name"),
+        )
 
     def usage(
         self,
@@ -326,24 +477,23 @@ class QuantlixCloudClient:
             params["start_date"] = start_date.isoformat()
         if end_date:
             params["end_date"] = end_date.isoformat()
-        with httpx.Client() as client:
-            r = client.get(
-                f"{self.base_url}/usage",
-                headers=self._headers(),
-                params=params if params else None,
-            )
-            r.raise_for_status()
-            data = r.json()
-            return UsageResult(
-                user_id=data["user_id"],
-                tokens_used=data["tokens_used"],
-                compute_seconds=data["compute_seconds"],
-                gpu_seconds=data.get("gpu_seconds", 0),
-                job_count=data["job_count"],
-                start_date=date.fromisoformat(data["start_date"]) if data.get("start_date") else None,
-                end_date=date.fromisoformat(data["end_date"]) if data.get("end_date") else None,
-                tokens_limit=data.get("tokens_limit"),
-                compute_limit=data.get("compute_limit"),
-                gpu_limit=data.get("gpu_limit"),
-                gpu_seconds_overage=data.get("gpu_seconds_overage"),
-            )
+        r = self._request(
+            "GET",
+            "/usage",
+            params=params if params else None,
+        )
+        r.raise_for_status()
+        data = r.json()
+        return UsageResult(
+            user_id=data["user_id"],
+            tokens_used=data["tokens_used"],
+            compute_seconds=data["compute_seconds"],
+            gpu_seconds=data.get("gpu_seconds", 0),
+            job_count=data["job_count"],
+            start_date=date.fromisoformat(data["start_date"]) if data.get("start_date") else None,
+            end_date=date.fromisoformat(data["end_date"]) if data.get("end_date") else None,
+            tokens_limit=data.get("tokens_limit"),
+            compute_limit=data.get("compute_limit"),
+            gpu_limit=data.get("gpu_limit"),
+            gpu_seconds_overage=data.get("gpu_seconds_overage"),
+        )
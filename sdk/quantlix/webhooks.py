@@ -0,0 +1,44 @@
+"""
+Verify Quantlix completion webhooks.
+Deployments with a webhook_secret sign every POST:
+Quantlix-Signature: t=<unix time>,v1=<hex HMAC-SHA256 of "<t>.<raw body>">
+"""
+import hashlib
+import hmac
+import json
+import time
+from typing import Any
+
+SIGNATURE_HEADER = "Quantlix-Signature"
+DEFAULT_TOLERANCE_SECONDS = 300
+
+
+class WebhookVerificationError(ValueError):
+    """Signature missing, malformed, wrong, or too old."""
+
+
+def verify_webhook(
+    body: bytes,
+    signature: str | None,
+    secret: str,
+    tolerance_seconds: int = DEFAULT_TOLERANCE_SECONDS,
+) -> dict[str, Any]:
+    """
+    Check a webhook's Quantlix-Signature header against the raw request body and return the
+    parsed body: one job status, or {"jobs": [...]} for deployments with webhook_batch_size > 1.
+    Signatures older than tolerance_seconds are rejected (replay protection).
+    """
+    if not signature:
+        raise WebhookVerificationError(f"Missing {SIGNATURE_HEADER} header")
+    parts = dict(item.split("=", 1) for item in signature.split(",") if "=" in item)
+    try:
+        timestamp = int(parts["t"])
+        received = parts["v1"]
+    except (KeyError, ValueError):
+        raise WebhookVerificationError(f"Malformed {SIGNATURE_HEADER} header") from None
+    if abs(time.time() - timestamp) > tolerance_seconds:
+        raise WebhookVerificationError("Signature timestamp outside tolerance")
+    expected = hmac.new(secret.encode(), f"{timestamp}.".encode() + body, hashlib.sha256).hexdigest()
+    if not hmac.compare_digest(expected, received):
+        raise WebhookVerificationError("Signature mismatch")
+    return json.loads(body)